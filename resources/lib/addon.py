@@ -46,6 +46,20 @@ def show_catalog():
     Catalog().show_catalog()
 
 
+@routing.route('/catalog/new')
+def show_catalog_new():
+    """ Show the recently added videos of the catalog """
+    from resources.lib.modules.catalog import Catalog
+    Catalog().show_new()
+
+
+@routing.route('/catalog/expiring')
+def show_catalog_expiring():
+    """ Show the videos of the catalog that expire soon """
+    from resources.lib.modules.catalog import Catalog
+    Catalog().show_expiring()
+
+
 @routing.route('/catalog/<uuid>')
 def show_catalog_program(uuid):
     """ Show a program from the catalog """
@@ -160,6 +174,14 @@ def iptv_epg():
     from resources.lib.modules.iptvmanager import IPTVManager
     IPTVManager(int(routing.args['port'][0])).send_epg()  # pylint: disable=too-many-function-args
 
+
+@routing.route('/iptv/xmltv')
+def iptv_xmltv():
+    """ Export the EPG as an XMLTV file in the profile folder for other PVR backends """
+    from resources.lib.modules.xmltv import Xmltv
+    Xmltv().export()
+
+
 @routing.route('/cache/clear')
 def clear_cache():
     """ Clear the cache """
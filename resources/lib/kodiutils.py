@@ -5,6 +5,7 @@ import logging
 import os
 import re
 
+from functools import lru_cache
 from html import unescape
 from urllib.parse import quote, urlencode
 
@@ -29,20 +30,9 @@ DEFAULT_SORT_METHODS = [
     'unsorted', 'title'
 ]
 
-HTML_MAPPING = [
-    (re.compile(r'<(/?)i(|\s[^>]+)>', re.I), '[\\1I]'),
-    (re.compile(r'<(/?)b(|\s[^>]+)>', re.I), '[\\1B]'),
-    (re.compile(r'<em(|\s[^>]+)>', re.I), '[I]'),
-    (re.compile(r'</em>', re.I), '[/I]'),
-    (re.compile(r'<(strong|h\d)>', re.I), '[B]'),
-    (re.compile(r'</(strong|h\d)>', re.I), '[/B]'),
-    (re.compile(r'<li>', re.I), '- '),
-    (re.compile(r'</?(li|ul|ol)(|\s[^>]+)>', re.I), '\n'),
-    (re.compile(r'</?(code|div|p|pre|span)(|\s[^>]+)>', re.I), ''),
-    (re.compile(r'<br />', re.I), '\n'),  # Remove newlines
-    (re.compile('(&nbsp;\n){2,}', re.I), '\n'),  # Remove repeating non-blocking spaced newlines
-    (re.compile('  +', re.I), ' '),  # Remove double spaces
-]
+HTML_TAG = re.compile(r'<(/?)([a-z][a-z0-9]*)(\s[^<>]+)?>', re.I)
+HTML_WHITESPACE = re.compile(r'(?:&nbsp;\n){2,}|  +', re.I)  # Repeating non-blocking spaced newlines, or double spaces
+HTML_MEMO_SIZE = 4096
 
 STREAM_HLS = 'hls'
 STREAM_DASH = 'mpd'
@@ -53,6 +43,8 @@ _LOGGER = logging.getLogger(__name__)
 class TitleItem:
     """ This helper object holds all information to be used with Kodi xbmc's ListItem object """
 
+    __slots__ = ('title', 'path', 'art_dict', 'info_dict', 'prop_dict', 'stream_dict', 'context_menu', 'subtitles_path', 'is_playable', 'visible')
+
     def __init__(self, title, path=None, art_dict=None, info_dict=None, prop_dict=None, stream_dict=None,
                  context_menu=None, subtitles_path=None, is_playable=False, visible=True):
         """ The constructor for the TitleItem class
@@ -79,7 +71,7 @@ class TitleItem:
         self.visible = visible
 
     def __repr__(self):
-        return "%r" % self.__dict__
+        return "%r" % {key: getattr(self, key) for key in self.__slots__}
 
 
 class SafeDict(dict):
@@ -109,11 +101,38 @@ def html_to_kodi(text):
     """Convert HTML content into Kodi formatted text"""
     if not text:
         return text
-    for key, val in HTML_MAPPING:
-        text = key.sub(val, text)
+    return _html_to_kodi(text)
+
+
+@lru_cache(maxsize=HTML_MEMO_SIZE)
+def _html_to_kodi(text):
+    """Convert HTML content into Kodi formatted text. Descriptions repeat a lot over lanes and playlists, so we memoize the result."""
+    text = HTML_TAG.sub(_html_tag_to_kodi, text)
+    text = HTML_WHITESPACE.sub(lambda match: '\n' if match.group(0)[0] == '&' else ' ', text)
     return unescape(text).strip()
 
 
+def _html_tag_to_kodi(match):  # pylint: disable=too-many-return-statements
+    """Translate a single HTML tag into Kodi formatting"""
+    closing, name, attributes = match.groups()
+    name = name.lower()
+    if name in ('i', 'b'):
+        return '[%s%s]' % (closing, name.upper())
+    if name == 'em' and not (closing and attributes):
+        return '[/I]' if closing else '[I]'
+    if (name == 'strong' or (len(name) == 2 and name[0] == 'h' and name[1].isdigit())) and not attributes:
+        return '[/B]' if closing else '[B]'
+    if name == 'li' and not closing and not attributes:
+        return '- '
+    if name in ('li', 'ul', 'ol'):
+        return '\n'
+    if name in ('code', 'div', 'p', 'pre', 'span'):
+        return ''
+    if name == 'br' and not closing and attributes == ' /':
+        return '\n'
+    return match.group(0)
+
+
 def addon_icon():
     """Cache and return add-on icon"""
     return get_addon_info('icon')
@@ -703,6 +722,20 @@ def jsonrpc(*args, **kwargs):
     return loads(xbmc.executeJSONRPC(dumps(kwargs)))
 
 
+def notify(sender, message, data=None):
+    """Send a notification to Kodi using JSON RPC"""
+    result = jsonrpc(method='JSONRPC.NotifyAll', params={
+        'sender': sender,
+        'message': message,
+        'data': data,
+    })
+    if result.get('result') != 'OK':
+        _LOGGER.error('Failed to send notification: %s', result.get('error').get('message'))
+        return False
+    _LOGGER.debug('Succesfully sent notification')
+    return True
+
+
 def listdir(path):
     """Return all files in a directory (using xbmcvfs)"""
     return xbmcvfs.listdir(path)
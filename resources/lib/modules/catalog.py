@@ -2,11 +2,12 @@
 """ Catalog module """
 
 import logging
+import time
 from urllib.parse import unquote_plus
 
 from resources.lib import kodiutils
-from resources.lib.play.auth import AuthApi
-from resources.lib.play.content import CACHE_PREVENT, ContentApi, UnavailableException
+from resources.lib.play import registry
+from resources.lib.play.content import CACHE_PREVENT, Episode, UnavailableException
 from resources.lib.modules.menu import Menu
 
 _LOGGER = logging.getLogger(__name__)
@@ -15,12 +16,14 @@ _LOGGER = logging.getLogger(__name__)
 class Catalog:
     """ Menu code related to the catalog """
 
+    NEW_PERIOD = 48 * 3600  # Videos that were published in the last 48 hours
+    EXPIRING_PERIOD = 7 * 24 * 3600  # Videos that expire in the next week
+
     def __init__(self):
         """ Initialise object """
         if not kodiutils.has_credentials():
             kodiutils.open_settings()
-        self._auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path())
-        self._api = ContentApi(self._auth, cache_path=kodiutils.get_cache_path())
+        self._api = registry.get_content_api()
 
     def show_catalog(self):
         """ Show all the programs of all channels """
@@ -54,6 +57,37 @@ class Catalog:
         # Used for A-Z listing or when movies and episodes are mixed.
         kodiutils.show_listing(listing, 30003, content='tvshows', sort='title')
 
+    def show_new(self):
+        """ Show the videos that were recently added to the catalog """
+        now = int(time.time())
+        items = self._api.get_catalog_store().aired_between(now - self.NEW_PERIOD, now + 1)
+
+        listing = [self._generate_catalog_titleitem(item) for item in items]
+
+        # Sorted from new to old
+        kodiutils.show_listing(listing, 30015, content='tvshows', sort=['unsorted', 'date'])
+
+    def show_expiring(self):
+        """ Show the videos of the catalog that expire soon """
+        now = int(time.time())
+        items = self._api.get_catalog_store().expiring_between(now, now + self.EXPIRING_PERIOD)
+
+        listing = [self._generate_catalog_titleitem(item) for item in items]
+
+        # Sorted by expiry date
+        kodiutils.show_listing(listing, 30017, content='tvshows', sort=['unsorted', 'date'])
+
+    @staticmethod
+    def _generate_catalog_titleitem(item):
+        """ Generate a TitleItem for a video or a program, prefixing videos with their program title.
+        :type item: Union[Episode, Program]
+        :rtype TitleItem
+        """
+        title_item = Menu.generate_titleitem(item)
+        if isinstance(item, Episode) and item.program_title:
+            title_item.title = title_item.info_dict['title'] = item.program_title + ' - ' + title_item.title
+        return title_item
+
     def show_program(self, uuid):
         """ Show a program from the catalog
         :type program_id: str
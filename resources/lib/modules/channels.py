@@ -2,11 +2,14 @@
 """ Channels module """
 
 import logging
+from datetime import datetime, timedelta
+
+import dateutil.tz
 
 from resources.lib import kodiutils
-from resources.lib.play import STREAM_DICT
-from resources.lib.play.auth import AuthApi
-from resources.lib.play.content import ContentApi
+from resources.lib.play import STREAM_DICT, registry
+from resources.lib.play.content import CACHE_ONLY
+from resources.lib.play.epg import EpgApi
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -18,8 +21,8 @@ class Channels:
         """ Initialise object """
         if not kodiutils.has_credentials():
             kodiutils.open_settings()
-        self._auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path())
-        self._api = ContentApi(self._auth, cache_path=kodiutils.get_cache_path())
+        self._api = registry.get_content_api()
+        self._epg = EpgApi(cache_path=kodiutils.get_cache_path())
 
     def show_channels(self):
         """ Shows TV channels """
@@ -30,8 +33,14 @@ class Channels:
             raise
 
         listing = []
+        now = datetime.now().replace(tzinfo=dateutil.tz.gettz('CET'))
+        outdated = False
 
         for channel in items:
+            # Show what's on from the stored guide, we don't want to wait for the network here
+            current, upcoming = self._epg.get_now_next(channel.title, now, cache=CACHE_ONLY)
+            if not outdated and self._epg.is_expired(channel.title, now.strftime('%Y-%m-%d')):
+                outdated = True
 
             listing.append(
                 kodiutils.TitleItem(
@@ -43,7 +52,7 @@ class Channels:
                         'fanart': channel.fanart,
                     },
                     info_dict={
-                        'plot': None,
+                        'plot': self._format_now_next(current, upcoming, now),
                         'playcount': 0,
                         'mediatype': 'video',
                     },
@@ -53,12 +62,32 @@ class Channels:
 
         kodiutils.show_listing(listing, 30007)
 
+        # Ask the background service to refresh the guide when the stored guide of today has expired
+        if outdated and kodiutils.get_setting_bool('epg_refresh'):
+            kodiutils.notify(kodiutils.addon_id(), 'refresh_epg')
+
+    @staticmethod
+    def _format_now_next(current, upcoming, now):
+        """ Format the current and next broadcast of a channel
+        :type current: resources.lib.play.epg.EpgProgram
+        :type upcoming: resources.lib.play.epg.EpgProgram
+        :type now: datetime
+        :rtype str
+        """
+        lines = []
+        if current:
+            lines.append(kodiutils.localize(30057, time=current.start.strftime('%H:%M'), title=current.program_title,
+                                            progress=int((now - current.start) / timedelta(seconds=current.duration) * 100)))
+        if upcoming:
+            lines.append(kodiutils.localize(30058, time=upcoming.start.strftime('%H:%M'), title=upcoming.program_title))
+        return '\n'.join(lines) or None
+
     def show_channel_menu(self, uuid):
         """ Shows a TV channel
         :type uuid: str
         """
         try:
-            items = self._api.get_live_channels()
+            items = self._api.get_live_channels(lazy=True)
         except Exception as ex:
             kodiutils.notification(message=str(ex))
             raise
@@ -1,16 +1,24 @@
 # -*- coding: utf-8 -*-
 """Implementation of IPTVManager class"""
 
+import json
 import logging
+import time
+from concurrent import futures as concurrent_futures
 from datetime import datetime, timedelta
+from types import GeneratorType
 
 from resources.lib import kodiutils
-from resources.lib.play.auth import AuthApi
-from resources.lib.play.content import ContentApi
+from resources.lib.play import registry
 from resources.lib.play.epg import EpgApi
 
 _LOGGER = logging.getLogger(__name__)
 
+EPG_DAYS = range(-3, 7)  # The days of the guide we send, relative to today
+EPG_WORKERS = 8  # The number of guide pages that we fetch in parallel
+EPG_TASK_TIMEOUT = 20  # The time in seconds that we allow for a single guide page
+SOCKET_BUFFER_SIZE = 65536  # The number of characters that we collect before we send them to IPTV Manager
+
 
 class IPTVManager:
     """Interface to IPTV Manager"""
@@ -18,20 +26,27 @@ class IPTVManager:
     def __init__(self, port):
         """Initialize IPTV Manager object"""
         self.port = port
-        auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path())
-        self._api = ContentApi(auth, cache_path=kodiutils.get_cache_path())
+        self._api = registry.get_content_api()
 
     def via_socket(func):  # pylint: disable=no-self-argument
         """Send the output of the wrapped function to socket"""
 
         def send(self):
             """Decorator to send over a socket"""
-            import json
             import socket
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.connect(('127.0.0.1', self.port))
             try:
-                sock.sendall(json.dumps(func(self)).encode())  # pylint: disable=not-callable
+                buffer = []
+                size = 0
+                for chunk in iter_json(func(self)):  # pylint: disable=not-callable
+                    buffer.append(chunk)
+                    size += len(chunk)
+                    if size >= SOCKET_BUFFER_SIZE:
+                        sock.sendall(''.join(buffer).encode())
+                        buffer = []
+                        size = 0
+                sock.sendall(''.join(buffer).encode())
             finally:
                 sock.close()
 
@@ -41,7 +56,7 @@ class IPTVManager:
     def send_channels(self):  # pylint: disable=no-method-argument
         """Return JSON-STREAMS formatted information to IPTV Manager"""
         streams = []
-        channels = self._api.get_live_channels()
+        channels = self._api.get_live_channels(lazy=True)
         for channel in channels:
             if channel.uuid:
                 streams.append({
@@ -57,37 +72,84 @@ class IPTVManager:
     @via_socket
     def send_epg(self):  # pylint: disable=no-method-argument
         """Return JSON-EPG formatted information to IPTV Manager"""
-        epg_api = EpgApi()
-
-        today = datetime.today()
+        return {'version': 1, 'epg': self._iter_epg()}
 
-        results = {}
-        channels = self._api.get_live_channels()
-        for channel in channels:
-            uuid = channel.uuid
+    def _iter_epg(self):
+        """Fetch the guide of every channel and day in parallel, and yield the programs of each channel as soon as all its days are in. A day
+        that fails, or that doesn't come in before its deadline, is left out."""
+        started = time.time()
+        epg_api = EpgApi(cache_path=kodiutils.get_cache_path(), timeout=EPG_TASK_TIMEOUT)
 
-            if channel.uuid:
-                results[uuid] = []
-
-                for i in range(-3, 7):
-                    date = today + timedelta(days=i)
-                    epg = epg_api.get_epg(channel.title.lower().split()[-1], date.strftime('%Y-%m-%d'))
-
-                    results[uuid].extend([
-                        {
-                            'start': program.start.isoformat(),
-                            'stop': (program.start + timedelta(seconds=program.duration)).isoformat(),
-                            'title': program.program_title,
-                            'subtitle': program.episode_title,
-                            'description': program.description or program.program_description,
-                            'episode': 'S%sE%s' % (program.season, program.number) if program.season and program.number else None,
-                            'genre': program.genre,
-                            'genre_id': program.genre_id,
-                            'image': program.thumb,
-                            'stream': kodiutils.url_for('play_catalog',
-                                                        uuid=program.video_url) if program.video_url else None
-                        }
-                        for program in epg if program.duration
-                    ])
-
-        return {'version': 1, 'epg': results}
+        today = datetime.today()
+        dates = [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in EPG_DAYS]
+        channels = {channel.uuid: channel for channel in self._api.get_live_channels() if channel.uuid}
+
+        executor = concurrent_futures.ThreadPoolExecutor(max_workers=EPG_WORKERS)
+        futures = {
+            uuid: [executor.submit(epg_api.get_epg, channel.title.lower().split()[-1], date) for date in dates]
+            for uuid, channel in channels.items()
+        }
+        fetched = 0
+        try:
+            for position, (uuid, days) in enumerate(futures.items()):
+                epg = {}
+                for offset, (date, future) in enumerate(zip(dates, days)):
+                    # The workers take the tasks in order, so a task is due when all tasks before it have used their time as well
+                    deadline = started + EPG_TASK_TIMEOUT * ((position * len(dates) + offset) // EPG_WORKERS + 1)
+                    try:
+                        epg[date] = future.result(timeout=max(0, deadline - time.time()))
+                        fetched += 1
+                    except concurrent_futures.TimeoutError:
+                        _LOGGER.warning('Fetching the guide of %s on %s took too long', uuid, date)
+                        future.cancel()
+                    except Exception as exc:  # pylint: disable=broad-exception-caught
+                        _LOGGER.warning('Could not fetch the guide of %s on %s: %s', uuid, date, exc)
+                yield uuid, self._format_epg(epg, dates)
+        finally:
+            for days in futures.values():
+                for future in days:
+                    future.cancel()
+            executor.shutdown(wait=False)
+
+        _LOGGER.info('Collected the guide of %d/%d channel days in %.2f seconds', fetched, len(channels) * len(dates), time.time() - started)
+
+    @staticmethod
+    def _format_epg(days, dates):
+        """Return the programs of the days of a channel in JSON-EPG format"""
+        return [
+            {
+                'start': program.start.isoformat(),
+                'stop': (program.start + timedelta(seconds=program.duration)).isoformat(),
+                'title': program.program_title,
+                'subtitle': program.episode_title,
+                'description': program.description or program.program_description,
+                'episode': 'S%sE%s' % (program.season, program.number) if program.season and program.number else None,
+                'genre': program.genre,
+                'genre_id': program.genre_id,
+                'image': program.thumb,
+                'stream': kodiutils.url_for('play_catalog',
+                                            uuid=program.video_url) if program.video_url else None
+            }
+            for date in dates for program in days.get(date) or [] if program.duration
+        ]
+
+
+def iter_json(value):
+    """Encode a value as JSON in chunks. A generator is encoded as an object, and is consumed pair by pair, so a large object doesn't need to
+    be built in memory first.
+    :rtype Iterator[str]
+    """
+    if isinstance(value, dict):
+        value = iter(value.items())
+    elif not isinstance(value, GeneratorType):
+        yield json.dumps(value)
+        return
+
+    yield '{'
+    for idx, (key, item) in enumerate(value):
+        # Like json.dumps, a key that is not a string is encoded as the string of its JSON value
+        if not isinstance(key, str):
+            key = json.dumps(key)
+        yield '%s%s:' % (',' if idx else '', json.dumps(key))
+        yield from iter_json(item)
+    yield '}'
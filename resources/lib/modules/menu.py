@@ -66,6 +66,28 @@ class Menu:
                     'plot': kodiutils.localize(30006)
                 }
             ),
+            TitleItem(
+                title=kodiutils.localize(30015),  # New
+                path=kodiutils.url_for('show_catalog_new'),
+                art_dict={
+                    'icon': 'DefaultRecentlyAddedEpisodes.png',
+                    'fanart': kodiutils.get_addon_info('fanart')
+                },
+                info_dict={
+                    'plot': kodiutils.localize(30016)
+                }
+            ),
+            TitleItem(
+                title=kodiutils.localize(30017),  # Expiring soon
+                path=kodiutils.url_for('show_catalog_expiring'),
+                art_dict={
+                    'icon': 'DefaultYear.png',
+                    'fanart': kodiutils.get_addon_info('fanart')
+                },
+                info_dict={
+                    'plot': kodiutils.localize(30018)
+                }
+            ),
             TitleItem(
                 title=kodiutils.localize(30011),  # My List
                 path=kodiutils.url_for('show_mylist'),
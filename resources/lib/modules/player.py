@@ -4,9 +4,8 @@
 import logging
 
 from resources.lib import kodiutils
-from resources.lib.play.auth import AuthApi
+from resources.lib.play import registry
 from resources.lib.play.aws.cognito_idp import AuthenticationException, InvalidLoginException
-from resources.lib.play.content import ContentApi
 from resources.lib.play.exceptions import ApiException, GeoblockedException, UnavailableException
 from resources.lib.drm import MissingModuleException
 
@@ -18,8 +17,7 @@ class Player:
 
     def __init__(self):
         """ Initialise object """
-        auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path())
-        self._api = ContentApi(auth, cache_path=kodiutils.get_cache_path())
+        self._api = registry.get_content_api()
 
         # Workaround for Raspberry Pi 3 and older
         kodiutils.set_global_setting('videoplayer.useomxplayer', True)
@@ -59,9 +57,10 @@ class Player:
         :type content_type: str
         """
         if self.check_credentials():
-            # Fetch an auth token now
             try:
-                auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path())
+                # Get stream information
+                resolved_stream = self._api.get_stream(uuid, content_type)
+                return resolved_stream
 
             except (InvalidLoginException, AuthenticationException) as ex:
                 _LOGGER.exception(ex)
@@ -69,11 +68,6 @@ class Player:
                 kodiutils.end_of_directory()
                 return None
 
-            try:
-                # Get stream information
-                resolved_stream = ContentApi(auth).get_stream(uuid, content_type)
-                return resolved_stream
-
             except GeoblockedException as ex:
                 kodiutils.ok_dialog(message=kodiutils.localize(30710, error=str(ex)))  # This video is geo-blocked...
                 kodiutils.end_of_directory()
@@ -4,8 +4,7 @@
 import logging
 
 from resources.lib import kodiutils
-from resources.lib.play.auth import AuthApi
-from resources.lib.play.content import ContentApi
+from resources.lib.play import registry
 from resources.lib.modules.menu import Menu
 
 _LOGGER = logging.getLogger(__name__)
@@ -18,8 +17,7 @@ class Search:
         """ Initialise object """
         if not kodiutils.has_credentials():
             kodiutils.open_settings()
-        self._auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path())
-        self._api = ContentApi(self._auth, cache_path=kodiutils.get_cache_path())
+        self._api = registry.get_content_api()
 
     def show_search(self, query=None):
         """ Shows the search dialog
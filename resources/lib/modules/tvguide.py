@@ -10,7 +10,7 @@ from resources.lib import kodiutils
 from resources.lib.kodiutils import TitleItem
 from resources.lib.play import STREAM_DICT
 from resources.lib.play.content import UnavailableException
-from resources.lib.play.epg import EpgApi
+from resources.lib.play.epg import EPG_WINDOW, EpgApi
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -20,7 +20,7 @@ class TvGuide:
 
     def __init__(self):
         """ Initialise object """
-        self._epg = EpgApi()
+        self._epg = EpgApi(cache_path=kodiutils.get_cache_path())
 
     @staticmethod
     def get_dates(date_format):
@@ -31,7 +31,7 @@ class TvGuide:
         today = datetime.today()
 
         # The API provides 7 days in the past and 8 days in the future
-        for i in range(-7, 8):
+        for i in EPG_WINDOW:
             day = today + timedelta(days=i)
 
             if i == -1:
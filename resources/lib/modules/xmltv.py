@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+""" XMLTV export of the tv guide """
+
+import gzip
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+from resources.lib import kodiutils
+from resources.lib.play import registry
+from resources.lib.play.epg import EPG_WINDOW, EpgApi
+from resources.lib.play.exceptions import UnavailableException
+from resources.lib.play.xmltv import XmltvWriter, render_programmes
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Xmltv:
+    """ XMLTV export of the tv guide, for PVR backends that don't use IPTV Manager """
+
+    FILENAME = 'xmltv.xml.gz'
+
+    def __init__(self):
+        """ Initialise object """
+        self._api = registry.get_content_api()
+        self._epg = EpgApi(cache_path=kodiutils.get_cache_path())
+
+    def export(self):
+        """ Write the guide of all live channels to a gzipped XMLTV file in the profile folder. The programmes of a channel and day are only
+        rendered again when the guide of that day has changed.
+
+        The path is fixed, since anyone who can call the plugin could otherwise overwrite any file that Kodi can write.
+        """
+        started = time.time()
+        path = os.path.join(kodiutils.addon_profile(), self.FILENAME)
+
+        today = datetime.today()
+        dates = [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in EPG_WINDOW]
+        channels = [channel for channel in self._api.get_live_channels(lazy=True) if channel.uuid]
+
+        # Write to a temporary file first, so a reader never sees a partial guide
+        tmp_path = path + '.tmp'
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as fdesc, XmltvWriter(fdesc) as writer:
+                for channel in channels:
+                    writer.write_channel(channel.uuid, channel.title, channel.logo)
+                for channel in channels:
+                    for date in dates:
+                        try:
+                            fragment = self._epg.get_fragment(channel.title, date, 'xmltv', partial(render_programmes, channel.uuid))
+                        except UnavailableException as exc:
+                            # Leave out the days that we don't have
+                            _LOGGER.warning(exc)
+                            continue
+                        if fragment:
+                            writer.write(fragment)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        _LOGGER.info('Exported the guide of %d channels to %s in %.2f seconds', len(channels), path, time.time() - started)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 """ Play API """
 
+from sys import intern
+
 STREAM_DICT = {
     'codec': 'h264',
     'height': 544,
@@ -8,9 +10,37 @@ STREAM_DICT = {
 }
 
 
-class ResolvedStream:
+def intern_string(value):
+    """ Intern a string that is repeated a lot, like a channel, brand or category name.
+    :type value: str
+    :rtype str
+    """
+    if isinstance(value, str):
+        return intern(value)
+    return value
+
+
+class SlottedObject:
+    """ Base class for the data model objects. They use __slots__ since we keep a lot of them around. """
+
+    __slots__ = ()
+
+    def _fields(self):
+        """ Return all the slots of this object, including the ones of the parent classes. """
+        for cls in reversed(type(self).__mro__):
+            for field in cls.__dict__.get('__slots__', ()):
+                if not field.startswith('_'):
+                    yield field
+
+    def __repr__(self):
+        return "%r" % {field: getattr(self, field, None) for field in self._fields()}
+
+
+class ResolvedStream(SlottedObject):
     """ Defines a stream that we can play"""
 
+    __slots__ = ('uuid', 'url', 'stream_type', 'license_url', 'license_headers', 'license_keys', 'subtitles')
+
     def __init__(self, uuid=None, url=None, stream_type=None, license_url=None, license_headers=None, license_keys=None, subtitles=None):
         """
         :type uuid: str
@@ -28,6 +58,3 @@ class ResolvedStream:
         self.license_headers = license_headers
         self.license_keys = license_keys
         self.subtitles = subtitles
-
-    def __repr__(self):
-        return "%r" % self.__dict__
@@ -1,15 +1,20 @@
 # -*- coding: utf-8 -*-
 """ AUTH API """
 
+import base64
+import binascii
 import json
 import logging
 import os
+import threading
 import time
+from contextlib import contextmanager
 
 from resources.lib import kodiutils
 from resources.lib.play.aws.cognito_identity import CognitoIdentity
 from resources.lib.play.aws.cognito_idp import AuthenticationException, CognitoIdp, InvalidLoginException
 from resources.lib.play.aws.cognito_sync import CognitoSync
+from resources.lib.play import tokenserver
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -22,76 +27,254 @@ class AuthApi:
     COGNITO_IDENTITY_POOL_ID = 'eu-west-1:8b7eb22c-cf61-43d5-a624-04b494867234'
 
     TOKEN_FILE = 'auth-tokens.json'
+    LOCK_FILE = 'auth-tokens.lock'
+    IDENTITY_FILE = 'auth-identity.json'
+    LOCK_TIMEOUT = 30  # A lock that was not touched for this number of seconds is stale, its owner is gone
+    LOCK_WAIT = 60  # Give up when we can't get the lock within this number of seconds
+    CREDENTIALS_MARGIN = 60  # Get new credentials when the current ones expire within this number of seconds
 
-    def __init__(self, username, password, token_path):
-        """ Initialise object """
+    def __init__(self, username, password, token_path, token_server=False):
+        """ Initialise object
+        :param bool token_server:   Ask the token server of the background service for a token before using the token file.
+        """
         self._username = username
         self._password = password
         self._token_path = token_path
+        self._token_server = token_server
         self._id_token = None
         self._expiry = 0
         self._refresh_token = None
+        self._identity_id = None
+        self._credentials = None
+        self._lock = threading.RLock()
 
         # Load tokens from cache
+        if not token_server:
+            self._load_tokens()
+
+    @property
+    def username(self):
+        """ The user these tokens belong to.
+        :rtype str
+        """
+        return self._username
+
+    @property
+    def expiry(self):
+        """ The time when the id token expires.
+        :rtype int
+        """
+        return self._expiry
+
+    def _load_tokens(self):
+        """ Load the tokens from the cache """
         try:
             with open(os.path.join(self._token_path, self.TOKEN_FILE), 'r', encoding='utf-8') as fdesc:
                 data_json = json.loads(fdesc.read())
-                self._id_token = data_json.get('id_token')
+                # The service doesn't store every id token it refreshes, so keep ours when it remains valid for longer
+                if int(data_json.get('expiry', 0)) >= self._expiry:
+                    self._id_token = data_json.get('id_token')
+                    self._expiry = int(data_json.get('expiry', 0))
                 self._refresh_token = data_json.get('refresh_token')
-                self._expiry = int(data_json.get('expiry', 0))
         except (IOError, TypeError, ValueError):
             _LOGGER.warning('We could not use the cache since it is invalid or non-existent.')
 
-    def get_token(self):
-        """ Get a valid token """
+    def get_token(self, margin=0):
+        """ Get a valid token
+        :param int margin:  The number of seconds that the token should at least remain valid.
+        :rtype str
+        """
         now = int(time.time())
 
-        if self._id_token and self._expiry > now:
+        id_token = self.get_cached_token(margin)
+        if id_token:
             # We have a valid id token in memory, use it
             _LOGGER.debug('Got an id token from memory')
-            return self._id_token
+            return id_token
 
-        if self._refresh_token:
-            # We have a valid refresh token, use that to refresh our id token
-            # The refresh token is valid for 30 days. If this refresh fails, we just continue by logging in again.
-            _LOGGER.debug('Getting an id token by refreshing')
-            try:
-                self._id_token = self._refresh(self._refresh_token)
-                self._expiry = now + 3600
-            except (InvalidLoginException, AuthenticationException) as exc:
-                _LOGGER.error('Error logging in: %s', str(exc))
-                self._id_token = None
-                self._refresh_token = None
-                self._expiry = 0
-                # We continue by logging in with username and password
-
-        if not self._id_token:
-            # We have no tokens, or they are all invalid, do a login
-            _LOGGER.debug('Getting an id token by logging in')
-            id_token, refresh_token = self._authenticate(self._username, self._password)
-            _LOGGER.debug(id_token)
-            _LOGGER.debug(refresh_token)
-            self._id_token = id_token
-            self._refresh_token = refresh_token
-            self._expiry = now + 3600
-
-        # Store new tokens in cache
+        if self._token_server:
+            # The background service keeps the tokens in memory
+            reply = tokenserver.fetch_token(self._username, margin)
+            if reply and reply[1] > now + margin:
+                _LOGGER.debug('Got an id token from the token server')
+                with self._lock:
+                    self._id_token, self._expiry = reply
+                return reply[0]
+
+        # Only one thread of one process refreshes the tokens, the others wait for it and use the result
+        with self._lock, self._lock_tokens():
+            # Another process could have refreshed the tokens in the meantime
+            self._load_tokens()
+            if self._id_token and self._expiry > now + margin:
+                _LOGGER.debug('Got an id token from the cache')
+                return self._id_token
+
+            refresh_token = self._refresh_token
+            if self._refresh_token:
+                # We have a valid refresh token, use that to refresh our id token
+                # The refresh token is valid for 30 days. If this refresh fails, we just continue by logging in again.
+                _LOGGER.debug('Getting an id token by refreshing')
+                try:
+                    self._id_token = self._refresh(self._refresh_token)
+                    self._expiry = self._get_expiry(self._id_token)
+                except (InvalidLoginException, AuthenticationException) as exc:
+                    _LOGGER.error('Error logging in: %s', str(exc))
+                    self._id_token = None
+                    self._refresh_token = None
+                    self._expiry = 0
+                    # We continue by logging in with username and password
+
+            if not self._id_token or self._expiry <= now:
+                # We have no tokens, or they are all invalid, do a login
+                _LOGGER.debug('Getting an id token by logging in')
+                id_token, refresh_token = self._authenticate(self._username, self._password)
+                _LOGGER.debug(id_token)
+                _LOGGER.debug(refresh_token)
+                self._id_token = id_token
+                self._refresh_token = refresh_token
+                self._expiry = self._get_expiry(self._id_token)
+
+            # The service hands out its id token from memory, so it only needs to store the tokens when it logged in again
+            if not tokenserver.is_serving() or self._refresh_token != refresh_token:
+                self._store_tokens()
+
+        return self._id_token
+
+    def get_cached_token(self, margin=0):
+        """ Get the id token we have in memory, without going to the network.
+        :param int margin:  The number of seconds that the token should at least remain valid.
+        :returns:           The id token, or None when we have no token that remains valid long enough.
+        :rtype str
+        """
+        id_token, expiry = self._id_token, self._expiry
+        if id_token and expiry > int(time.time()) + margin:
+            return id_token
+        return None
+
+    def _store_tokens(self):
+        """ Store the tokens in the cache. """
+        self._write_file(self.TOKEN_FILE, {
+            'id_token': self._id_token,
+            'refresh_token': self._refresh_token,
+            'expiry': self._expiry
+        })
+
+    def _write_file(self, filename, data):
+        """ Write data as JSON to a file in the token path. We write to a temporary file first, so other processes never read a partial file.
+        :type filename: str
+        :type data: dict
+        """
         if not os.path.exists(self._token_path):
             os.makedirs(self._token_path)
-        with open(os.path.join(self._token_path, self.TOKEN_FILE), 'w', encoding='utf-8') as fdesc:
-            data = json.dumps({
-                'id_token': self._id_token,
-                'refresh_token': self._refresh_token,
-                'expiry': self._expiry
-            })
-            fdesc.write(kodiutils.from_unicode(data))
+        fullpath = os.path.join(self._token_path, filename)
+        with open('%s.%d.tmp' % (fullpath, os.getpid()), 'w', encoding='utf-8') as fdesc:
+            fdesc.write(kodiutils.from_unicode(json.dumps(data)))
+        os.replace('%s.%d.tmp' % (fullpath, os.getpid()), fullpath)
 
-        return self._id_token
+    @contextmanager
+    def _lock_tokens(self):
+        """ Hold a lock on the tokens over all processes, using a lock file that contains a token of its owner. While we hold the lock, we
+        touch it every few seconds, so a lock that is older than LOCK_TIMEOUT is stale. We never continue without the lock.
+        :raises AuthenticationException: if we can't get the lock within LOCK_WAIT
+        """
+        if not os.path.exists(self._token_path):
+            os.makedirs(self._token_path)
+        lockpath = os.path.join(self._token_path, self.LOCK_FILE)
+        owner = '%d:%s' % (os.getpid(), binascii.hexlify(os.urandom(8)).decode('ascii'))
+
+        deadline = time.time() + self.LOCK_WAIT
+        while True:
+            try:
+                handle = os.open(lockpath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                self._remove_stale_lock(lockpath)
+                if time.time() > deadline:
+                    raise AuthenticationException('Could not get a lock on the tokens') from None
+                time.sleep(0.1)
+                continue
+            with os.fdopen(handle, 'w', encoding='utf-8') as fdesc:
+                fdesc.write(owner)
+            break
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._touch_lock, args=(lockpath, owner, stop), name='TokenLock', daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            heartbeat.join()
+            # Only remove our own lock
+            if self._read_lock(lockpath) == owner:
+                os.unlink(lockpath)
+            else:
+                _LOGGER.warning('Our lock on the tokens was taken over')
+
+    @staticmethod
+    def _read_lock(lockpath):
+        """ Return the owner of a lock, or None when there is no lock.
+        :type lockpath: str
+        :rtype str
+        """
+        try:
+            with open(lockpath, 'r', encoding='utf-8') as fdesc:
+                return fdesc.read()
+        except OSError:
+            return None
+
+    def _touch_lock(self, lockpath, owner, stop):
+        """ Keep the modification date of our lock recent until we are stopped.
+        :type lockpath: str
+        :type owner: str
+        :type stop: threading.Event
+        """
+        while not stop.wait(self.LOCK_TIMEOUT / 3):
+            if self._read_lock(lockpath) != owner:
+                return
+            try:
+                os.utime(lockpath)
+            except OSError:
+                return
+
+    def _remove_stale_lock(self, lockpath):
+        """ Remove a lock that was not touched for LOCK_TIMEOUT.
+        :type lockpath: str
+        """
+        owner = self._read_lock(lockpath)
+        try:
+            if owner is None or os.stat(lockpath).st_mtime >= time.time() - self.LOCK_TIMEOUT:
+                return
+            # Another process could have replaced the stale lock in the meantime
+            if self._read_lock(lockpath) == owner:
+                _LOGGER.warning('Removing a stale lock on the tokens')
+                os.unlink(lockpath)
+        except OSError:
+            # The lock was released in the meantime
+            pass
+
+    @staticmethod
+    def _get_expiry(id_token):
+        """ Read the expiry time from the exp claim in the payload of the id token (a JWT).
+        :type id_token: str
+        :rtype int
+        """
+        try:
+            payload = id_token.split('.')[1]
+            return int(json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))['exp'])
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as exc:
+            _LOGGER.warning('Could not read the expiry time of the id token: %s', exc)
+            return int(time.time()) + 3600
 
     def clear_tokens(self):
-        """ Remove the cached tokens. """
-        if os.path.exists(os.path.join(self._token_path, AuthApi.TOKEN_FILE)):
-            os.unlink(os.path.join(self._token_path, AuthApi.TOKEN_FILE))
+        """ Remove the cached tokens and identity. """
+        self._id_token = None
+        self._refresh_token = None
+        self._expiry = 0
+        self._identity_id = None
+        self._credentials = None
+        for filename in (AuthApi.TOKEN_FILE, AuthApi.IDENTITY_FILE):
+            if os.path.exists(os.path.join(self._token_path, filename)):
+                os.unlink(os.path.join(self._token_path, filename))
 
     @staticmethod
     def _authenticate(username, password):
@@ -105,12 +288,51 @@ class AuthApi:
         idp_client = CognitoIdp(AuthApi.COGNITO_POOL_ID, AuthApi.COGNITO_CLIENT_ID)
         return idp_client.renew_token(refresh_token)
 
+    def _get_identity(self):
+        """ Get the identity id and temporary AWS credentials of the user. The identity id never changes, so we keep it in a file, and in
+        memory once we have read it. The credentials are only kept in memory until they expire.
+        :rtype tuple[str, dict]
+        """
+        with self._lock:
+            if not self._identity_id:
+                self._identity_id = self._load_identity()
+
+            credentials = self._credentials
+            if self._identity_id and credentials and float(credentials.get('Expiration', 0)) > time.time() + self.CREDENTIALS_MARGIN:
+                _LOGGER.debug('Got the identity and the credentials from memory')
+                return self._identity_id, credentials
+
+            identity_client = CognitoIdentity(AuthApi.COGNITO_POOL_ID, AuthApi.COGNITO_IDENTITY_POOL_ID)
+            id_token = self.get_token()
+            if not self._identity_id:
+                self._identity_id = identity_client.get_id(id_token)
+                self._write_file(self.IDENTITY_FILE, {
+                    'username': self._username,
+                    'identity_id': self._identity_id,
+                })
+            self._credentials = identity_client.get_credentials_for_identity(id_token, self._identity_id)
+            return self._identity_id, self._credentials
+
+    def _load_identity(self):
+        """ Get the identity id of the user from the cache.
+        :rtype str
+        """
+        try:
+            with open(os.path.join(self._token_path, self.IDENTITY_FILE), 'r', encoding='utf-8') as fdesc:
+                data = json.loads(fdesc.read())
+        except (IOError, TypeError, ValueError):
+            return None
+
+        if 'credentials' in data:
+            # Don't leave the credentials that we used to keep in the file on disk
+            self._write_file(self.IDENTITY_FILE, {'username': data.get('username'), 'identity_id': data.get('identity_id')})
+
+        # The identity belongs to a user
+        return data.get('identity_id') if data.get('username') == self._username else None
+
     def get_dataset(self, dataset, key):
         """ Fetch the value from the specified dataset. """
-        identity_client = CognitoIdentity(AuthApi.COGNITO_POOL_ID, AuthApi.COGNITO_IDENTITY_POOL_ID)
-        id_token = self.get_token()
-        identity_id = identity_client.get_id(id_token)
-        credentials = identity_client.get_credentials_for_identity(id_token, identity_id)
+        identity_id, credentials = self._get_identity()
 
         sync_client = CognitoSync(AuthApi.COGNITO_IDENTITY_POOL_ID, identity_id, credentials)
         data, session_token, sync_count = sync_client.list_records(dataset, key)
@@ -128,4 +350,4 @@ class AuthApi:
     def put_dataset(dataset, key, value, sync_info):
         """ Store the value from the specified dataset. """
         sync_client = CognitoSync(AuthApi.COGNITO_IDENTITY_POOL_ID, sync_info.get('identity_id'), sync_info.get('credentials'))
-        sync_client.update_records(dataset, key, value, sync_info.get('session_token'), sync_info.get('sync_count'))
+        sync_client.patch_records(dataset, [(key, value, sync_info.get('sync_count'))], sync_info.get('session_token'))
@@ -12,6 +12,8 @@ import hmac
 import json
 import logging
 import os
+import threading
+from collections import deque
 
 import requests
 import six
@@ -27,6 +29,97 @@ class AuthenticationException(Exception):
     """ Something went wrong while logging in """
 
 
+# https://github.com/aws/amazon-cognito-identity-js/blob/master/src/AuthenticationHelper.js#L22
+N_HEX = 'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD1' + \
+        '29024E088A67CC74020BBEA63B139B22514A08798E3404DD' + \
+        'EF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245' + \
+        'E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED' + \
+        'EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3D' + \
+        'C2007CB8A163BF0598DA48361C55D39A69163FA8FD24CF5F' + \
+        '83655D23DCA3AD961C62F356208552BB9ED529077096966D' + \
+        '670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B' + \
+        'E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9' + \
+        'DE2BCBF6955817183995497CEA956AE515D2261898FA0510' + \
+        '15728E5A8AAAC42DAD33170D04507A33A85521ABDF1CBA64' + \
+        'ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7' + \
+        'ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6B' + \
+        'F12FFA06D98A0864D87602733EC86A64521F2B18177B200C' + \
+        'BBE117577A615D6C770988C0BAD946E208E24FA074E5AB31' + \
+        '43DB5BFCE0FD108E4B82D120A93AD2CAFFFFFFFFFFFFFFFF'
+
+# https://github.com/aws/amazon-cognito-identity-js/blob/master/src/AuthenticationHelper.js#L49
+G_HEX = '2'
+
+BIG_N = int(N_HEX, 16)
+G = int(G_HEX, 16)
+K = int(hashlib.sha256(bytearray.fromhex('00' + N_HEX + '0' + G_HEX)).hexdigest(), 16)
+
+
+def generate_srp_key():
+    """ Generate the random value a of the client, and calculate its public value A = g^a%N
+
+    :return The values a and A.
+    :rtype: tuple[int, int]
+    """
+    small_a = int(binascii.hexlify(os.urandom(128)), 16) % BIG_N
+    big_a = pow(G, small_a, BIG_N)
+    # safety check
+    if (big_a % BIG_N) == 0:
+        raise ValueError('Safety check for A failed')
+    return small_a, big_a
+
+
+class SrpKeyPool:
+    """ A pool of SRP keys of the client that were generated in advance, so a login only needs to do the calculations after the challenge.
+    The keys are only kept in memory, and every key is only used once.
+    """
+
+    def __init__(self, size):
+        """
+        :param int size:    The number of keys to keep ready.
+        """
+        self._size = size
+        self._keys = deque()
+        self._lock = threading.Condition()
+        self._filling = False
+
+    def fill(self):
+        """ Generate keys until the pool is full. Only one thread fills the pool at a time. """
+        with self._lock:
+            if self._filling:
+                return
+            self._filling = True
+        try:
+            while len(self._keys) < self._size:
+                key = generate_srp_key()
+                with self._lock:
+                    self._keys.append(key)
+                    self._lock.notify_all()
+        finally:
+            with self._lock:
+                self._filling = False
+                self._lock.notify_all()
+
+    def take(self):
+        """ Take a key from the pool, or None when it is empty. When the pool is being filled, we wait for the key that is being generated,
+        instead of generating another one next to it.
+
+        :rtype: tuple[int, int]
+        """
+        with self._lock:
+            while not self._keys and self._filling:
+                self._lock.wait()
+            if not self._keys:
+                return None
+            return self._keys.popleft()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+SRP_KEY_POOL = SrpKeyPool(2)
+
+
 class CognitoIdp:
     """ Cognito IDP """
 
@@ -49,37 +142,24 @@ class CognitoIdp:
         self.url = "https://cognito-idp.%s.amazonaws.com/" % (self.region,)
         self._session = requests.session()
 
-        # Initialize the values
-        # https://github.com/aws/amazon-cognito-identity-js/blob/master/src/AuthenticationHelper.js#L22
-        self.n_hex = 'FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD1' + \
-                     '29024E088A67CC74020BBEA63B139B22514A08798E3404DD' + \
-                     'EF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245' + \
-                     'E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED' + \
-                     'EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3D' + \
-                     'C2007CB8A163BF0598DA48361C55D39A69163FA8FD24CF5F' + \
-                     '83655D23DCA3AD961C62F356208552BB9ED529077096966D' + \
-                     '670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B' + \
-                     'E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9' + \
-                     'DE2BCBF6955817183995497CEA956AE515D2261898FA0510' + \
-                     '15728E5A8AAAC42DAD33170D04507A33A85521ABDF1CBA64' + \
-                     'ECFB850458DBEF0A8AEA71575D060C7DB3970F85A6E1E4C7' + \
-                     'ABF5AE8CDB0933D71E8C94E04A25619DCEE3D2261AD2EE6B' + \
-                     'F12FFA06D98A0864D87602733EC86A64521F2B18177B200C' + \
-                     'BBE117577A615D6C770988C0BAD946E208E24FA074E5AB31' + \
-                     '43DB5BFCE0FD108E4B82D120A93AD2CAFFFFFFFFFFFFFFFF'
-
-        # https://github.com/aws/amazon-cognito-identity-js/blob/master/src/AuthenticationHelper.js#L49
-        self.g_hex = '2'
+        # The SRP constants are the same for every client
+        self.n_hex = N_HEX
+        self.g_hex = G_HEX
         self.info_bits = bytearray('Caldera Derived Key', 'utf-8')
 
-        self.big_n = self.__hex_to_long(self.n_hex)
-        self.g = self.__hex_to_long(self.g_hex)  # pylint: disable=invalid-name
-        self.k = self.__hex_to_long(self.__hex_hash('00' + self.n_hex + '0' + self.g_hex))  # pylint: disable=invalid-name
-        self.small_a_value = self.__generate_random_small_a()
-        self.large_a_value = self.__calculate_a()
+        self.big_n = BIG_N
+        self.g = G  # pylint: disable=invalid-name
+        self.k = K  # pylint: disable=invalid-name
+
+        # The SRP values of the client are only needed to authenticate, not to renew a token
+        self.small_a_value = None
+        self.large_a_value = None
 
     def authenticate(self, username, password):
         """ Authenticate with a username and password. """
+        if self.large_a_value is None:
+            self.small_a_value, self.large_a_value = SRP_KEY_POOL.take() or generate_srp_key()
+
         # Step 1: First initiate an authentication request
         auth_request = self.__get_authentication_request(username)
         auth_data = json.dumps(auth_request)
@@ -261,28 +341,6 @@ class CognitoIdp:
         u_hex_hash = self.__hex_hash(self.__pad_hex(big_a) + self.__pad_hex(big_b))
         return self.__hex_to_long(u_hex_hash)
 
-    def __generate_random_small_a(self):
-        """ Helper function to generate a random big integer
-
-        :return a random value.
-        :rtype: int
-        """
-        random_long_int = self.__get_random(128)
-        return random_long_int % self.big_n
-
-    def __calculate_a(self):
-        """ Calculate the client's public value A = g^a%N with the generated random number a
-
-        :return Computed large A.
-        :rtype: int
-        """
-
-        big_a = pow(self.g, self.small_a_value, self.big_n)
-        # safety check
-        if (big_a % self.big_n) == 0:
-            raise ValueError('Safety check for A failed')
-        return big_a
-
     @staticmethod
     def __long_to_hex(long_num):
         return '%x' % long_num
@@ -322,11 +380,6 @@ class CognitoIdp:
             hash_str = '00%s' % hash_str
         return hash_str
 
-    @staticmethod
-    def __get_random(nbytes):
-        random_hex = binascii.hexlify(os.urandom(nbytes))
-        return CognitoIdp.__hex_to_long(random_hex)
-
     @staticmethod
     def __get_current_timestamp():
         """ Creates a timestamp with the correct English format.
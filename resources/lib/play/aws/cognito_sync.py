@@ -3,11 +3,12 @@
 
 from __future__ import absolute_import, division, unicode_literals
 
-import datetime
 import hashlib
 import hmac
 import json
 import logging
+import time
+from functools import lru_cache
 
 import requests
 
@@ -21,6 +22,21 @@ except ImportError:  # Python 2
 _LOGGER = logging.getLogger(__name__)
 
 
+def sign(key, msg):
+    """ Sign this message. """
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+@lru_cache(maxsize=16)
+def get_signature_key(key, date_stamp, region_name, service_name):
+    """ Generate a signature key. The key only changes daily, so we keep it for the next requests. """
+    k_date = sign(('AWS4' + key).encode('utf-8'), date_stamp)
+    k_region = sign(k_date, region_name)
+    k_service = sign(k_region, service_name)
+    k_signing = sign(k_service, 'aws4_request')
+    return k_signing
+
+
 class CognitoSync:
     """ Amazon Cognito Sync """
 
@@ -50,25 +66,12 @@ class CognitoSync:
         :param str service:                             The service where this request is going to.
         """
 
-        def sign(key, msg):
-            """ Sign this message. """
-            return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
-
-        def get_signature_key(key, date_stamp, region_name, service_name):
-            """ Generate a signature key. """
-            k_date = sign(('AWS4' + key).encode('utf-8'), date_stamp)
-            k_region = sign(k_date, region_name)
-            k_service = sign(k_region, service_name)
-            k_signing = sign(k_service, 'aws4_request')
-            return k_signing
-
         # Parse the URL
         url_parsed = urlparse(request.url)
 
         # Create a date for headers and the credential string
-        now = datetime.datetime.utcnow()
-        amzdate = now.strftime('%Y%m%dT%H%M%SZ')
-        datestamp = now.strftime('%Y%m%d')  # Date w/o time, used in credential scope
+        amzdate = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        datestamp = amzdate[:8]  # Date w/o time, used in credential scope
 
         # Step 1. Create a canonical request
         canonical_uri = quote(url_parsed.path)
@@ -163,6 +166,15 @@ class CognitoSync:
         :param str session_token:      The session token from the list_records call.
         :param int sync_count:         The last SyncCount value, so we refuse race conditions.
         """
+        self.patch_records(dataset, [(key, value, sync_count)], session_token)
+
+    def patch_records(self, dataset, patches, session_token):
+        """ Update multiple records of this dataset in one request.
+
+        :param str dataset:                         The name of the dataset to request.
+        :param list[tuple[str,any,int]] patches:    The key, value and last SyncCount value of the records to update.
+        :param str session_token:                   The session token from the list_records call.
+        """
         # Prepare the request
         request = requests.Request(
             method='POST',
@@ -183,6 +195,7 @@ class CognitoSync:
                         "SyncCount": sync_count,
                         "Value": json.dumps(value),
                     }
+                    for key, value, sync_count in patches
                 ]
             }).prepare()
 
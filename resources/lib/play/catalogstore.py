@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+""" Columnar store of the catalog for date based views """
+
+import json
+import logging
+import os
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CatalogStore:
+    """ Columnar, array-backed store of the videos and programs in the catalog.
+
+    The aired and expiry dates are kept as arrays of epoch timestamps, together with index arrays that are sorted on those dates. Range queries
+    like "aired in the last 48 hours" or "expiring this week" are answered with a bisect on the sorted arrays.
+
+    The store can be saved to a file, so the next invocation doesn't need to fetch and sort the catalog again. A loaded store only builds the
+    data model objects of the items that a query returns. The lazy fields that were not decoded yet are saved as raw values, and are only
+    decoded when they are accessed after loading.
+    """
+
+    VERSION = 2
+    DATE_FIELDS = ('aired', 'expiry')
+
+    def __init__(self, items):
+        """
+        :type items: Iterable[Union[Episode, Program]]
+        """
+        self._items = list(items)
+        self._schemas = {}
+        aired = array('q', (self._epoch(item.aired) for item in self._items))
+        expiry = array('q', (self._epoch(item.expiry) for item in self._items))
+        self._aired_index, self._aired_sorted = self._build_index(aired)
+        self._expiry_index, self._expiry_sorted = self._build_index(expiry)
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def _epoch(value):
+        """ Convert a datetime to an epoch timestamp. Unknown dates become 0.
+        :type value: datetime
+        :rtype int
+        """
+        if not value:
+            return 0
+        return int(value.timestamp())
+
+    @staticmethod
+    def _build_index(column):
+        """ Build an index array that sorts the column, and the sorted column itself. Unknown dates are left out.
+        :type column: array
+        :rtype tuple[array, array]
+        """
+        index = array('l', sorted((idx for idx, value in enumerate(column) if value > 0), key=column.__getitem__))
+        return index, array('q', (column[idx] for idx in index))
+
+    @staticmethod
+    def _range(index, column, start, end):
+        """ Return the positions in the index of the items with a date in [start, end).
+        :rtype array
+        """
+        return index[bisect_left(column, start):bisect_left(column, end)]
+
+    def _item(self, idx):
+        """ Return an item, and build it first when it was loaded from a file.
+        :type idx: int
+        :rtype Union[Episode, Program]
+        """
+        item = self._items[idx]
+        if isinstance(item, list):
+            model, fields, raw = item
+            for name in self.DATE_FIELDS:
+                if fields.get(name) is not None:
+                    fields[name] = datetime.fromtimestamp(fields[name])
+            item = self._items[idx] = self._schemas[model].restore(fields, raw)
+        return item
+
+    def aired_between(self, start, end):
+        """ Return the items that aired in [start, end), newest first.
+        :type start: int
+        :type end: int
+        :rtype list[Union[Episode, Program]]
+        """
+        return [self._item(idx) for idx in reversed(self._range(self._aired_index, self._aired_sorted, start, end))]
+
+    def expiring_between(self, start, end):
+        """ Return the items that expire in [start, end), the first to expire first.
+        :type start: int
+        :type end: int
+        :rtype list[Union[Episode, Program]]
+        """
+        return [self._item(idx) for idx in self._range(self._expiry_index, self._expiry_sorted, start, end)]
+
+    def save(self, path, ttl, schemas):
+        """ Save the store to a file, that is valid for ttl seconds.
+        :param str path:                The path of the file.
+        :param int ttl:                 The number of seconds the file is valid.
+        :param list[Schema] schemas:    The schemas of the items, to build them again when the file is loaded.
+        """
+        items = []
+        for idx in range(len(self._items)):
+            item = self._item(idx)
+            # A lazy item is saved as the model it extends, with the raw values of the fields it didn't decode yet
+            model = next(schema.model.__name__ for schema in schemas if isinstance(item, schema.model))
+            raw = dict(getattr(item, '_raw', None) or {})
+            fields = {name: getattr(item, name) for name in item._fields() if name not in raw}  # pylint: disable=protected-access
+            for name in self.DATE_FIELDS:
+                fields[name] = self._epoch(fields.get(name)) if fields.get(name) else None
+            items.append([model, fields, raw])
+
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fdesc:
+                json.dump({
+                    'version': self.VERSION,
+                    'items': items,
+                    'aired': [list(self._aired_index), list(self._aired_sorted)],
+                    'expiry': [list(self._expiry_index), list(self._expiry_sorted)],
+                }, fdesc)
+            # Set TTL by modifying modification date
+            deadline = int(time.time()) + ttl
+            os.utime(tmp_path, (deadline, deadline))
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as exc:
+            _LOGGER.warning('Could not save the catalog store: %s', exc)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @classmethod
+    def load(cls, path, schemas):
+        """ Load a store that was saved to a file, or return None when there is no valid one.
+        :param str path:                The path of the file.
+        :param list[Schema] schemas:    The schemas of the items.
+        :rtype CatalogStore
+        """
+        try:
+            if os.stat(path).st_mtime < time.time():
+                return None
+            with open(path, 'r', encoding='utf-8') as fdesc:
+                data = json.load(fdesc)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != cls.VERSION:
+            return None
+
+        store = cls.__new__(cls)
+        store._items = data['items']
+        store._schemas = {schema.model.__name__: schema for schema in schemas}
+        store._aired_index, store._aired_sorted = array('l', data['aired'][0]), array('q', data['aired'][1])
+        store._expiry_index, store._expiry_sorted = array('l', data['expiry'][0]), array('q', data['expiry'][1])
+        return store
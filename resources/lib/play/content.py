@@ -5,12 +5,16 @@ import json
 import logging
 import os
 import re
+import threading
 import time
 from datetime import datetime
 
 from resources.lib import kodiutils
 from resources.lib.play import utils
-from resources.lib.play import ResolvedStream
+from resources.lib.play import ResolvedStream, SlottedObject, intern_string
+from resources.lib.play.catalogstore import CatalogStore
+from resources.lib.play.schema import Field, Schema
+from resources.lib.play.streamstore import StreamStore, parse_time
 from resources.lib.play.exceptions import NoContentException, UnavailableException
 from resources.lib.kodiutils import STREAM_DASH, STREAM_HLS, html_to_kodi
 from resources.lib.drm import get_license_keys, get_pssh_box
@@ -21,10 +25,15 @@ CACHE_AUTO = 1  # Allow to use the cache, and query the API if no cache is avail
 CACHE_ONLY = 2  # Only use the cache, don't use the API
 CACHE_PREVENT = 3  # Don't use the cache
 
+CATALOG_TTL = 60 * 60  # Rebuild the catalog store for the date based views every hour
 
-class Program:
+
+class Program(SlottedObject):
     """ Defines a Program. """
 
+    __slots__ = ('uuid', 'path', 'channel', 'category_id', 'category_name', 'title', 'description', 'aired', 'expiry', 'poster', 'thumb', 'fanart',
+                 'seasons', 'my_list')
+
     def __init__(self, uuid=None, path=None, channel=None, category_id=None, category_name=None, title=None, description=None, aired=None, expiry=None, poster=None, thumb=None, fanart=None, seasons=None,
                  my_list=False):
         """
@@ -45,9 +54,9 @@ class Program:
         """
         self.uuid = uuid
         self.path = path
-        self.channel = channel
-        self.category_id = category_id
-        self.category_name = category_name
+        self.channel = intern_string(channel)
+        self.category_id = intern_string(category_id)
+        self.category_name = intern_string(category_name)
         self.title = title
         self.description = description
         self.aired = aired
@@ -58,13 +67,12 @@ class Program:
         self.seasons = seasons
         self.my_list = my_list
 
-    def __repr__(self):
-        return "%r" % self.__dict__
-
 
-class Season:
+class Season(SlottedObject):
     """ Defines a Season. """
 
+    __slots__ = ('uuid', 'path', 'channel', 'title', 'description', 'number')
+
     def __init__(self, uuid=None, path=None, channel=None, title=None, description=None, number=None):
         """
         :type uuid: str
@@ -77,18 +85,18 @@ class Season:
         """
         self.uuid = uuid
         self.path = path
-        self.channel = channel
+        self.channel = intern_string(channel)
         self.title = title
         self.description = description
         self.number = number
 
-    def __repr__(self):
-        return "%r" % self.__dict__
-
 
-class Episode:
+class Episode(SlottedObject):
     """ Defines an Episode. """
 
+    __slots__ = ('uuid', 'nodeid', 'path', 'channel', 'program_title', 'title', 'description', 'thumb', 'duration', 'position', 'season', 'season_uuid',
+                 'number', 'rating', 'aired', 'expiry', 'stream', 'content_type')
+
     def __init__(self, uuid=None, nodeid=None, path=None, channel=None, program_title=None, title=None, description=None, thumb=None, duration=None,
                  position=None, season=None, season_uuid=None, number=None, rating=None, aired=None, expiry=None, stream=None, content_type=None):
         """
@@ -114,8 +122,8 @@ class Episode:
         self.uuid = uuid
         self.nodeid = nodeid
         self.path = path
-        self.channel = channel
-        self.program_title = program_title
+        self.channel = intern_string(channel)
+        self.program_title = intern_string(program_title)
         self.title = title
         self.description = description
         self.thumb = thumb
@@ -124,19 +132,18 @@ class Episode:
         self.season = season
         self.season_uuid = season_uuid
         self.number = number
-        self.rating = rating
+        self.rating = intern_string(rating)
         self.aired = aired
         self.expiry = expiry
         self.stream = stream
-        self.content_type = content_type
+        self.content_type = intern_string(content_type)
 
-    def __repr__(self):
-        return "%r" % self.__dict__
 
-
-class Category:
+class Category(SlottedObject):
     """ Defines a Category. """
 
+    __slots__ = ('uuid', 'channel', 'title', 'programs', 'episodes')
+
     def __init__(self, uuid=None, channel=None, title=None, programs=None, episodes=None):
         """
         :type uuid: str
@@ -145,19 +152,18 @@ class Category:
         :type programs: List[Program]
         :type episodes: List[Episode]
         """
-        self.uuid = uuid
-        self.channel = channel
-        self.title = title
+        self.uuid = intern_string(uuid)
+        self.channel = intern_string(channel)
+        self.title = intern_string(title)
         self.programs = programs
         self.episodes = episodes
 
-    def __repr__(self):
-        return "%r" % self.__dict__
-
 
-class Swimlane:
+class Swimlane(SlottedObject):
     """ Defines a Swimlane. """
 
+    __slots__ = ('index', 'title', 'lane_type')
+
     def __init__(self, index=None, title=None, lane_type=None):
         """
         :type index: int
@@ -166,15 +172,14 @@ class Swimlane:
         """
         self.index = index
         self.title = title
-        self.lane_type = lane_type
-
-    def __repr__(self):
-        return "%r" % self.__dict__
+        self.lane_type = intern_string(lane_type)
 
 
-class Channel:
+class Channel(SlottedObject):
     """ Defines a Channel. """
 
+    __slots__ = ('uuid', 'index', 'title', 'description', 'brand', 'logo', 'fanart')
+
     def __init__(self, uuid=None, index=None, title=None, description=None, brand=None, logo=None, fanart=None):
         """
         :type uuid: str
@@ -187,15 +192,167 @@ class Channel:
         """
         self.uuid = uuid
         self.index = index
-        self.title = title
+        self.title = intern_string(title)
         self.description = description
-        self.brand = brand
+        self.brand = intern_string(brand)
         self.logo = logo
         self.fanart = fanart
 
 
-    def __repr__(self):
-        return "%r" % self.__dict__
+_TRAILING_NUMBER = re.compile(r'\d+$')
+
+
+def _timestamp(value):
+    """ Convert a timestamp to a datetime. A missing timestamp results in the epoch.
+    :type value: int
+    :rtype datetime
+    """
+    return datetime.fromtimestamp(value or 0.0)
+
+
+def _optional_timestamp(value):
+    """ Convert a timestamp to a datetime, if there is one.
+    :type value: int
+    :rtype datetime
+    """
+    return datetime.fromtimestamp(value) if value else None
+
+
+def _trailing_number(title):
+    """ Return the number at the end of a title, e.g. the season number of 'Seizoen 2'.
+    :type title: str
+    :rtype str
+    """
+    match = _TRAILING_NUMBER.search(title) if title else None
+    return match.group(0) if match else None
+
+
+class LazyObject(SlottedObject):
+    """ Mixin for a data model object that decodes some of its fields on first access.
+
+    The schema passes the raw JSON values of these fields in `_raw`, and the functions of its lazy fields that convert them in `_converters`.
+    A raw value is dropped once it is decoded, so we don't keep the JSON object around.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, raw, converters, **kwargs):
+        """
+        :param dict raw:            The raw JSON values of the lazy fields.
+        :param dict converters:     The functions to convert the raw values.
+        """
+        super().__init__(**kwargs)
+        self._raw = raw  # pylint: disable=assigning-non-slot
+        self._converters = converters  # pylint: disable=assigning-non-slot
+        for name in raw:
+            delattr(self, name)
+
+    def __getattr__(self, name):
+        """ Only called when a field is not set yet, so decode it now and keep the result """
+        if name.startswith('_') or name not in self._raw:
+            raise AttributeError(name)
+        convert = self._converters.get(name)
+        value = self._raw.pop(name)
+        value = convert(value) if convert else value
+        setattr(self, name, value)
+        return value
+
+
+class LazyEpisode(LazyObject, Episode):
+    """ Defines an Episode that decodes its description and dates on first access. """
+
+    __slots__ = ('_raw', '_converters')
+
+
+class LazyChannel(LazyObject, Channel):
+    """ Defines a Channel that decodes its description on first access. """
+
+    __slots__ = ('_raw', '_converters')
+
+
+_PROGRAM_SCHEMA = Schema(Program, [
+    Field('uuid', 'programUuid'),
+    Field('path', 'programUuid'),
+    Field('channel', 'brand'),
+    Field('category_name', 'category', lambda value: value or 'No category'),
+    Field('title', 'title'),
+    Field('description', 'description', html_to_kodi),
+    Field('aired', ('dates', 'publishDate'), _timestamp),
+    Field('expiry', ('dates', 'unpublishDate'), _timestamp),
+    Field('poster', ('images', 'portrait')),
+    Field('thumb', ('images', 'portrait')),
+    Field('fanart', ('images', 'background')),
+])
+
+_SEASON_SCHEMA = Schema(Season, [
+    Field('uuid', 'playlistUuid'),
+    Field('title', 'title'),
+    Field('number', 'title', _trailing_number),
+])
+
+_CARD_PROGRAM_SCHEMA = Schema(Program, [
+    Field('uuid', 'uuid'),
+    Field('title', 'title'),
+    Field('category_id', 'categoryId', str),
+    Field('category_name', 'category', lambda value: value or 'No category'),
+    Field('poster', ('images', 0, 'url')),
+    Field('channel', 'brand'),
+    Field('aired', ('dates', 'publishDate'), _optional_timestamp),
+    Field('expiry', ('dates', 'unpublishDate'), _optional_timestamp),
+])
+
+_CARD_VIDEO_SCHEMA = Schema(Episode, [
+    Field('uuid', 'uuid'),
+    Field('title', 'subtitle'),
+    Field('channel', 'brand'),
+    Field('description', 'description', html_to_kodi, lazy=True),
+    Field('duration', 'duration'),
+    Field('position', 'position'),
+    Field('thumb', ('images', 0, 'url')),
+    Field('program_title', 'title'),
+    Field('aired', ('dates', 'publishDate'), _timestamp, lazy=True),
+    Field('expiry', ('dates', 'unpublishDate'), _timestamp, lazy=True),
+], lazy_model=LazyEpisode)
+_CATALOG_SCHEMAS = (_CARD_VIDEO_SCHEMA, _CARD_PROGRAM_SCHEMA)
+
+_PLAYLIST_VIDEO_SCHEMA = Schema(Episode, [
+    Field('uuid', 'videoUuid'),
+    Field('title', 'title'),
+    Field('aired', ('dates', 'publishDate'), _timestamp, lazy=True),
+    Field('expiry', ('dates', 'unpublishDate'), _timestamp, lazy=True),
+    Field('description', 'description', html_to_kodi, lazy=True),
+    Field('thumb', 'image'),
+    Field('duration', 'duration'),
+], lazy_model=LazyEpisode)
+
+_CHANNEL_SCHEMA = Schema(Channel, [
+    Field('uuid', 'uuid'),
+    Field('index', 'index'),
+    Field('title', 'title'),
+    Field('description', 'description', html_to_kodi, lazy=True),
+    Field('brand', 'brand'),
+    Field('logo', ('transparentLogo', 0, 'url')),
+    Field('fanart', ('images', 2, 'url')),
+], lazy_model=LazyChannel)
+
+_EPISODE_SCHEMA = Schema(Episode, [
+    Field('uuid', 'videoUuid'),
+    Field('nodeid', ('pageInfo', 'nodeId')),
+    Field('path', 'link', lambda value: value.lstrip('/')),
+    Field('channel', ('pageInfo', 'site')),
+    Field('program_title', ('program', 'title')),
+    Field('title', 'title'),
+    Field('description', 'description', html_to_kodi),
+    Field('thumb', 'image'),
+    Field('duration', 'duration'),
+    Field('season', 'seasonNumber'),
+    Field('number', 'episodeNumber'),
+    Field('aired', 'createdDate', lambda value: datetime.fromtimestamp(int(value))),
+    Field('expiry', 'unpublishDate', lambda value: datetime.fromtimestamp(int(value)) if value else None),
+    Field('rating', 'parentalRating'),
+    Field('stream', 'path'),
+    Field('content_type', 'type'),
+])
 
 
 class ContentApi:
@@ -208,6 +365,7 @@ class ContentApi:
         """ Initialise object """
         self._auth = auth
         self._cache_path = cache_path
+        self._streams = StreamStore(cache_path)
 
     def get_programs(self, channel=None, category=None):
         """ Get all programs optionally filtered by channel or category.
@@ -215,11 +373,11 @@ class ContentApi:
         :type category: int
         :rtype list[Program]
         """
-        programs = self.get_program_tree()
+        programs = self.iter_program_tree()
 
         # Return all programs
         if not channel and not category:
-            return programs
+            return list(programs)
 
         # filter by category_id, channel
         key = ''
@@ -257,9 +415,10 @@ class ContentApi:
 
         return program
 
-    def get_live_channels(self, cache=CACHE_AUTO):
+    def get_live_channels(self, cache=CACHE_AUTO, lazy=False):
         """  Get a list of live channels.
         :type cache: str
+        :type lazy: bool
         :rtype list[Channel]
         """
         def update():
@@ -274,14 +433,15 @@ class ContentApi:
         if not data:
             raise NoContentException('No content')
 
-        channels = self._parse_channels_data(data)
+        channels = self._parse_channels_data(data, lazy=lazy)
 
         return channels
 
-    def get_episodes(self, playlist_uuid, offset=0, limit=100, cache=CACHE_AUTO):
+    def get_episodes(self, playlist_uuid, offset=0, limit=100, cache=CACHE_AUTO, lazy=False):
         """  Get a list of all episodes of the specified playlist.
         :type playlist_uuid: str
         :type cache: str
+        :type lazy: bool
         :rtype list[Episode]
         """
         if not playlist_uuid:
@@ -299,19 +459,44 @@ class ContentApi:
         if not data:
             return None
 
-        episodes = self._parse_playlist_data(data)
+        episodes = self._parse_playlist_data(data, lazy=lazy)
 
         return episodes
 
-    def get_stream(self, uuid: str, content_type: str) -> ResolvedStream:
+    def get_stream(self, uuid: str, content_type: str, cache: int = CACHE_AUTO) -> ResolvedStream:
         """
-        Return a ResolvedStream for this video.
+        Return a ResolvedStream for this video. A resolved stream is kept for a short while, so a restart or resume doesn't need to
+        resolve it again.
 
         :param uuid: Unique ID of the video
         :param content_type: Video type, e.g. 'video-short_form', 'live_channel'
+        :param cache: Cache mode, CACHE_ONLY returns None when the stream isn't cached
         :return: ResolvedStream
         :raises UnavailableException: if the stream data cannot be retrieved
         """
+        if cache in [CACHE_AUTO, CACHE_ONLY]:
+            resolved_stream = self._streams.get(uuid, content_type)
+            if resolved_stream or cache == CACHE_ONLY:
+                return resolved_stream
+
+        resolved_stream, expiry = self._resolve_stream(uuid, content_type)
+        self._streams.set(content_type, resolved_stream, expiry)
+        return resolved_stream
+
+    def invalidate_stream(self, uuid, content_type):
+        """ Forget the resolved stream of this video, e.g. because it failed to play.
+        :type uuid: str
+        :type content_type: str
+        """
+        self._streams.remove(uuid, content_type)
+
+    def _resolve_stream(self, uuid, content_type):
+        """ Resolve the stream of this video, including the manifest url, subtitles and license keys.
+        :type uuid: str
+        :type content_type: str
+        :returns: The resolved stream, and the end of its ad session, if it has one.
+        :rtype tuple[ResolvedStream, int]
+        """
         # Determine mode based on content type
         mode_map = {
             'video-short_form': 'videos/short-form',
@@ -332,6 +517,7 @@ class ContentApi:
         manifest_url = None
         subtitle_url = None
         stream_type = None
+        expiry = None
 
         # Manifest URLs (DASH or HLS)
         if 'dash' in manifest_urls:
@@ -350,6 +536,7 @@ class ContentApi:
             )
             ad_data = json.loads(utils.post_url(ssai_url, data=''))
             manifest_url = ad_data.get('stream_manifest')
+            expiry = parse_time(ad_data.get('valid_until'))
             subtitle_url = self.extract_subtitle_from_manifest(manifest_url)
             stream_type = STREAM_DASH
 
@@ -383,7 +570,7 @@ class ContentApi:
             license_headers=license_headers,
             license_keys=license_keys,
             subtitles=[subtitle_url] if subtitle_url else [],
-        )
+        ), expiry
 
     def extract_subtitle_from_manifest(self, manifest_url):
         """Extract subtitle URL from a DASH manifest"""
@@ -427,22 +614,49 @@ class ContentApi:
         """ Get a content tree with information about all the programs.
         :rtype list[Program]
         """
+        return list(self.iter_program_tree())
+
+    def iter_program_tree(self):
+        """ Iterate over all the programs of the content tree. The videos in the lanes are parsed lazily, since we skip them.
+        :rtype Iterator[Program]
+        """
         page = 'programs'
         swimlanes = self.get_page(page)
-        cards = []
         # get lanes
         for lane in swimlanes:
-            index = lane.index
             # get lane by index
-            _, data = self.get_swimlane(page, index)
-            cards.extend(data)
-        return cards
+            for item in self.iter_swimlane(page, lane.index, lazy=True):
+                if isinstance(item, Program):
+                    yield item
+
+    def get_catalog_store(self, pages=('home', 'programs'), cache=CACHE_AUTO):
+        """ Build a columnar store of all the videos and programs on the specified pages, or load the one we saved before.
+        :type pages: tuple[str]
+        :type cache: int
+        :rtype CatalogStore
+        """
+        path = os.path.join(self._cache_path, 'catalog.%s.json' % '.'.join(pages))
+        if cache in [CACHE_AUTO, CACHE_ONLY]:
+            store = CatalogStore.load(path, _CATALOG_SCHEMAS)
+            if store is not None or cache == CACHE_ONLY:
+                return store
+
+        items = {}
+        for page in pages:
+            for lane in self.get_page(page) or []:
+                for item in self.iter_swimlane(page, lane.index, cache=CACHE_AUTO, lazy=True):
+                    items.setdefault(item.uuid, item)
+        store = CatalogStore(items.values())
+        if not os.path.exists(self._cache_path):
+            os.makedirs(self._cache_path)
+        store.save(path, CATALOG_TTL, _CATALOG_SCHEMAS)
+        return store
 
     def get_categories(self):
         """ Return a list of categories.
         :rtype list[Category]
         """
-        content_tree = self.get_program_tree()
+        content_tree = self.iter_program_tree()
         categories = []
         cat_set = set()
         for item in content_tree:
@@ -478,10 +692,28 @@ class ContentApi:
             )
         return swimlanes
 
-    def get_swimlane(self, page, index, limit=100, offset=0, cache=CACHE_PREVENT):
+    def get_swimlane(self, page, index, limit=100, offset=0, cache=CACHE_PREVENT, lazy=False):
         """ Get a list of all categories.
         :rtype list[Episode], list[Program]
         """
+        data = self._get_swimlane_data(page, index, limit=limit, offset=offset, cache=cache)
+
+        videos, programs = self._parse_cards_data(data, lazy=lazy)
+
+        return videos, programs
+
+    def iter_swimlane(self, page, index, limit=100, offset=0, cache=CACHE_PREVENT, lazy=True):
+        """ Iterate over the videos and programs of a swimlane.
+        :rtype Iterator[Union[Episode, Program]]
+        """
+        data = self._get_swimlane_data(page, index, limit=limit, offset=offset, cache=cache)
+
+        return self._iter_cards_data(data, lazy=lazy)
+
+    def _get_swimlane_data(self, page, index, limit=100, offset=0, cache=CACHE_PREVENT):
+        """ Get the cards JSON of a swimlane.
+        :rtype list[dict]
+        """
 
         def update():
             """ Fetch the swimlane metadata """
@@ -500,11 +732,7 @@ class ContentApi:
             return cards
 
         # Fetch listing from cache or update if needed
-        data = self._handle_cache(key=['swimlane', page, index, limit, offset], cache_mode=cache, update=update)
-
-        videos, programs = self._parse_cards_data(data)
-
-        return videos, programs
+        return self._handle_cache(key=['swimlane', page, index, limit, offset], cache_mode=cache, update=update)
 
     def search(self, query, limit=100, offset=0, cache=CACHE_AUTO):
         """ Search by query """
@@ -595,28 +823,11 @@ class ContentApi:
         :rtype Program
         """
         # Create Program info
-        program = Program(
-            uuid=data.get('programUuid'),
-            path=data.get('programUuid'),
-            channel=data.get('brand'),
-            category_name=data.get('category') or 'No category',
-            title=data.get('title'),
-            description=html_to_kodi(data.get('description')),
-            aired=datetime.fromtimestamp(data.get('dates', {}).get('publishDate', 0.0) or 0.0),
-            expiry=datetime.fromtimestamp(data.get('dates', {}).get('unpublishDate', 0.0) or 0.0),
-            poster=data.get('images').get('portrait'),
-            thumb=data.get('images').get('portrait'),
-            fanart=data.get('images').get('background'),
-        )
+        program = _PROGRAM_SCHEMA.build(data)
 
         # Create Season info
-
         program.seasons = {
-            key: Season(
-                uuid=playlist.get('playlistUuid'),
-                title=playlist.get('title'),
-                number=re.compile(r'\d+$').findall(playlist.get('title'))[-1] if re.compile(r'\d+$').findall(playlist.get('title')) else None,
-            )
+            key: _SEASON_SCHEMA.build(playlist)
             for key, playlist in enumerate(data.get('playlists', [])) if playlist.get('title')
         }
 
@@ -624,87 +835,73 @@ class ContentApi:
 
 
     @staticmethod
-    def _parse_cards_data(data):
+    def _parse_cards_data(data, lazy=False):
         """ Parse the Cards JSON.
         :type data: dict
+        :type lazy: bool
         ::rtype list[Episode], list[Program]
         """
         videos = []
         programs = []
-        for card in data:
+        for item in ContentApi._iter_cards_data(data, lazy=lazy):
+            if isinstance(item, Program):
+                programs.append(item)
+            else:
+                videos.append(item)
+        return videos, programs
+
+    @staticmethod
+    def _iter_cards_data(data, lazy=False):
+        """ Parse the Cards JSON one card at a time.
+        :type data: dict
+        :type lazy: bool
+        ::rtype Iterator[Union[Episode, Program]]
+        """
+        for card in data or []:
             if card.get('type') == 'PROGRAM':
                 # Program
-                programs.append(Program(
-                    uuid=card.get('uuid'),
-                    title=card.get('title'),
-                    category_id=str(card.get('categoryId')),
-                    category_name=card.get('category') or 'No category',
-                    poster=card.get('images')[0].get('url'),
-                    channel=card.get('brand'),
-                ))
+                yield _CARD_PROGRAM_SCHEMA.build(card)
             elif card.get('type') == 'VIDEO':
                 # Video
-                videos.append(Episode(
-                    uuid=card.get('uuid'),
-                    title=card.get('subtitle'),
-                    channel=card.get('brand'),
-                    description=html_to_kodi(card.get('description')),
-                    duration=card.get('duration'),
-                    position=card.get('position'),
-                    thumb=card.get('images')[0].get('url'),
-                    program_title=card.get('title'),
-                    aired=datetime.fromtimestamp(card.get('dates', {}).get('publishDate', 0.0) or 0.0),
-                    expiry=datetime.fromtimestamp(card.get('dates', {}).get('unpublishDate', 0.0) or 0.0),
-                    content_type='long_form',
-                ))
-        return videos, programs
-
+                yield _CARD_VIDEO_SCHEMA.build(card, lazy=lazy, content_type='long_form')
 
     @staticmethod
-    def _parse_playlist_data(data):
+    def _parse_playlist_data(data, lazy=False):
         """ Parse the Playlist JSON.
         :type data: dict
-        :rtype Playlist
-        """
-        # Create Playlist info
-        playlist = [
-            Episode(
-                uuid=video.get('videoUuid'),
-                title=video.get('title'),
-                aired=datetime.fromtimestamp(video.get('dates', {}).get('publishDate', 0.0) or 0.0),
-                expiry=datetime.fromtimestamp(video.get('dates', {}).get('unpublishDate', 0.0) or 0.0),
-                description=html_to_kodi(video.get('description')),
-                thumb=video.get('image'),
-                duration=video.get('duration'),
-                #number=video.get('title').split()[1],
-                content_type='long_form',
-            )
-            for video in data.get('videos', [])
-        ]
-        return playlist
+        :type lazy: bool
+        :rtype list[Episode]
+        """
+        return list(ContentApi._iter_playlist_data(data, lazy=lazy))
 
+    @staticmethod
+    def _iter_playlist_data(data, lazy=False):
+        """ Parse the Playlist JSON one video at a time.
+        :type data: dict
+        :type lazy: bool
+        :rtype Iterator[Episode]
+        """
+        for video in data.get('videos', []):
+            yield _PLAYLIST_VIDEO_SCHEMA.build(video, lazy=lazy, content_type='long_form')
 
     @staticmethod
-    def _parse_channels_data(data):
+    def _parse_channels_data(data, lazy=False):
         """ Parse the Channel JSON.
         :type data: dict
+        :type lazy: bool
         :rtype list[Channel]
         """
-        # Create Channel info
-        channels = [
-            Channel(
-                uuid=channel.get('uuid'),
-                index=channel.get('index'),
-                title=channel.get('title'),
-                description=html_to_kodi(channel.get('description')),
-                brand=channel.get('brand'),
-                logo=channel.get('transparentLogo')[0].get('url'),
-                fanart=channel.get('images')[2].get('url'),
-            )
-            for channel in data
-        ]
-        return channels
+        return list(ContentApi._iter_channels_data(data, lazy=lazy))
 
+    @staticmethod
+    def _iter_channels_data(data, lazy=False):
+        """ Parse the Channel JSON one channel at a time.
+        :type data: dict
+        :type lazy: bool
+        :rtype Iterator[Channel]
+        """
+        for channel in data:
+            yield _CHANNEL_SCHEMA.build(channel, lazy=lazy)
 
     @staticmethod
     def _parse_episode_data(data, season_uuid=None):
@@ -713,36 +910,17 @@ class ContentApi:
         :type season_uuid: str
         :rtype Episode
         """
-        if data.get('episodeNumber'):
-            episode_number = data.get('episodeNumber')
-        else:
-            # The episodeNumber can be absent
-            match = re.compile(r'\d+$').search(data.get('title'))
-            if match:
-                episode_number = match.group(0)
-            else:
-                episode_number = None
+        fields = _EPISODE_SCHEMA.extract(data)
 
-        episode = Episode(
-            uuid=data.get('videoUuid'),
-            nodeid=data.get('pageInfo', {}).get('nodeId'),
-            path=data.get('link').lstrip('/'),
-            channel=data.get('pageInfo', {}).get('site'),
-            program_title=data.get('program', {}).get('title') if data.get('program') else data.get('title'),
-            title=data.get('title'),
-            description=html_to_kodi(data.get('description')),
-            thumb=data.get('image'),
-            duration=data.get('duration'),
-            season=data.get('seasonNumber'),
-            season_uuid=season_uuid,
-            number=episode_number,
-            aired=datetime.fromtimestamp(int(data.get('createdDate'))),
-            expiry=datetime.fromtimestamp(int(data.get('unpublishDate'))) if data.get('unpublishDate') else None,
-            rating=data.get('parentalRating'),
-            stream=data.get('path'),
-            content_type=data.get('type'),
-        )
-        return episode
+        # The program can be absent
+        if not data.get('program'):
+            fields['program_title'] = fields['title']
+
+        # The episodeNumber can be absent
+        if not fields['number']:
+            fields['number'] = _trailing_number(fields['title'])
+
+        return Episode(season_uuid=season_uuid, **fields)
 
     @staticmethod
     def _parse_clip_data(data):
@@ -808,10 +986,13 @@ class ContentApi:
         if not os.path.exists(self._cache_path):
             os.makedirs(self._cache_path)
 
-        with open(fullpath, 'w', encoding='utf-8') as fdesc:
+        # Write to a temporary file first, so another thread or process never reads a partial file
+        tmp_path = '%s.%d.%d.tmp' % (fullpath, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w', encoding='utf-8') as fdesc:
             _LOGGER.debug('Storing to cache as %s', filename)
             json.dump(data, fdesc)
 
         # Set TTL by modifying modification date
         deadline = int(time.time()) + ttl
-        os.utime(fullpath, (deadline, deadline))
+        os.utime(tmp_path, (deadline, deadline))
+        os.replace(tmp_path, fullpath)
@@ -1,17 +1,24 @@
 # -*- coding: utf-8 -*-
 """ EPG API """
 
-import ast
-import re
-import json
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
+from functools import partial
 
 import dateutil.parser
 import dateutil.tz
 import requests
 
 from resources.lib import kodiutils
+from resources.lib.play import SlottedObject, intern_string
+from resources.lib.play.content import CACHE_AUTO, CACHE_ONLY, CACHE_PREVENT
+from resources.lib.play.epgindex import EpgIndex
+from resources.lib.play.epgsnapshot import EpgSnapshot
+from resources.lib.play.epgstore import EpgStore
+from resources.lib.play.exceptions import UnavailableException
+from resources.lib.play.flight import FlightParser
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -35,25 +42,35 @@ GENRE_MAPPING = {
 
 PROXIES = kodiutils.get_proxies()
 
+# The days of the guide that the API provides, relative to today
+EPG_WINDOW = range(-7, 8)
 
-class EpgProgram:
+# The order of the values in the compact EPG records that we keep in the store
+EPG_FIELDS = ('program_title', 'episode_title', 'episode_title_original', 'number', 'season', 'genre', 'start', 'won_id', 'won_program_id',
+              'program_description', 'description', 'duration', 'program_url', 'video_url', 'thumb')
+
+
+class EpgProgram(SlottedObject):
     """ Defines a Program in the EPG. """
 
+    __slots__ = ('channel', 'program_title', 'episode_title', 'episode_title_original', 'number', 'season', 'genre', 'genre_id', 'start', 'won_id',
+                 'won_program_id', 'program_description', 'description', 'duration', 'program_url', 'video_url', 'thumb', 'airing')
+
     # pylint: disable=invalid-name
     def __init__(self, channel, program_title, episode_title, episode_title_original, number, season, genre, start,
                  won_id, won_program_id, program_description, description, duration, program_url, video_url, thumb,
                  airing):
-        self.channel = channel
-        self.program_title = program_title
+        self.channel = intern_string(channel)
+        self.program_title = intern_string(program_title)
         self.episode_title = episode_title
         self.episode_title_original = episode_title_original
         self.number = number
-        self.season = season
-        self.genre = genre
+        self.season = intern_string(season)
+        self.genre = intern_string(genre)
         self.start = start
         self.won_id = won_id
         self.won_program_id = won_program_id
-        self.program_description = program_description
+        self.program_description = intern_string(program_description)
         self.description = description
         self.duration = duration
         self.program_url = program_url
@@ -66,9 +83,6 @@ class EpgProgram:
         else:
             self.genre_id = None
 
-    def __repr__(self):
-        return "%r" % self.__dict__
-
 
 class EpgApi:
     """ Play EPG API """
@@ -77,18 +91,36 @@ class EpgApi:
 
     EPG_NO_BROADCAST = 'Geen uitzending'
 
-    def __init__(self):
-        """ Initialise object """
-        self._session = requests.session()
+    INDEX_CACHE_SIZE = 64  # The number of channel days that we keep an interval index of
 
-    def get_epg(self, channel, date):
+    def __init__(self, cache_path=None, timeout=None):
+        """ Initialise object
+        :param str cache_path:  The path where the guide is stored, or None to store nothing.
+        :param int timeout:     The timeout in seconds of the requests to the guide.
+        """
+        self._local = threading.local()
+        self._timeout = timeout
+        self._indexes = {}
+        self._store = EpgStore(cache_path) if cache_path else None
+
+    @property
+    def _session(self):
+        """ The requests session of the current thread, since a session can't be shared between threads.
+        :rtype requests.Session
+        """
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.session()
+        return session
+
+    def get_epg(self, channel, date, cache=CACHE_AUTO):
         """ Returns the EPG for the specified channel and date.
         :type channel: str
         :type date: str
+        :type cache: int
         :rtype list[EpgProgram]
+        :raises UnavailableException: if the guide could not be fetched, and we have nothing stored
         """
-        #_LOGGER.info("Getting info for channel %s on date %s", channel, date)
-
         if date is None:
             # Fetch today when no date is specified
             date = datetime.today().strftime('%Y-%m-%d')
@@ -99,76 +131,252 @@ class EpgApi:
         elif date == 'tomorrow':
             date = (datetime.today() + timedelta(days=1)).strftime('%Y-%m-%d')
 
+        slug = channel.split()[-1].lower()
+        records, _ = self._get_records(slug, date, cache)
+        return self._parse_programs(channel, records)
+
+    def get_fragment(self, channel, date, extension, render, cache=CACHE_AUTO):
+        """ Returns a fragment that is rendered from the EPG for the specified channel and date. The fragment is kept with the guide in the store,
+        and is only rendered again when the guide has changed.
+        :type channel: str
+        :type date: str
+        :type extension: str
+        :type render: callable
+        :type cache: int
+        :rtype str
+        :raises UnavailableException: if the guide could not be fetched, and we have nothing stored
+        """
+        slug = channel.split()[-1].lower()
+        if self._store and cache in [CACHE_AUTO, CACHE_ONLY]:
+            fragment = self._store.get_fragment(slug, date, extension)
+            if fragment is not None:
+                return fragment
+
+        records, version = self._get_records(slug, date, cache)
+        fragment = render(self._parse_programs(channel, records))
+        if version is not None:
+            # Stamp the fragment with the version of the day it was rendered from, that might have been replaced in the mean time
+            self._store.set_fragment(slug, date, extension, fragment, version)
+        return fragment
+
+    def refresh_window(self, channels, abort=None):
+        """ Keep the stored guide of the channels up to date over the days of EPG_WINDOW. Days that are new in the window are fetched, today and
+        tomorrow are fetched again when they have expired, and days that have left the window are removed. A past day that expired was stored
+        before it ended, and is fetched again to get its final version.
+        :type channels: list[str]
+        :type abort: callable
+        :rtype int
+        """
+        if not self._store:
+            return 0
+
+        today = datetime.today()
+        dates = [(today + timedelta(days=i)).strftime('%Y-%m-%d') for i in EPG_WINDOW]
+        recheck = {today.strftime('%Y-%m-%d'), (today + timedelta(days=1)).strftime('%Y-%m-%d')}
+        today = today.strftime('%Y-%m-%d')
+
+        fetched = 0
+        for channel in channels:
+            slug = channel.split()[-1].lower()
+            for date in dates:
+                if abort and abort():
+                    return fetched
+                version = self._store.mtime(slug, date)
+                if version is not None and (version >= time.time_ns() or (date > today and date not in recheck)):
+                    continue
+                try:
+                    self._get_records(slug, date, CACHE_PREVENT)
+                except UnavailableException:
+                    # Try again in the next pass
+                    continue
+                fetched += 1
+
+        self._store.purge(dates)
+        return fetched
+
+    def is_expired(self, channel, date):
+        """ Returns whether the stored guide of the specified channel and date is missing or has expired. The guide that CACHE_ONLY returns
+        for such a day is empty or out of date.
+        :type channel: str
+        :type date: str
+        :rtype bool
+        """
+        version = self._store.mtime(channel.split()[-1].lower(), date) if self._store else None
+        return version is None or version < time.time_ns()
+
+    def get_index(self, channel, date, cache=CACHE_AUTO):
+        """ Returns the interval index of the EPG for the specified channel and date. An index is kept for as long as the stored guide of that
+        day is not rewritten, and hasn't expired.
+        :type channel: str
+        :type date: str
+        :type cache: int
+        :rtype EpgIndex
+        :raises UnavailableException: if the guide could not be fetched, and we have nothing stored
+        """
+        slug = channel.split()[-1].lower()
+        key = (slug, date)
+        entry = self._indexes.get(key)
+        if entry is not None:
+            version = self._store.mtime(slug, date)
+            if entry[0] == version and (cache == CACHE_ONLY or version >= time.time_ns()):
+                return entry[1]
+
+        # Index the start times and durations, the programs are only decoded when a lookup returns them
+        records, version = self._get_records(slug, date, cache)
+        columns = records.columns() if isinstance(records, EpgSnapshot) else self._columns(records)
+        index = EpgIndex(*columns, load=partial(self._load_program, channel, records))
+
+        # Only keep the indexes of stored days, and only of the days we used last
+        self._indexes.pop(key, None)
+        if version is not None:
+            if len(self._indexes) >= self.INDEX_CACHE_SIZE:
+                del self._indexes[next(iter(self._indexes))]
+            self._indexes[key] = (version, index)
+        return index
+
+    def _get_records(self, channel, date, cache=CACHE_AUTO):
+        """ Returns the EPG records for the specified channel slug and date, from the store when we can, together with the modification date
+        of the stored version they come from. The version is None when the records are not stored. With CACHE_ONLY, a day that we have not
+        stored has no records.
+        :type channel: str
+        :type date: str
+        :type cache: int
+        :rtype tuple[list[tuple], int]
+        :raises UnavailableException: if the guide could not be fetched, and we have nothing stored
+        """
+        if cache in [CACHE_AUTO, CACHE_ONLY]:
+            records = self._store.get(channel, date) if self._store else None
+            if records is not None:
+                return records, records.mtime
+            if cache == CACHE_ONLY:
+                # Rather use an expired guide than nothing at all
+                records = self._store.get(channel, date, allow_expired=True) if self._store else None
+                return (records, records.mtime) if records is not None else ([], None)
+
         try:
-            response = self._get_url(self.EPG_ENDPOINT.format(channel=channel.split()[-1].lower(), date=date))
-            _LOGGER.info("Date is %s and channel is %s", date, channel)
-
-            fragments = re.findall(r'<script>self.__next_f.push\((?P<fragment>.*?)\)<\/script>', response, re.DOTALL)
-            programs = []
-            for item in fragments:
-                data_list = ast.literal_eval(item)
-                parts = re.findall(r'",({.*?\"})]', data_list[-1], re.DOTALL)
-                for program in parts:
-                    program = program.replace('$undefined', 'null')
-                    try:
-                        program = json.loads(program)
-                    except json.JSONDecodeError:
-                        continue
-                    if program.get('program'):
-                        programs.append(program)
-
-            return [self._parse_program(channel, x) for x in programs if self.EPG_NO_BROADCAST not in x['program']['programTitle']]
-        except Exception as e:  # pylint: disable=broad-exception-caught
-            ptitle = f"Error occured : {e}"
-            _LOGGER.info("Date is %s and channel is %s, %s", date, channel, ptitle)
-            date_ymd = date.split("-")
-            ts = self.convert_to_timestamp(date_ymd[0], date_ymd[1], date_ymd[2]) + 28800
-            y=['$', '$L31', '', {'program': {'classification': {'age': 12, 'icons': {'summary': [], 'full': ['violence', 'fear', 'badLanguage']}}, 'contentEpisode': 'Error', 'dateString': date, 'duration': 43200, 'episodeNr': '1', 'episodeTitle': 'Error', 'genre': 'Actie', 'isMovie': False, 'latestVideo': False, 'originalTitle': None, 'program': None, 'programConcept': 'Actieserie', 'programTitle': ptitle, 'season': '1', 'timeString': '08:00', 'timestamp': ts, 'video': None, 'wonId': None, 'wonProgramId': None}}]
-            return [self._parse_program(channel, y)]
+            _LOGGER.debug('Fetching guide of %s on %s', channel, date)
+            url = self.EPG_ENDPOINT.format(channel=channel, date=date)
+            records = self._flatten_programs(self._get_programs(url))
+            # A day without programs is stored as well, so we don't fetch it again until it expires
+            version = self._store.set(channel, date, records) if self._store else None
+            return records, version
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning('Could not fetch the guide of %s on %s: %s', channel, date, exc)
+            error = exc
+
+        records = self._store.get(channel, date, allow_expired=True) if self._store else None
+        if records is not None:
+            return records, records.mtime
+
+        raise UnavailableException('Could not fetch the guide of %s on %s: %s' % (channel, date, error))
 
     @staticmethod
-    def _parse_program(channel, data):
-        """ Parse the EPG JSON data to a EpgProgram object.
+    def _columns(records):
+        """ Returns the positions, start times and durations of the records that have a start time.
+        :type records: list[tuple]
+        :rtype tuple[list[int], list[int], list[int]]
+        """
+        positions = [pos for pos, record in enumerate(records) if record[6] is not None]
+        return positions, [records[pos][6] for pos in positions], [records[pos][11] or 0 for pos in positions]
+
+    @classmethod
+    def _load_program(cls, channel, records, pos):
+        """ Parse the EPG record at a position to a EpgProgram object.
         :type channel: str
-        :type data: dict
+        :type records: Sequence[tuple]
+        :type pos: int
         :rtype EpgProgram
         """
-        airing = False
-        duration = int(data['program']['duration']) if data['program']['duration'] else None
-        # Check if this broadcast is currently airing
-        timestamp = datetime.now().replace(tzinfo=dateutil.tz.gettz('CET'))
-        start = datetime.fromtimestamp(data['program']['timestamp']).replace(tzinfo=dateutil.tz.gettz('CET'))
-        if duration:
-            airing = bool(start <= timestamp < (start + timedelta(seconds=duration)))
+        return cls._parse_programs(channel, [records[pos]])[0]
+
+    @classmethod
+    def _flatten_programs(cls, programs):
+        """ Flatten the programs that were extracted from a guide page to compact records, and leave out the gaps in the broadcast and the
+        programs without a start time, which we can't place in the guide.
+        :type programs: list[dict]
+        :rtype list[tuple]
+        """
+        return [cls._flatten_program(x['program']) for x in programs
+                if x.get('program') and cls.EPG_NO_BROADCAST not in x['program']['programTitle'] and x['program'].get('timestamp') is not None]
 
+    @staticmethod
+    def _flatten_program(data):
+        """ Flatten the EPG JSON data of a program to a compact record, with the values in the order of EPG_FIELDS.
+        :type data: dict
+        :rtype tuple
+        """
         # Only allow direct playing if the linked video is the actual program
-        if data['program']['latestVideo']:
-            video_url = data['program']['video']['uuid']
-            thumb = data['program']['video']['data']['images']['default']
+        if data['latestVideo']:
+            video_url = data['video']['uuid']
+            thumb = data['video']['data']['images']['default']
         else:
             video_url = None
             thumb = None
 
-        epg_program = EpgProgram(
+        return (
+            data['programTitle'],
+            data['episodeTitle'],
+            data['originalTitle'],
+            int(data['episodeNr']) if data['episodeNr'] else None,
+            data['season'],
+            data['genre'],
+            data['timestamp'],
+            int(data['wonId']) if data['wonId'] else None,
+            int(data['wonProgramId']) if data['wonProgramId'] else None,
+            data['programConcept'],
+            data['contentEpisode'],
+            int(data['duration']) if data['duration'] else None,
+            data['program']['uuid'] if data['program'] else None,
+            video_url,
+            thumb,
+        )
+
+    @classmethod
+    def _parse_programs(cls, channel, records):
+        """ Parse EPG records to EpgProgram objects.
+        :type channel: str
+        :type records: Iterable[tuple]
+        :rtype list[EpgProgram]
+        """
+        now = datetime.now().replace(tzinfo=dateutil.tz.gettz('CET'))
+        return [cls._parse_program(channel, record, now) for record in records]
+
+    @staticmethod
+    def _parse_program(channel, record, now):
+        """ Parse an EPG record to a EpgProgram object.
+        :type channel: str
+        :type record: list
+        :type now: datetime
+        :rtype EpgProgram
+        """
+        (program_title, episode_title, episode_title_original, number, season, genre, timestamp, won_id, won_program_id, program_description,
+         description, duration, program_url, video_url, thumb) = record
+
+        airing = False
+        # Check if this broadcast is currently airing
+        start = datetime.fromtimestamp(timestamp).replace(tzinfo=dateutil.tz.gettz('CET'))
+        if duration:
+            airing = bool(start <= now < (start + timedelta(seconds=duration)))
+
+        return EpgProgram(
             channel=channel,
-            program_title=data['program']['programTitle'],
-            episode_title=data['program']['episodeTitle'],
-            episode_title_original=data['program']['originalTitle'],
-            number=int(data['program']['episodeNr']) if data['program']['episodeNr'] else None,
-            season=data['program']['season'],
-            genre=data['program']['genre'],
+            program_title=program_title,
+            episode_title=episode_title,
+            episode_title_original=episode_title_original,
+            number=number,
+            season=season,
+            genre=genre,
             start=start,
-            won_id=int(data['program']['wonId']) if data['program']['wonId'] else None,
-            won_program_id=int(data['program']['wonProgramId']) if data['program']['wonProgramId'] else None,
-            program_description=data['program']['programConcept'],
-            description=data['program']['contentEpisode'],
+            won_id=won_id,
+            won_program_id=won_program_id,
+            program_description=program_description,
+            description=description,
             duration=duration,
-            program_url=data['program']['program']['uuid'] if data['program']['program'] else None,
+            program_url=program_url,
             video_url=video_url,
             thumb=thumb,
             airing=airing,
         )
-        return epg_program
 
     def get_broadcast(self, channel, timestamp):
         """ Load EPG information for the specified channel and date.
@@ -179,62 +387,63 @@ class EpgApi:
         # Parse to a real datetime
         timestamp = dateutil.parser.parse(timestamp).replace(tzinfo=dateutil.tz.gettz('CET'))
 
-        # Load guide info for this date
-        programs = self.get_epg(channel=channel, date=timestamp.strftime('%Y-%m-%d'))
+        return self.get_now_next(channel, timestamp)[0]
 
-        # Find a matching broadcast
-        for broadcast in programs:
-            if broadcast.start <= timestamp < (broadcast.start + timedelta(seconds=broadcast.duration)):
-                return broadcast
+    def get_now_next(self, channel, timestamp=None, cache=CACHE_AUTO):
+        """ Returns the program that airs on the specified channel at the specified time (now by default), and the one that follows.
+        :type channel: str
+        :type timestamp: datetime
+        :type cache: int
+        :rtype: tuple[EpgProgram, EpgProgram]
+        """
+        if timestamp is None:
+            timestamp = datetime.now().replace(tzinfo=dateutil.tz.gettz('CET'))
+        # The index has the start times of the records, this is the inverse of how _parse_program makes a datetime of them
+        epoch = int(timestamp.replace(tzinfo=None).timestamp())
+
+        index = self.get_index(channel, timestamp.strftime('%Y-%m-%d'), cache)
+        current = index.at(epoch) if index else None
+        upcoming = index.after(epoch) if index else None
+
+        # A program that started before midnight is in the guide of the day before
+        if current is None:
+            index = self.get_index(channel, (timestamp - timedelta(days=1)).strftime('%Y-%m-%d'), cache)
+            current = index.at(epoch) if index else None
+
+        # The program after the last one of the day is in the guide of the next day
+        if upcoming is None:
+            index = self.get_index(channel, (timestamp + timedelta(days=1)).strftime('%Y-%m-%d'), cache)
+            upcoming = index.after(epoch) if index else None
+
+        return current, upcoming
+
+    def get_whats_on(self, channels, timestamp=None, cache=CACHE_AUTO):
+        """ Returns the program that airs at the specified time (now by default) on each of the specified channels.
+        :type channels: list[str]
+        :type timestamp: datetime
+        :type cache: int
+        :rtype: dict[str, EpgProgram]
+        """
+        if timestamp is None:
+            timestamp = datetime.now().replace(tzinfo=dateutil.tz.gettz('CET'))
 
-        return None
+        return {channel: self.get_now_next(channel, timestamp, cache)[0] for channel in channels}
 
-    def _get_url(self, url):
-        """ Makes a GET request for the specified URL.
+    def _get_programs(self, url):
+        """ Download a guide page, and extract the programs from its flight payload while it comes in.
         :type url: str
-        :rtype str
+        :rtype list[dict]
         """
-        response = self._session.get(url, proxies=PROXIES)
+        response = self._session.get(url, proxies=PROXIES, stream=True, timeout=self._timeout)
 
         if response.status_code != 200:
             raise Exception('Could not fetch data')
 
-        return response.text
-
-    def is_leap_year(self, year):
-        """ Checks if a year is a leap year """
-        return (year % 4 == 0 and year % 100 != 0) or (year % 400 == 0)
-
-
-    def convert_to_timestamp(self, year, month, day):
-        """ Converts year, month, and day to Linux timestamp without datetime lib """
-        year=int(year)
-        month=int(month)
-        day=int(day)
-
-        # Days in each month for regular and leap years
-        days_in_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-
-        # Account for leap year
-        if self.is_leap_year(year):
-            days_in_month[1] = 29
-
-        # Seconds in a day
-        seconds_per_day = 86400
-
-        # Calculate the total number of days since Unix epoch (1970-01-01)
-        total_days = 0
-
-        # Add days for each year since 1970
-        for y in range(1970, year):
-            total_days += 366 if self.is_leap_year(y) else 365
-
-        # Add days for each month in the given year
-        for m in range(1, month):
-            total_days += days_in_month[m - 1]
-
-        # Add the days in the given month
-        total_days += day - 1  # Subtract 1 because the epoch starts at the beginning of the day
+        if not response.encoding:
+            response.encoding = 'utf-8'
 
-        # Convert days to seconds
-        return total_days * seconds_per_day
+        parser = FlightParser()
+        programs = []
+        for chunk in response.iter_content(chunk_size=65536, decode_unicode=True):
+            programs.extend(parser.feed(chunk))
+        return programs
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+""" Interval index of the EPG """
+
+from array import array
+from bisect import bisect_right
+
+
+class EpgIndex:
+    """ Sorted interval index of the programs of a channel on a day.
+
+    The start and end times of the programs are kept as arrays of epoch timestamps, sorted on the start time. The program that airs at a time,
+    or the first one that starts after it, is found with a bisect on the start times. Only the programs that a lookup returns are loaded.
+    """
+
+    def __init__(self, positions, starts, durations, load):
+        """
+        :param Sequence[int] positions:     The positions of the programs in the guide of the day.
+        :param Sequence[int] starts:        The start times of the programs, as epoch timestamps.
+        :param Sequence[int] durations:     The durations of the programs in seconds.
+        :param callable load:               Returns the program at a position in the guide of the day.
+        """
+        order = sorted(range(len(positions)), key=starts.__getitem__)
+        self._positions = array('l', (positions[idx] for idx in order))
+        self._starts = array('q', (starts[idx] for idx in order))
+        self._ends = array('q', (starts[idx] + durations[idx] for idx in order))
+        self._load = load
+
+    def __len__(self):
+        return len(self._positions)
+
+    def at(self, timestamp):
+        """ Return the program that airs at the specified time, or None when nothing airs.
+        :type timestamp: int
+        :rtype EpgProgram
+        """
+        pos = bisect_right(self._starts, timestamp) - 1
+        if pos >= 0 and timestamp < self._ends[pos]:
+            return self._load(self._positions[pos])
+        return None
+
+    def after(self, timestamp):
+        """ Return the first program that starts after the specified time, or None when there is none on this day.
+        :type timestamp: int
+        :rtype EpgProgram
+        """
+        pos = bisect_right(self._starts, timestamp)
+        if pos < len(self._positions):
+            return self._load(self._positions[pos])
+        return None
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+""" Compact binary snapshot of the EPG """
+
+import json
+import os
+import struct
+import sys
+from array import array
+
+# The values of a record that are kept in the string table, in the order of EPG_FIELDS
+STRING_FIELDS = (0, 1, 2, 4, 5, 9, 10, 12, 13, 14)
+
+HEADER = struct.Struct('<4sHII')  # magic, version, number of records, number of strings
+RECORD = struct.Struct('<qqqiiBxH10I')  # start, won_id, won_program_id, duration, number, flags, JSON mask, the indexes of the strings
+OFFSET = struct.Struct('<I')  # The offsets of the strings, like the records in little endian
+
+MAGIC = b'PEPG'
+VERSION = 2
+
+# Flags for the numeric values that are unknown
+NO_WON_ID = 1
+NO_WON_PROGRAM_ID = 2
+NO_DURATION = 4
+NO_NUMBER = 8
+NO_START = 16
+
+NO_STRING = 0xFFFFFFFF
+
+
+def write_snapshot(path, records):
+    """ Write the records of the guide of a channel and day to a snapshot file. Every distinct string is only stored once. A value of a string
+    field that is not a string, like a season number, is stored as JSON, and is marked in the JSON mask of the record so it keeps its type.
+    :type path: str
+    :type records: list[tuple]
+    """
+    strings = {}
+    packed = []
+    for record in records:
+        refs = []
+        mask = 0
+        for bit, idx in enumerate(STRING_FIELDS):
+            value = record[idx]
+            if value is None:
+                refs.append(NO_STRING)
+                continue
+            if not isinstance(value, str):
+                value = json.dumps(value)
+                mask |= 1 << bit
+            refs.append(strings.setdefault(value, len(strings)))
+        flags = ((NO_WON_ID if record[7] is None else 0) | (NO_WON_PROGRAM_ID if record[8] is None else 0) |
+                 (NO_DURATION if record[11] is None else 0) | (NO_NUMBER if record[3] is None else 0) | (NO_START if record[6] is None else 0))
+        packed.append(RECORD.pack(record[6] or 0, record[7] or 0, record[8] or 0, record[11] or 0, record[3] or 0, flags, mask, *refs))
+
+    blobs = [value.encode('utf-8') for value in strings]
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+
+    # Write to a temporary file first, so a reader never sees a partial snapshot
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as fdesc:
+            fdesc.write(HEADER.pack(MAGIC, VERSION, len(packed), len(blobs)))
+            fdesc.write(b''.join(packed))
+            fdesc.write(struct.pack('<%dI' % len(offsets), *offsets))
+            fdesc.write(b''.join(blobs))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+class EpgSnapshot:
+    """ Read-only view on a snapshot file of the guide of a channel and day.
+
+    The file is read in one go and closed right away, since an open file or memory map would prevent replacing or removing it on Windows. A
+    record is only decoded when it is accessed, and a string on first use. The start times and durations can be read as columns, without
+    decoding the records.
+    """
+
+    def __init__(self, path):
+        """
+        :param str path:  The path of the snapshot file.
+        """
+        with open(path, 'rb') as fdesc:
+            self._data = fdesc.read()
+            # The modification date of the file we have read, even when it is replaced in the mean time
+            self.mtime = os.fstat(fdesc.fileno()).st_mtime_ns
+        magic, version, self._count, strings = HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a supported EPG snapshot')
+        self._offsets = HEADER.size + self._count * RECORD.size
+        self._blob = self._offsets + (strings + 1) * OFFSET.size
+        self._string_offsets = array('I', self._data[self._offsets:self._blob])
+        if sys.byteorder == 'big':
+            self._string_offsets.byteswap()
+        self._strings = [None] * strings
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx):
+        """ Decode a record, with the values in the order of EPG_FIELDS.
+        :type idx: int
+        :rtype tuple
+        """
+        if not -self._count <= idx < self._count:
+            raise IndexError('record index out of range')
+        return self._decode(RECORD.unpack_from(self._data, HEADER.size + (idx % self._count) * RECORD.size))
+
+    def __iter__(self):
+        """ Decode all records, with the values in the order of EPG_FIELDS.
+        :rtype Iterator[tuple]
+        """
+        for values in RECORD.iter_unpack(memoryview(self._data)[HEADER.size:self._offsets]):
+            yield self._decode(values)
+
+    def _decode(self, values):
+        """ Decode the values of a record.
+        :type values: tuple
+        :rtype tuple
+        """
+        start, won_id, won_program_id, duration, number, flags, mask, *refs = values
+        string = self._string
+        if mask:
+            refs = [(ref, mask & (1 << bit)) for bit, ref in enumerate(refs)]
+            string = self._value
+        return (
+            string(refs[0]),
+            string(refs[1]),
+            string(refs[2]),
+            None if flags & NO_NUMBER else number,
+            string(refs[3]),
+            string(refs[4]),
+            None if flags & NO_START else start,
+            None if flags & NO_WON_ID else won_id,
+            None if flags & NO_WON_PROGRAM_ID else won_program_id,
+            string(refs[5]),
+            string(refs[6]),
+            None if flags & NO_DURATION else duration,
+            string(refs[7]),
+            string(refs[8]),
+            string(refs[9]),
+        )
+
+    def columns(self):
+        """ Return the positions, start times and durations of the records that have a start time, without decoding the records. A record
+        without a duration has a duration of 0.
+        :rtype tuple[array, array, array]
+        """
+        positions, starts, durations = array('l'), array('q'), array('q')
+        for pos, values in enumerate(RECORD.iter_unpack(memoryview(self._data)[HEADER.size:self._offsets])):
+            if not values[5] & NO_START:
+                positions.append(pos)
+                starts.append(values[0])
+                durations.append(0 if values[5] & NO_DURATION else values[3])
+        return positions, starts, durations
+
+    def _string(self, ref):
+        """ Decode a string from the string table.
+        :type ref: int
+        :rtype str
+        """
+        if ref == NO_STRING:
+            return None
+        value = self._strings[ref]
+        if value is None:
+            start, end = self._string_offsets[ref], self._string_offsets[ref + 1]
+            value = self._strings[ref] = self._data[self._blob + start:self._blob + end].decode('utf-8')
+        return value
+
+    def _value(self, ref):
+        """ Decode a value from the string table, that was stored as JSON when it is marked in the JSON mask.
+        :type ref: tuple[int, int]
+        :rtype any
+        """
+        value = self._string(ref[0])
+        if ref[1] and value is not None:
+            return json.loads(value)
+        return value
+
+    def close(self):
+        """ Release the data of the snapshot """
+        self._data = b''
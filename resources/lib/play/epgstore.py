@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+""" Persistent store of the EPG """
+
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+
+from resources.lib.play.epgsnapshot import EpgSnapshot, write_snapshot
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class EpgStore:
+    """ Persistent store of the EPG, with a file per channel and day.
+
+    The guide of a day that has passed won't change anymore, so it can be kept until it falls out of the guide. The guide of today can still
+    change, and is refreshed often. The guide of the coming days is refreshed a few times a day.
+    """
+
+    PAST_TTL = 30 * 24 * 60 * 60
+    TODAY_TTL = 15 * 60
+    FUTURE_TTL = 6 * 60 * 60
+
+    def __init__(self, cache_path):
+        """
+        :param str cache_path:  The path where the guide files are stored.
+        """
+        self._cache_path = cache_path
+
+    @classmethod
+    def ttl(cls, date):
+        """ Return how long the guide of the specified day can be kept.
+        :type date: str
+        :rtype int
+        """
+        today = datetime.today().strftime('%Y-%m-%d')
+        if date < today:
+            return cls.PAST_TTL
+        if date == today:
+            return cls.TODAY_TTL
+        return cls.FUTURE_TTL
+
+    def _path(self, channel, date, extension='bin'):
+        """ Return the path of the guide file of a channel and day.
+        :type channel: str
+        :type date: str
+        :type extension: str
+        :rtype str
+        """
+        return os.path.join(self._cache_path, ('epg.%s.%s.%s' % (channel, date, extension)).replace('/', '_'))
+
+    def get(self, channel, date, allow_expired=False):
+        """ Return the stored records of a channel and day, or None when we have nothing (valid) stored. The records are read from a
+        snapshot, and are only decoded when they are accessed.
+        :type channel: str
+        :type date: str
+        :type allow_expired: bool
+        :rtype EpgSnapshot
+        """
+        fullpath = self._path(channel, date)
+        if not os.path.exists(fullpath):
+            return None
+
+        if not allow_expired and os.stat(fullpath).st_mtime < time.time():
+            return None
+
+        try:
+            _LOGGER.debug('Fetching guide of %s on %s from cache', channel, date)
+            return EpgSnapshot(fullpath)
+        except (ValueError, OSError, struct.error):
+            return None
+
+    def mtime(self, channel, date):
+        """ Return the modification date in nanoseconds of the stored guide of a channel and day, or None when we have nothing stored. It
+        changes every time the day is written, so it identifies the version of the guide.
+        :type channel: str
+        :type date: str
+        :rtype int
+        """
+        try:
+            return os.stat(self._path(channel, date)).st_mtime_ns
+        except OSError:
+            return None
+
+    def set(self, channel, date, records):
+        """ Store the records of a channel and day, and return the modification date of the new version.
+        :type channel: str
+        :type date: str
+        :type records: list[tuple]
+        :rtype int
+        """
+        if not os.path.exists(self._cache_path):
+            os.makedirs(self._cache_path)
+
+        fullpath = self._path(channel, date)
+        _LOGGER.debug('Storing guide of %s on %s to cache', channel, date)
+        write_snapshot(fullpath, records)
+
+        # Set TTL by modifying modification date
+        deadline = time.time_ns() + self.ttl(date) * 10 ** 9
+        os.utime(fullpath, ns=(deadline, deadline))
+        return deadline
+
+    def get_fragment(self, channel, date, extension):
+        """ Return a fragment that was rendered from the stored guide of a channel and day, or None when the guide has expired or has changed
+        since the fragment was rendered.
+        :type channel: str
+        :type date: str
+        :type extension: str
+        :rtype str
+        """
+        fullpath = self._path(channel, date, extension)
+        if not os.path.exists(fullpath):
+            return None
+
+        # A fragment has the same modification date as the guide it was rendered from
+        mtime = os.stat(fullpath).st_mtime_ns
+        if mtime < time.time_ns() or mtime != self.mtime(channel, date):
+            return None
+
+        with open(fullpath, 'r', encoding='utf-8') as fdesc:
+            return fdesc.read()
+
+    def set_fragment(self, channel, date, extension, fragment, version):
+        """ Store a fragment that was rendered from the stored guide of a channel and day.
+        :param str channel:     The channel.
+        :param str date:        The day.
+        :param str extension:   The extension of the fragment file.
+        :param str fragment:    The rendered fragment.
+        :param int version:     The modification date of the stored guide that the fragment was rendered from.
+        """
+        fullpath = self._path(channel, date, extension)
+        tmp_path = '%s.%d.tmp' % (fullpath, os.getpid())
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fdesc:
+                fdesc.write(fragment)
+            os.utime(tmp_path, ns=(version, version))
+            os.replace(tmp_path, fullpath)
+        except OSError as exc:
+            _LOGGER.warning('Could not store the %s fragment of %s on %s: %s', extension, channel, date, exc)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def purge(self, dates):
+        """ Remove the stored guide and fragments of all days that are not in the specified dates, and any temporary files they left.
+        :type dates: list[str]
+        """
+        if not os.path.exists(self._cache_path):
+            return
+
+        keep = set(dates)
+        for filename in os.listdir(self._cache_path):
+            parts = filename.split('.')
+            if len(parts) >= 4 and parts[0] == 'epg' and parts[2] not in keep:
+                _LOGGER.debug('Removing guide of %s on %s from cache', parts[1], parts[2])
+                os.remove(os.path.join(self._cache_path, filename))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+""" Incremental parser for the Next.js flight payload """
+
+import json
+
+
+def _undefined_to_none(obj):
+    """ React encodes undefined as the string '$undefined', we want None. """
+    for key, value in obj.items():
+        if value == '$undefined':
+            obj[key] = None
+    return obj
+
+
+class FlightParser:
+    """ Incremental parser for the React Server Components (flight) payload that Next.js embeds in a page.
+
+    The page contains a list of `<script>self.__next_f.push([1,"..."])</script>` tags. Together, the strings in these pushes form the flight
+    stream. We feed the page in chunks as it is downloaded, decode every push as JSON, and look for the objects we need in the flight stream
+    while it grows. Both buffers are only scanned once, and are compacted after every feed.
+    """
+
+    PUSH_MARKER = 'self.__next_f.push('
+    PUSH_END = '</script>'
+    ROW_END = '\n'
+
+    def __init__(self, marker='{"program":'):
+        """
+        :param str marker:  The start of the objects to extract from the flight stream.
+        """
+        self._marker = marker
+        self._decoder = json.JSONDecoder(object_hook=_undefined_to_none)
+        self._html = ''
+        self._flight = ''
+
+    def feed(self, text):
+        """ Feed a chunk of the page, and return the objects that are now complete.
+        :type text: str
+        :rtype list[dict]
+        """
+        self._html += text
+        objects = []
+        pos = 0
+        while True:
+            start = self._html.find(self.PUSH_MARKER, pos)
+            if start == -1:
+                # Keep enough to find a marker that is split over two chunks
+                pos = max(pos, len(self._html) - len(self.PUSH_MARKER) + 1)
+                break
+            try:
+                value, pos = self._decoder.raw_decode(self._html, start + len(self.PUSH_MARKER))
+            except ValueError:
+                if self._html.find(self.PUSH_END, start) == -1:
+                    # The push is not complete yet, wait for more data
+                    pos = start
+                    break
+                # The push is complete, but malformed. Skip it.
+                pos = start + len(self.PUSH_MARKER)
+                continue
+            if isinstance(value, list) and len(value) > 1 and value[0] == 1 and isinstance(value[1], str):
+                objects.extend(self._feed_flight(value[1]))
+        self._html = self._html[pos:]
+        return objects
+
+    def _feed_flight(self, chunk):
+        """ Feed a chunk of the flight stream, and return the objects that are now complete.
+        :type chunk: str
+        :rtype list[dict]
+        """
+        self._flight += chunk
+        objects = []
+        pos = 0
+        while True:
+            start = self._flight.find(self._marker, pos)
+            if start == -1:
+                # Keep enough to find a marker that is split over two chunks
+                pos = max(pos, len(self._flight) - len(self._marker) + 1)
+                break
+            try:
+                value, pos = self._decoder.raw_decode(self._flight, start)
+            except ValueError:
+                if self._flight.find(self.ROW_END, start) == -1:
+                    # The row is not complete yet, wait for more data
+                    pos = start
+                    break
+                # The row is complete, but malformed. Skip it.
+                pos = start + len(self._marker)
+                continue
+            objects.append(value)
+        self._flight = self._flight[pos:]
+        return objects
+
+
+def parse_flight(html, marker='{"program":'):
+    """ Extract all objects that start with the marker from the flight payload of a complete page.
+    :type html: str
+    :type marker: str
+    :rtype list[dict]
+    """
+    return FlightParser(marker).feed(html)
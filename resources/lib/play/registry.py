@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+""" Shared API instances.
+
+With reuselanguageinvoker, the interpreter and this module are kept between invocations of the plugin, so the token state of
+the AuthApi only needs to be loaded once. The instances are keyed by a hash of the credentials and the paths, so they are
+replaced as soon as the settings change.
+
+The threads of the service share the instances as well. The ContentApi keeps no state in memory that changes after it is created:
+the requests session is kept per thread, and the cache files are replaced in one go. The tokens of the AuthApi are refreshed
+under its lock.
+"""
+
+import hashlib
+import logging
+import threading
+
+from resources.lib import kodiutils
+from resources.lib.play.auth import AuthApi
+from resources.lib.play.content import ContentApi
+
+_LOGGER = logging.getLogger(__name__)
+
+_LOCK = threading.Lock()
+_INSTANCES = {}
+
+
+def _get_key():
+    """ Return a hash of the settings the API instances depend on.
+    :rtype str
+    """
+    return hashlib.md5('\0'.join([
+        kodiutils.get_setting('username'),
+        kodiutils.get_setting('password'),
+        kodiutils.get_tokens_path(),
+        kodiutils.get_cache_path(),
+    ]).encode('utf-8')).hexdigest()
+
+
+def _get_instances():
+    """ Return the AuthApi and ContentApi for the current settings, and create them when needed.
+    :rtype tuple[AuthApi, ContentApi]
+    """
+    key = _get_key()
+    with _LOCK:
+        instances = _INSTANCES.get(key)
+        if instances is None:
+            if _INSTANCES:
+                _LOGGER.debug('Settings have changed, replacing the API instances')
+                _INSTANCES.clear()
+            auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path(), token_server=True)
+            instances = _INSTANCES[key] = (auth, ContentApi(auth, cache_path=kodiutils.get_cache_path()))
+        return instances
+
+
+def get_auth_api():
+    """ Return the shared AuthApi.
+    :rtype AuthApi
+    """
+    return _get_instances()[0]
+
+
+def get_content_api():
+    """ Return the shared ContentApi.
+    :rtype ContentApi
+    """
+    return _get_instances()[1]
+
+
+def invalidate():
+    """ Forget the shared instances, so the next call creates new ones. """
+    with _LOCK:
+        _INSTANCES.clear()
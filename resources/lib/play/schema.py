@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+""" Schema-driven extraction of the data model from the API JSON """
+
+
+class Field:
+    """ Defines how a field of a data model object is extracted from a JSON object. """
+
+    __slots__ = ('name', 'path', 'convert', 'lazy')
+
+    def __init__(self, name, path, convert=None, lazy=False):
+        """
+        :param str name:            The name of the field in the data model.
+        :param str|tuple path:      The key, or a tuple of keys and list indexes, to get the value from the JSON object.
+        :param callable convert:    An optional function to convert the raw value.
+        :param bool lazy:           Whether this field is only converted when a lazy data model object accesses it.
+        """
+        self.name = name
+        self.path = path if isinstance(path, tuple) else (path,)
+        self.convert = convert
+        self.lazy = lazy
+
+
+class Schema:
+    """ Extracts the fields of a data model object from a JSON object in a single walk.
+
+    The paths of all fields are compiled into a plan up front, so a nested object like `dates` or `images` is only looked up once, no matter how
+    many fields are extracted from it.
+    """
+
+    def __init__(self, model, fields, lazy_model=None):
+        """
+        :param type model:          The data model class to build.
+        :param list[Field] fields:  The fields to extract.
+        :param type lazy_model:     The data model class to build in lazy mode. It gets the raw values of the lazy fields and their
+                                    converters as first arguments.
+        """
+        self.model = model
+        self.lazy_model = lazy_model
+        self._plan = self._compile(fields, 0)
+        # In lazy mode, the lazy fields are extracted in the same walk, but without converting them
+        self._lazy_plan = self._compile([Field(field.name, field.path) if field.lazy else field for field in fields], 0)
+        self._lazy_converters = {field.name: field.convert for field in fields if field.lazy}
+
+    @classmethod
+    def _compile(cls, fields, depth):
+        """ Compile the fields into a plan: a tuple of (key, plain fields, converted fields, child plan) steps. """
+        steps = {}
+        for field in fields:
+            key = field.path[depth]
+            step = steps.setdefault(key, ([], [], []))
+            if len(field.path) == depth + 1:
+                if field.convert:
+                    step[1].append((field.name, field.convert))
+                else:
+                    step[0].append(field.name)
+            else:
+                step[2].append(field)
+        return tuple(
+            (key, tuple(plain), tuple(converted), cls._compile(children, depth + 1) if children else None)
+            for key, (plain, converted, children) in steps.items()
+        )
+
+    def extract(self, data):
+        """ Extract the fields from the JSON object.
+        :type data: dict
+        :rtype dict
+        """
+        result = {}
+        self._run(self._plan, data, result)
+        return result
+
+    def build(self, data, lazy=False, **kwargs):
+        """ Build a data model object from the JSON object. Additional keyword arguments are passed on to the data model.
+        :type data: dict
+        :type lazy: bool
+        """
+        if lazy and self.lazy_model is not None:
+            self._run(self._lazy_plan, data, kwargs)
+            raw = {name: kwargs.pop(name) for name in self._lazy_converters}
+            return self.lazy_model(raw, self._lazy_converters, **kwargs)
+        self._run(self._plan, data, kwargs)
+        return self.model(**kwargs)
+
+    def restore(self, fields, raw):
+        """ Build a data model object again from the fields that were extracted before, and the raw values of the lazy fields that were not
+        converted yet.
+        :type fields: dict
+        :type raw: dict
+        """
+        if raw and self.lazy_model is not None:
+            return self.lazy_model(raw, self._lazy_converters, **fields)
+        return self.model(**fields)
+
+    @classmethod
+    def _run(cls, plan, data, result):
+        """ Run the plan over the JSON object, and extract every value exactly once. """
+        for key, plain, converted, children in plan:
+            if isinstance(data, dict):
+                value = data.get(key)
+            elif isinstance(data, list) and isinstance(key, int) and -len(data) <= key < len(data):
+                value = data[key]
+            else:
+                value = None
+            for name in plain:
+                result[name] = value
+            for name, convert in converted:
+                result[name] = convert(value)
+            if children:
+                cls._run(children, value, result)
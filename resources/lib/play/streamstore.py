@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+""" Short lived store of resolved streams """
+
+import base64
+import binascii
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone
+from urllib.parse import unquote
+
+from resources.lib.play import ResolvedStream
+
+_LOGGER = logging.getLogger(__name__)
+
+_URL_EXPIRY = re.compile(r'(?:^|[?&~;/=])(?:exp|expires|expiry|expiration)=(\d{10,13})\b', re.I)
+_LICENSE_EXPIRY = re.compile(r'<ExpirationTime>([^<]+)</ExpirationTime>', re.I)
+
+
+def parse_time(value):
+    """ Parse a UTC time like '2024-01-31 12:00:00.000' or '2024-01-31T12:00:00Z' to an epoch timestamp.
+    :type value: str
+    :rtype int
+    """
+    try:
+        return int(datetime.strptime(value.strip().replace('T', ' ')[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp())
+    except (AttributeError, ValueError):
+        return None
+
+
+class StreamStore:
+    """ Store of resolved streams, with a file per video.
+
+    Resolving a stream takes a few round trips, and maybe a license exchange. A restart or resume of the same video can reuse the result,
+    as long as the signed manifest url, the DRM customdata and the ad session remain valid. The service removes a stream when it fails to
+    play.
+
+    The license keys of a stream are stored as well, in plaintext. An expired stream is removed when it is read, and the service purges the
+    ones that are never read again.
+    """
+
+    TTL = 10 * 60  # Keep a resolved stream for at most this number of seconds
+    EXPIRY_MARGIN = 2 * 60  # Stop using a resolved stream this number of seconds before its manifest url expires
+    TMP_AGE = 60  # A temporary file that was not moved into place after this number of seconds was left behind
+
+    def __init__(self, cache_path):
+        """
+        :param str cache_path:  The path where the stream files are stored, or None to store nothing.
+        """
+        self._cache_path = cache_path
+
+    @classmethod
+    def ttl(cls, stream, expiry=None):
+        """ Return how long a resolved stream can be kept, based on the expiry in its signed manifest url and in its DRM customdata.
+        :param ResolvedStream stream:   The resolved stream.
+        :param int expiry:              The end of the ad session of the stream, if it has one.
+        :rtype int
+        """
+        # The expiry in the url can be in milliseconds
+        expiries = [value // 1000 if value > 10 ** 12 else value for value in map(int, _URL_EXPIRY.findall(unquote(stream.url)))]
+        expiries.append(cls._license_expiry(stream.license_headers))
+        expiries.append(expiry)
+        expiries = [value for value in expiries if value]
+        if not expiries:
+            return cls.TTL
+
+        return min(cls.TTL, min(expiries) - int(time.time()) - cls.EXPIRY_MARGIN)
+
+    @staticmethod
+    def _license_expiry(license_headers):
+        """ Return the expiry of the KeyOS authentication XML in the customdata of the license request, if it has one.
+        :type license_headers: dict
+        :rtype int
+        """
+        customdata = (license_headers or {}).get('customdata')
+        if not customdata:
+            return None
+
+        # The authentication XML is usually base64 encoded
+        try:
+            customdata = base64.b64decode(customdata, validate=True).decode('utf-8')
+        except (binascii.Error, UnicodeDecodeError):
+            pass
+
+        match = _LICENSE_EXPIRY.search(customdata)
+        return parse_time(match.group(1)) if match else None
+
+    def _path(self, uuid, content_type):
+        """ Return the path of the stream file of a video.
+        :type uuid: str
+        :type content_type: str
+        :rtype str
+        """
+        return os.path.join(self._cache_path, ('stream.%s.%s.json' % (uuid, content_type)).replace('/', '_'))
+
+    def get(self, uuid, content_type):
+        """ Return the resolved stream of a video, or None when we have no valid one.
+        :type uuid: str
+        :type content_type: str
+        :rtype ResolvedStream
+        """
+        if not self._cache_path:
+            return None
+
+        path = self._path(uuid, content_type)
+        try:
+            if os.stat(path).st_mtime < time.time():
+                os.unlink(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as fdesc:
+                data = json.load(fdesc)
+        except (OSError, ValueError):
+            return None
+
+        _LOGGER.debug('Got the stream of %s from the store', uuid)
+        return ResolvedStream(**data)
+
+    def set(self, content_type, stream, expiry=None):
+        """ Store the resolved stream of a video, if it remains valid long enough.
+        :param str content_type:        The content type of the video.
+        :param ResolvedStream stream:   The resolved stream.
+        :param int expiry:              The end of the ad session of the stream, if it has one.
+        """
+        if not self._cache_path:
+            return
+        ttl = self.ttl(stream, expiry)
+        if ttl <= 0:
+            return
+
+        path = self._path(stream.uuid, content_type)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            if not os.path.exists(self._cache_path):
+                os.makedirs(self._cache_path)
+            with open(tmp_path, 'w', encoding='utf-8') as fdesc:
+                json.dump({field: getattr(stream, field) for field in ResolvedStream.__slots__}, fdesc)
+            # Set TTL by modifying modification date
+            deadline = int(time.time()) + ttl
+            os.utime(tmp_path, (deadline, deadline))
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            _LOGGER.warning('Could not store the stream of %s: %s', stream.uuid, exc)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def remove(self, uuid, content_type):
+        """ Remove the resolved stream of a video.
+        :type uuid: str
+        :type content_type: str
+        """
+        if not self._cache_path:
+            return
+
+        try:
+            os.unlink(self._path(uuid, content_type))
+        except FileNotFoundError:
+            pass
+
+    def purge(self):
+        """ Remove the streams that have expired, and the temporary files that were left behind, so their license keys don't stay on disk """
+        if not self._cache_path or not os.path.exists(self._cache_path):
+            return
+
+        now = time.time()
+        for filename in os.listdir(self._cache_path):
+            if not filename.startswith('stream.'):
+                continue
+            path = os.path.join(self._cache_path, filename)
+            try:
+                stat = os.stat(path)
+                # The modification date of a stream is its deadline, a temporary file can have it already as well
+                if filename.endswith('.json') and stat.st_mtime < now or filename.endswith('.tmp') and stat.st_ctime < now - self.TMP_AGE:
+                    _LOGGER.debug('Removing stream %s from cache', filename)
+                    os.unlink(path)
+            except OSError:
+                pass
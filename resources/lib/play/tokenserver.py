@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+""" Token server.
+
+The background service keeps the authoritative id token in memory and hands it to the plugin over a loopback socket, so the
+plugin doesn't need to read the token file or refresh the token itself. The service writes the port and a random secret to a
+file next to the token file, that only the user can read, and removes it when it stops.
+
+Requests and replies are signed with the secret, so the server only answers the plugin, and the plugin doesn't take a token
+from another process that took over the port. The token itself is not encrypted. Other users can't read the loopback traffic,
+and every add-on runs as the same user as this one, so it could read the token file as well. This is no boundary against other
+add-ons, and isn't meant to be one.
+"""
+
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from resources.lib import kodiutils
+
+_LOGGER = logging.getLogger(__name__)
+
+ADDRESS_FILE = 'auth-server.json'
+TIMEOUT = 0.25  # The server replies from memory, so it answers right away or not at all
+RETRY_INTERVAL = 60  # Don't ask the server again for this number of seconds when it didn't answer
+
+_SERVING = threading.Event()
+_RETRY_AFTER = [0]
+
+
+def _mac(secret, *parts):
+    """ Sign the parts of a message.
+    :type secret: bytes
+    :rtype str
+    """
+    return hmac.new(secret, '\0'.join(str(part) for part in parts).encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def _read_message(conn):
+    """ Read a JSON message of one line from a socket.
+    :type conn: socket.socket
+    :rtype dict
+    """
+    data = b''
+    while not data.endswith(b'\n'):
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data.decode('utf-8'))
+
+
+def _write_message(conn, message):
+    """ Write a JSON message of one line to a socket.
+    :type conn: socket.socket
+    :type message: dict
+    """
+    conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def is_serving():
+    """ Return whether this process runs the token server, so its tokens are the authoritative ones.
+    :rtype bool
+    """
+    return _SERVING.is_set()
+
+
+class TokenServer(threading.Thread):
+    """ Serve id tokens on a loopback socket """
+
+    def __init__(self, get_auth):
+        """ Initialise object
+        :param callable get_auth:   Returns the AuthApi that holds the tokens.
+        """
+        threading.Thread.__init__(self, name='TokenServer', daemon=True)
+        self._get_auth = get_auth
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(8)
+        self._socket.settimeout(TIMEOUT)
+        self._abort = threading.Event()
+        self._published = None
+        self.port = self._socket.getsockname()[1]
+        self.secret = os.urandom(32)
+
+    def publish(self, path):
+        """ Write our port and secret to the address file in a path, so the plugin can find us.
+        :type path: str
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        fullpath = os.path.join(path, ADDRESS_FILE)
+        tmp_path = '%s.%d.tmp' % (fullpath, os.getpid())
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as fdesc:
+            json.dump({'port': self.port, 'secret': binascii.hexlify(self.secret).decode('ascii')}, fdesc)
+        os.replace(tmp_path, fullpath)
+        self._published = fullpath
+
+    def run(self):
+        """ Accept connections until we are stopped """
+        _SERVING.set()
+        try:
+            while not self._abort.is_set():
+                try:
+                    conn, _ = self._socket.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    conn.settimeout(TIMEOUT)
+                    try:
+                        self._handle(conn)
+                    except (OSError, ValueError) as exc:
+                        _LOGGER.warning('Could not serve a token: %s', exc)
+        finally:
+            _SERVING.clear()
+            self._socket.close()
+
+    def stop(self):
+        """ Stop serving, and remove the address file """
+        self._abort.set()
+        if self._published and os.path.exists(self._published):
+            os.unlink(self._published)
+
+    def _handle(self, conn):
+        """ Handle one request for a token. We only hand out the token we have in memory, and never wait for the network here, since we
+        handle one request at a time. The service refreshes the token before it expires.
+        :type conn: socket.socket
+        """
+        request = _read_message(conn)
+        if not hmac.compare_digest(request.get('mac', ''), _mac(self.secret, request.get('nonce'), request.get('username'), request.get('margin'))):
+            _LOGGER.warning('Refusing a token request with an invalid signature')
+            return
+
+        auth = self._get_auth()
+        if auth.username != request.get('username'):
+            _write_message(conn, {'error': 'unknown user'})
+            return
+
+        id_token = auth.get_cached_token(margin=int(request.get('margin')))
+        if not id_token:
+            _write_message(conn, {'error': 'no valid token'})
+            return
+
+        nonce = '%s:%s' % (request.get('nonce'), binascii.hexlify(os.urandom(16)).decode('ascii'))
+        _write_message(conn, {
+            'nonce': nonce,
+            'token': id_token,
+            'expiry': auth.expiry,
+            'mac': _mac(self.secret, nonce, id_token, auth.expiry),
+        })
+
+
+def request_token(port, secret, username, margin):
+    """ Request an id token from the token server.
+    :param int port:        The port of the server.
+    :param bytes secret:    The secret of the server.
+    :param str username:    The user we need a token for.
+    :param int margin:      The number of seconds that the token should at least remain valid.
+    :returns:               The id token and its expiry, or None when the server can't give us one.
+    :rtype tuple[str, int]
+    """
+    nonce = binascii.hexlify(os.urandom(16)).decode('ascii')
+
+    with socket.create_connection(('127.0.0.1', port), timeout=TIMEOUT) as conn:
+        _write_message(conn, {
+            'nonce': nonce,
+            'username': username,
+            'margin': margin,
+            'mac': _mac(secret, nonce, username, margin),
+        })
+        reply = _read_message(conn)
+
+    if reply.get('error'):
+        _LOGGER.debug('The token server could not give us a token: %s', reply.get('error'))
+        return None
+
+    # The nonce of the reply must extend ours, so an old reply can't be replayed
+    if not reply.get('nonce', '').startswith(nonce + ':') \
+            or not hmac.compare_digest(reply.get('mac', ''), _mac(secret, reply.get('nonce'), reply.get('token'), reply.get('expiry'))):
+        _LOGGER.warning('Ignoring a token with an invalid signature')
+        return None
+
+    return reply.get('token'), int(reply.get('expiry'))
+
+
+def fetch_token(username, margin):
+    """ Request an id token from the token server of the background service, if it runs. When the server doesn't answer, we don't ask
+    it again for RETRY_INTERVAL.
+    :param str username:    The user we need a token for.
+    :param int margin:      The number of seconds that the token should at least remain valid.
+    :rtype tuple[str, int]
+    """
+    if is_serving() or time.time() < _RETRY_AFTER[0]:
+        # We are the service ourselves, or it didn't answer a moment ago
+        return None
+
+    try:
+        with open(os.path.join(kodiutils.get_tokens_path(), ADDRESS_FILE), 'r', encoding='utf-8') as fdesc:
+            address = json.load(fdesc)
+    except (OSError, ValueError):
+        # The service doesn't run
+        return None
+
+    try:
+        return request_token(int(address['port']), binascii.unhexlify(address['secret']), username, margin)
+    except (KeyError, OSError, TypeError, ValueError) as exc:
+        _LOGGER.debug('Could not reach the token server: %s', exc)
+        _RETRY_AFTER[0] = time.time() + RETRY_INTERVAL
+        return None
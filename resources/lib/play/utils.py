@@ -2,6 +2,8 @@
 """ UTILS """
 
 import logging
+import threading
+
 import requests
 
 from resources.lib import kodiutils
@@ -9,9 +11,21 @@ from resources.lib.play.exceptions import ApiException, GeoblockedException
 
 _LOGGER = logging.getLogger(__name__)
 
-SESSION = requests.session()
 PROXIES = kodiutils.get_proxies()
 
+_LOCAL = threading.local()
+
+
+def get_session():
+    """ Returns the requests session of the current thread. A session is not safe to share between threads, and the shared API
+    instances are used from several threads of the service.
+    :rtype requests.Session
+    """
+    session = getattr(_LOCAL, 'session', None)
+    if session is None:
+        session = _LOCAL.session = requests.session()
+    return session
+
 def handle_error_message(response):
     """ Returns the error message of an Api request.
     :type response: requests.Response Object
@@ -37,11 +51,11 @@ def get_url(url, params=None, headers=None, authentication=None):
     """
     try:
         if authentication:
-            response = SESSION.get(url, params=params, headers={
+            response = get_session().get(url, params=params, headers={
                 'authorization': authentication,
             }, proxies=PROXIES)
         else:
-            response = SESSION.get(url, params=params, headers=headers, proxies=PROXIES)
+            response = get_session().get(url, params=params, headers=headers, proxies=PROXIES)
         response.raise_for_status()
     except requests.exceptions.HTTPError:
         handle_error_message(response)
@@ -57,11 +71,11 @@ def post_url(url, params=None, headers=None, data=None, authentication=None):
     """
     try:
         if authentication:
-            response = SESSION.post(url, params=params, json=data, headers={
+            response = get_session().post(url, params=params, json=data, headers={
                 'authorization': authentication,
             }, proxies=PROXIES)
         else:
-            response = SESSION.post(url, params=params, headers=headers, data=data, proxies=PROXIES)
+            response = get_session().post(url, params=params, headers=headers, data=data, proxies=PROXIES)
         response.raise_for_status()
     except requests.exceptions.HTTPError:
         handle_error_message(response)
@@ -77,11 +91,11 @@ def put_url(url, params=None, headers=None, data=None, authentication=None):
     """
     try:
         if authentication:
-            response = SESSION.put(url, params=params, json=data, headers={
+            response = get_session().put(url, params=params, json=data, headers={
                 'authorization': authentication,
             }, proxies=PROXIES)
         else:
-            response = SESSION.put(url, params=params, headers=headers, json=data, proxies=PROXIES)
+            response = get_session().put(url, params=params, headers=headers, json=data, proxies=PROXIES)
         response.raise_for_status()
     except requests.exceptions.HTTPError:
         handle_error_message(response)
@@ -97,11 +111,11 @@ def delete_url(url, params=None, headers=None, authentication=None):
     """
     try:
         if authentication:
-            response = SESSION.delete(url, params=params, headers={
+            response = get_session().delete(url, params=params, headers={
                 'authorization': authentication,
             }, proxies=PROXIES)
         else:
-            response = SESSION.delete(url, params=params, headers=headers, proxies=PROXIES)
+            response = get_session().delete(url, params=params, headers=headers, proxies=PROXIES)
         response.raise_for_status()
     except requests.exceptions.HTTPError:
         handle_error_message(response)
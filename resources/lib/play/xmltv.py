@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+""" Incremental XMLTV writer """
+
+from datetime import timedelta
+from xml.sax.saxutils import escape, quoteattr
+
+XMLTV_DATE_FORMAT = '%Y%m%d%H%M%S %z'
+
+
+class XmltvWriter:
+    """ Writes an XMLTV document element by element to a text file, so the guide never needs to be built in memory as a tree. """
+
+    def __init__(self, fdesc, generator='plugin.video.play'):
+        """
+        :param fdesc:           A file object that is opened for writing text.
+        :param str generator:   The name of the generator of the document.
+        """
+        self._fdesc = fdesc
+        self._generator = generator
+
+    def __enter__(self):
+        self._fdesc.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE tv SYSTEM "xmltv.dtd">\n')
+        self._fdesc.write('<tv generator-info-name=%s>\n' % quoteattr(self._generator))
+        return self
+
+    def __exit__(self, *args):
+        self._fdesc.write('</tv>\n')
+
+    def write_channel(self, channel_id, name, icon=None):
+        """ Write a channel element.
+        :type channel_id: str
+        :type name: str
+        :type icon: str
+        """
+        self._fdesc.write('<channel id=%s>\n<display-name>%s</display-name>\n' % (quoteattr(channel_id), escape(name)))
+        if icon:
+            self._fdesc.write('<icon src=%s/>\n' % quoteattr(icon))
+        self._fdesc.write('</channel>\n')
+
+    def write(self, fragment):
+        """ Write a fragment that was rendered with render_programmes.
+        :type fragment: str
+        """
+        self._fdesc.write(fragment)
+
+
+def render_programmes(channel_id, programs, lang='nl'):
+    """ Render the programme elements of a list of programs.
+    :type channel_id: str
+    :type programs: list[resources.lib.play.epg.EpgProgram]
+    :type lang: str
+    :rtype str
+    """
+    lang = quoteattr(lang)
+    parts = []
+    for program in programs:
+        if not program.duration:
+            continue
+        parts.append('<programme start="%s" stop="%s" channel=%s>\n<title lang=%s>%s</title>\n' % (
+            program.start.strftime(XMLTV_DATE_FORMAT),
+            (program.start + timedelta(seconds=program.duration)).strftime(XMLTV_DATE_FORMAT),
+            quoteattr(channel_id),
+            lang,
+            escape(program.program_title or ''),
+        ))
+        if program.episode_title:
+            parts.append('<sub-title lang=%s>%s</sub-title>\n' % (lang, escape(program.episode_title)))
+        if program.description or program.program_description:
+            parts.append('<desc lang=%s>%s</desc>\n' % (lang, escape(program.description or program.program_description)))
+        if program.genre:
+            parts.append('<category lang=%s>%s</category>\n' % (lang, escape(program.genre)))
+        if program.thumb:
+            parts.append('<icon src=%s/>\n' % quoteattr(program.thumb))
+        if program.season and program.number:
+            parts.append('<episode-num system="onscreen">S%sE%s</episode-num>\n' % (escape(str(program.season)), program.number))
+        parts.append('</programme>\n')
+    return ''.join(parts)
@@ -3,13 +3,18 @@
 
 import hashlib
 import logging
+import time
 from threading import Event, Thread
+from urllib.parse import urlparse
 
 from xbmc import Monitor, Player, getInfoLabel
 
 from resources.lib import kodilogging, kodiutils
-from resources.lib.play.auth import AuthApi
-from resources.lib.play.content import ContentApi
+from resources.lib.play import registry, tokenserver
+from resources.lib.play.aws.cognito_idp import SRP_KEY_POOL
+from resources.lib.play.epg import EpgApi
+from resources.lib.play.epgstore import EpgStore
+from resources.lib.play.streamstore import StreamStore
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -21,25 +26,91 @@ class BackgroundService(Monitor):
         Monitor.__init__(self)
         self.update_interval = 24 * 3600  # Every 24 hours
         self.cache_expiry = 30 * 24 * 3600  # One month
-        self._auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path())
+        self.epg_interval = EpgStore.TODAY_TTL  # Every time the guide of today expires
+        self.token_retry_interval = 5 * 60  # Five minutes
+        self.stream_purge_interval = StreamStore.TTL  # Every time a stored stream can have expired
         self._kodiplayer = KodiPlayer()
+        self._epg_thread = None
+        self._epg_refreshed = 0
+        self._token_retry = 0
+        self._streams_purged = 0
 
     def run(self):
         """ Background loop for maintenance tasks """
         _LOGGER.debug('Service started')
 
+        # Serve the tokens we keep in memory to the plugin
+        token_server = tokenserver.TokenServer(registry.get_auth_api)
+        token_server.start()
+        token_server.publish(kodiutils.get_tokens_path())
+
         while not self.abortRequested():
+            # Refresh the token before it expires, so the plugin doesn't have to
+            self._refresh_token()
+
+            # Keep a few keys ready for when we need to log in again
+            if kodiutils.has_credentials():
+                SRP_KEY_POOL.fill()
+
+            # Keep the tv guide up to date
+            if kodiutils.get_setting_bool('epg_refresh') and time.time() >= self._epg_refreshed + self.epg_interval \
+                    and not (self._epg_thread and self._epg_thread.is_alive()):
+                self._epg_refreshed = time.time()
+                self._epg_thread = Thread(target=self._refresh_epg, name='EpgRefresh', daemon=True)
+                self._epg_thread.start()
+
+            # Don't keep the license keys of expired streams on disk
+            if time.time() >= self._streams_purged + self.stream_purge_interval:
+                self._streams_purged = time.time()
+                StreamStore(kodiutils.get_cache_path()).purge()
+
             # Stop when abort requested
             if self.waitForAbort(10):
                 break
 
+        token_server.stop()
         _LOGGER.debug('Service stopped')
 
+    def _refresh_token(self):
+        """ Make sure the token remains valid for at least the configured margin """
+        if not kodiutils.has_credentials() or time.time() < self._token_retry:
+            return
+
+        try:
+            registry.get_auth_api().get_token(margin=kodiutils.get_setting_int('token_refresh_margin', 10) * 60)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning('Could not refresh the token: %s', exc)
+            self._token_retry = time.time() + self.token_retry_interval
+
+    def _refresh_epg(self):
+        """ Refresh the rolling window of the tv guide in the store """
+        if not kodiutils.get_setting('username') or not kodiutils.get_setting('password'):
+            return
+
+        started = time.time()
+        try:
+            channels = registry.get_content_api().get_live_channels(lazy=True)
+            fetched = EpgApi(cache_path=kodiutils.get_cache_path()).refresh_window([channel.title for channel in channels if channel.uuid],
+                                                                                   abort=self.abortRequested)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning('Could not refresh the tv guide: %s', exc)
+            return
+        _LOGGER.debug('Refreshed %d days of the tv guide in %.2f seconds', fetched, time.time() - started)
+
+    def onNotification(self, sender, method, data):  # pylint: disable=invalid-name,unused-argument
+        """ Callback for the notifications that the plugin sends """
+        if sender == kodiutils.addon_id() and method == 'Other.refresh_epg':
+            _LOGGER.debug('Refreshing the tv guide on request')
+            # Refresh in the next iteration of the loop
+            self._epg_refreshed = 0
+
     def onSettingsChanged(self):  # pylint: disable=invalid-name
         """ Callback when a setting has changed """
         if self._has_credentials_changed():
             _LOGGER.debug('Clearing auth tokens due to changed credentials')
-            self._auth.clear_tokens()
+            registry.invalidate()
+            registry.get_auth_api().clear_tokens()
+            self._token_retry = 0
 
             # Refresh container
             kodiutils.container_refresh()
@@ -72,14 +143,15 @@ class KodiPlayer(Player):
         Player.__init__(self)
         self.listen = False
         self.path = None
+        self.listing = None
         self.av_started = False
         self.stream_path = None
-        self._auth = AuthApi(kodiutils.get_setting('username'), kodiutils.get_setting('password'), kodiutils.get_tokens_path())
-        self._api = ContentApi(self._auth, cache_path=kodiutils.get_cache_path())
         self.positionthread = None
         self.quit = Event()
         self.last_pos = None
         self.total = None
+        self.prefetch_percentage = 0
+        self.prefetched = False
 
     def onPlayBackStarted(self):  # pylint: disable=invalid-name
         """Called when user starts playing a file"""
@@ -90,6 +162,8 @@ class KodiPlayer(Player):
             self.listen = False
             return
         _LOGGER.debug('KodiPlayer onPlayBackStarted')
+        # The listing the video was started from, to find the next episode
+        self.listing = getInfoLabel('Container.FolderPath')
         self.av_started = False
         self.stream_path = self.getPlayingFile()
 
@@ -99,6 +173,8 @@ class KodiPlayer(Player):
             return
         _LOGGER.debug('KodiPlayer onAVStarted')
         self.av_started = True
+        self.prefetch_percentage = kodiutils.get_setting_int('prefetch_next', 10)
+        self.prefetched = False
 
         # Only start a single thread
         if not self.positionthread:
@@ -140,6 +216,7 @@ class KodiPlayer(Player):
             return
         _LOGGER.debug('KodiPlayer onPlayBackError')
         self.quit.set()
+        self.invalidate_stream()
 
     def onPlayBackStopped(self):  # pylint: disable=invalid-name
         """Called when user stops Kodi playing a file"""
@@ -148,6 +225,8 @@ class KodiPlayer(Player):
         _LOGGER.debug('KodiPlayer onPlayBackStopped')
         self.quit.set()
         if not self.av_started:
+            self.invalidate_stream()
+
             # Check stream path
             import requests
             response = requests.get(self.stream_path, timeout=5)
@@ -194,16 +273,88 @@ class KodiPlayer(Player):
         except RuntimeError:
             pass
 
+    def get_playing_video(self):
+        """ Return the uuid and content type of the playing video, from the path of the plugin
+        :rtype tuple[str, str]
+        """
+        path = urlparse(self.path).path.split('/')
+        if path[1:3] != ['play', 'catalog'] or len(path) < 4:
+            return None, None
+        return path[3], path[4] if len(path) > 4 else 'video'
+
+    def get_playing_listing(self):
+        """ Return the program or season that the playing video was started from, from the path of the listing
+        :returns: 'program' or 'season', and its uuid
+        :rtype tuple[str, str]
+        """
+        url = urlparse(self.listing or '')
+        path = url.path.split('/')
+        if url.scheme != 'plugin' or url.netloc != kodiutils.addon_id() or path[1:2] != ['catalog']:
+            return None, None
+        if len(path) == 4 and path[2] == 'season':
+            return 'season', path[3]
+        if len(path) == 3 and path[2] not in ('', 'new', 'expiring'):
+            return 'program', path[2]
+        return None, None
+
+    def invalidate_stream(self):
+        """ Forget the resolved stream of the playing video, so the next attempt resolves it again """
+        uuid, content_type = self.get_playing_video()
+        if not uuid:
+            return
+        _LOGGER.debug('KodiPlayer invalidating the stream of %s', uuid)
+        registry.get_content_api().invalidate_stream(uuid, content_type)
+
+    def prefetch_next(self):
+        """ Prepare the stream of the next episode, when we are near the end of the playing video """
+        if self.prefetched or not self.prefetch_percentage or not self.total or not self.last_pos \
+                or self.last_pos < self.total * (100 - self.prefetch_percentage) / 100:
+            return
+        self.prefetched = True
+
+        uuid, _ = self.get_playing_video()
+        kind, listing_uuid = self.get_playing_listing()
+        if not uuid or not kind:
+            return
+        Thread(target=self._prefetch_stream, args=(uuid, kind, listing_uuid), name='PrefetchNext', daemon=True).start()
+
+    @staticmethod
+    def _prefetch_stream(uuid, kind, listing_uuid):
+        """ Resolve the stream of the episode that follows this video in its program or season, so it is stored when the user plays it
+        :param str uuid:            The uuid of the playing video.
+        :param str kind:            Whether the video was started from a 'program' or a 'season'.
+        :param str listing_uuid:    The uuid of that program or season.
+        """
+        api = registry.get_content_api()
+        try:
+            if kind == 'program':
+                program = api.get_program(listing_uuid)
+                seasons = [season.uuid for season in program.seasons.values()] if program and program.seasons else []
+            else:
+                seasons = [listing_uuid]
+
+            # The next episode can be the first one of the next season
+            found = False
+            for season in seasons:
+                for episode in api.get_episodes(season, lazy=True) or []:
+                    if found:
+                        _LOGGER.debug('KodiPlayer preparing the stream of the next episode %s', episode.uuid)
+                        api.get_stream(episode.uuid, episode.content_type)
+                        return
+                    found = episode.uuid == uuid
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            _LOGGER.warning('Could not prepare the next episode: %s', exc)
+
     def update_resume(self):
         """ Update resume position to Play api """
         video_id = self.path.split('/')[-2]
         # When seeking, Kodi Player sometimes returns a position greater than the total time
         if self.last_pos >= self.total:
-            self._api.delete_position(video_id)
-            #self._api.update_position(video_id, 1200)
+            registry.get_content_api().delete_position(video_id)
+            #registry.get_content_api().update_position(video_id, 1200)
             return
         _LOGGER.debug('KodiPlayer video %s set resumetime to %s/%s', video_id, self.last_pos, self.total)
-        self._api.update_position(video_id, int(self.last_pos))
+        registry.get_content_api().update_position(video_id, int(self.last_pos))
 
 
     def stream_position(self):
@@ -212,6 +363,7 @@ class KodiPlayer(Player):
         self.update_total()
         while self.isPlaying() and not self.quit.is_set():
             self.update_position()
+            self.prefetch_next()
             if self.quit.wait(timeout=0.2):
                 break
         self.onPlayerExit()
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+""" Benchmarks
+
+Run a benchmark from the root of the repository, e.g. `python -m tests.benchmarks.bench_models`.
+"""
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+""" Benchmark of the CPU time of the token refresh path in CognitoIdp
+
+Only creating the client is measured, since renewing a token is a single request without any cryptography. This is most relevant on the
+ARM boxes that Kodi often runs on, so run `python -m tests.benchmarks.bench_cognito` on such a box to get representative numbers.
+"""
+
+import base64
+import hashlib
+import json
+import platform
+import shutil
+import tempfile
+import time
+
+from resources.lib.play.auth import AuthApi
+from resources.lib.play.aws import cognito_idp
+from resources.lib.play.aws.cognito_idp import CognitoIdp
+
+
+def legacy_setup(client):
+    """ The SRP setup that CognitoIdp.__init__ did before, as a reference. """
+    client.k = int(hashlib.sha256(bytearray.fromhex('00' + cognito_idp.N_HEX + '0' + cognito_idp.G_HEX)).hexdigest(), 16)
+    client.small_a_value, client.large_a_value = cognito_idp.generate_srp_key()
+
+
+def measure(function, count=50):
+    """ Return the CPU time per call in milliseconds """
+    started = time.process_time()
+    for _ in range(count):
+        function()
+    return (time.process_time() - started) / count * 1000
+
+
+def run():
+    """ Run the benchmark """
+    print('Measuring on %s (%s)' % (platform.machine(), platform.python_implementation()))
+
+    def eager():
+        legacy_setup(CognitoIdp(AuthApi.COGNITO_POOL_ID, AuthApi.COGNITO_CLIENT_ID))
+
+    def lazy():
+        CognitoIdp(AuthApi.COGNITO_POOL_ID, AuthApi.COGNITO_CLIENT_ID)
+
+    print('%-8s %8.3f ms CPU per refresh' % ('eager', measure(eager)))
+    print('%-8s %8.3f ms CPU per refresh' % ('lazy', measure(lazy)))
+
+    # The whole refresh path of AuthApi.get_token, with a refresh that doesn't use the network. The token never remains valid for the
+    # margin, so every call refreshes it.
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': int(time.time()) + 3600}).encode()).decode().rstrip('=')
+
+    class OfflineAuthApi(AuthApi):
+        """ AuthApi with a refresh that doesn't use the network """
+        @staticmethod
+        def _refresh(refresh_token):
+            return 'header.%s.signature' % payload
+
+    token_path = tempfile.mkdtemp()
+    try:
+        auth = OfflineAuthApi('user', 'pass', token_path)
+        auth._refresh_token = 'refresh-token'  # pylint: disable=protected-access
+        print('%-8s %8.3f ms CPU per refresh' % ('get_token', measure(lambda: auth.get_token(margin=7200))))
+    finally:
+        shutil.rmtree(token_path)
+
+    # The calculation of A before the first request of a login, with and without the key pool
+    print('%-8s %8.3f ms CPU per login' % ('no pool', measure(lambda: cognito_idp.SRP_KEY_POOL.take() or cognito_idp.generate_srp_key())))
+    cognito_idp.SRP_KEY_POOL.fill()
+    print('%-8s %8.3f ms CPU per login' % ('pool', measure(cognito_idp.SRP_KEY_POOL.take, count=1)))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+""" Benchmark of extracting the programs from tv-gids pages
+
+Pass a directory with saved guide pages (`*.html`) as first argument, or a synthetic set of pages is used. To save today's guide pages of some
+channels, run `python -m tests.benchmarks.bench_epg <directory> --fetch play4 play5 play6 play7`.
+"""
+
+import ast
+import bisect
+import glob
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+from resources.lib.play.epg import EpgApi
+from resources.lib.play.epgsnapshot import EpgSnapshot, write_snapshot
+from resources.lib.play.flight import parse_flight
+
+
+def legacy_parse_page(response):
+    """ The previous implementation of extracting the programs in EpgApi.get_epg, as a reference. """
+    fragments = re.findall(r'<script>self.__next_f.push\((?P<fragment>.*?)\)<\/script>', response, re.DOTALL)
+    programs = []
+    for item in fragments:
+        data_list = ast.literal_eval(item)
+        parts = re.findall(r'",({.*?\"})]', data_list[-1], re.DOTALL)
+        for program in parts:
+            program = program.replace('$undefined', 'null')
+            try:
+                program = json.loads(program)
+            except json.JSONDecodeError:
+                continue
+            if program.get('program'):
+                programs.append(program)
+    return programs
+
+
+def generate_page(channel, count=60, chunk_size=2000):
+    """ Generate a guide page with a flight payload, like the tv-gids pages of Play """
+    rows = ['0:["$","html",null,{}]\n']
+    for idx in range(count):
+        program = {
+            'program': {
+                'contentEpisode': 'Aflevering %d van een programma op %s' % (idx, channel), 'duration': 1800, 'episodeNr': str(idx),
+                'episodeTitle': 'Aflevering %d' % idx, 'genre': 'Reality', 'latestVideo': False, 'originalTitle': '$undefined', 'program': None,
+                'programConcept': 'Realityreeks', 'programTitle': 'Programma %d' % (idx // 4), 'season': '1', 'timestamp': 1700000000 + idx * 1800,
+                'video': None, 'wonId': str(1000 + idx), 'wonProgramId': str(2000 + idx),
+            },
+            'channel': channel,
+        }
+        rows.append('%x:["$","$L31","",%s]\n' % (idx + 16, json.dumps(program)))
+    flight = ''.join(rows)
+    pushes = [flight[pos:pos + chunk_size] for pos in range(0, len(flight), chunk_size)]
+    return '<html><body>%s%s</body></html>' % (
+        '<div>' + 'x' * 50000 + '</div>',
+        ''.join('<script>self.__next_f.push(%s)</script>' % json.dumps([1, push]) for push in pushes),
+    )
+
+
+def load_pages(path):
+    """ Load saved guide pages """
+    pages = {}
+    for filename in sorted(glob.glob(os.path.join(path, '*.html'))):
+        with open(filename, 'r', encoding='utf-8') as fdesc:
+            pages[os.path.basename(filename)] = fdesc.read()
+    return pages
+
+
+def fetch_pages(path, channels):
+    """ Save today's guide pages of the channels """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    session = EpgApi()._session  # pylint: disable=protected-access
+    date = datetime.today().strftime('%Y-%m-%d')
+    for channel in channels:
+        response = session.get(EpgApi.EPG_ENDPOINT.format(channel=channel, date=date))
+        with open(os.path.join(path, '%s.%s.html' % (channel, date)), 'w', encoding='utf-8') as fdesc:
+            fdesc.write(response.text)
+
+
+def run(path=None):
+    """ Run the benchmark """
+    pages = load_pages(path) if path else {}
+    if pages:
+        print('Using %d saved guide pages from %s' % (len(pages), path))
+    else:
+        pages = {channel: generate_page(channel) for channel in ('play4', 'play5', 'play6', 'play7', 'playcrime')}
+        print('Using %d synthetic guide pages' % len(pages))
+
+    for name, page in pages.items():
+        legacy = legacy_parse_page(page)
+        streaming = parse_flight(page)
+        print('%-30s %6.1f KiB: %3d programs (legacy found %d)' % (name, len(page) / 1024, len(streaming), len(legacy)))
+
+    for name, parser in (('legacy', legacy_parse_page), ('streaming', parse_flight)):
+        timing = min(timeit.repeat(lambda parser=parser: [parser(page) for page in pages.values()], number=5, repeat=3)) / 5
+        print('%-10s %8.2f ms per pass' % (name, timing * 1000))
+
+    # Compare opening a stored day as JSON with opening it as a snapshot
+    records = [EpgApi._flatten_programs(parse_flight(page)) for page in pages.values()]  # pylint: disable=protected-access
+    path = tempfile.mkdtemp()
+    try:
+        for idx, day in enumerate(records):
+            with open(os.path.join(path, '%d.json' % idx), 'w', encoding='utf-8') as fdesc:
+                json.dump(day, fdesc, separators=(',', ':'))
+            write_snapshot(os.path.join(path, '%d.bin' % idx), day)
+        print('Stored %d days: %.1f KiB as JSON, %.1f KiB as snapshot' % (
+            len(records),
+            sum(os.path.getsize(os.path.join(path, '%d.json' % idx)) for idx in range(len(records))) / 1024,
+            sum(os.path.getsize(os.path.join(path, '%d.bin' % idx)) for idx in range(len(records))) / 1024,
+        ))
+
+        def load_json():
+            for idx in range(len(records)):
+                with open(os.path.join(path, '%d.json' % idx), 'r', encoding='utf-8') as fdesc:
+                    [tuple(record) for record in json.load(fdesc)]  # pylint: disable=expression-not-assigned
+
+        def load_snapshot():
+            for idx in range(len(records)):
+                with EpgSnapshot(os.path.join(path, '%d.bin' % idx)) as snapshot:
+                    list(snapshot)
+
+        def now_snapshot():
+            for idx in range(len(records)):
+                with EpgSnapshot(os.path.join(path, '%d.bin' % idx)) as snapshot:
+                    positions, starts, _ = snapshot.columns()
+                    _ = snapshot[positions[bisect.bisect_right(starts, 1700000000 + 3600) - 1]]
+
+        for name, loader in (('json', load_json), ('snapshot', load_snapshot), ('snapshot 1', now_snapshot)):
+            timing = min(timeit.repeat(loader, number=20, repeat=3)) / 20
+            print('%-10s %8.2f ms per pass' % (name, timing * 1000))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[2] == '--fetch':
+        fetch_pages(sys.argv[1], sys.argv[3:])
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+""" Benchmark of converting HTML descriptions into Kodi formatted text
+
+Pass a directory with cached API responses (e.g. the cache folder of the add-on) as first argument to use their descriptions as corpus, or a
+synthetic corpus is used.
+"""
+
+import glob
+import json
+import os
+import random
+import re
+import sys
+import timeit
+from html import unescape
+
+from resources.lib import kodiutils
+
+LEGACY_HTML_MAPPING = [
+    (re.compile(r'<(/?)i(|\s[^>]+)>', re.I), '[\\1I]'),
+    (re.compile(r'<(/?)b(|\s[^>]+)>', re.I), '[\\1B]'),
+    (re.compile(r'<em(|\s[^>]+)>', re.I), '[I]'),
+    (re.compile(r'</em>', re.I), '[/I]'),
+    (re.compile(r'<(strong|h\d)>', re.I), '[B]'),
+    (re.compile(r'</(strong|h\d)>', re.I), '[/B]'),
+    (re.compile(r'<li>', re.I), '- '),
+    (re.compile(r'</?(li|ul|ol)(|\s[^>]+)>', re.I), '\n'),
+    (re.compile(r'</?(code|div|p|pre|span)(|\s[^>]+)>', re.I), ''),
+    (re.compile(r'<br />', re.I), '\n'),
+    (re.compile('(&nbsp;\n){2,}', re.I), '\n'),
+    (re.compile('  +', re.I), ' '),
+]
+
+
+def legacy_html_to_kodi(text):
+    """ The previous implementation of kodiutils.html_to_kodi, as a reference. """
+    if not text:
+        return text
+    for key, val in LEGACY_HTML_MAPPING:
+        text = key.sub(val, text)
+    return unescape(text).strip()
+
+
+def find_descriptions(data):
+    """ Recursively find all descriptions in a JSON object """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == 'description' and isinstance(value, str):
+                yield value
+            else:
+                yield from find_descriptions(value)
+    elif isinstance(data, list):
+        for value in data:
+            yield from find_descriptions(value)
+
+
+def load_corpus(path):
+    """ Load all descriptions from the cached API responses """
+    corpus = []
+    for filename in glob.glob(os.path.join(path, '*.json')):
+        with open(filename, 'r', encoding='utf-8') as fdesc:
+            try:
+                corpus.extend(find_descriptions(json.load(fdesc)))
+            except ValueError:
+                continue
+    return corpus
+
+
+def generate_corpus(unique=500, total=20000, seed=0):
+    """ Generate a corpus of descriptions where descriptions repeat over lanes, like in the real API """
+    rnd = random.Random(seed)
+    snippets = ['<p>', '</p>', '<b>', '</b>', '<i>', '</i>', '<em>', '</em>', '<strong>', '</strong>', '<br />', '<ul>', '<li>', '</li>', '</ul>',
+                '&amp;', '&nbsp;\n', '  ', 'Een ', 'spannende ', 'aflevering ', 'van ', '<span class="x">', '</span>', '<h2>', '</h2>']
+    descriptions = [''.join(rnd.choice(snippets) for _ in range(rnd.randint(10, 60))) for _ in range(unique)]
+    return [rnd.choice(descriptions) for _ in range(total)]
+
+
+def run(path=None):
+    """ Run the benchmark """
+    corpus = load_corpus(path) if path else []
+    if corpus:
+        print('Using %d descriptions (%d unique) from %s' % (len(corpus), len(set(corpus)), path))
+    else:
+        corpus = generate_corpus()
+        print('Using %d synthetic descriptions (%d unique)' % (len(corpus), len(set(corpus))))
+
+    # Both implementations agree, except for malformed HTML with a '<' inside a tag
+    different = [text for text in set(corpus) if legacy_html_to_kodi(text) != kodiutils.html_to_kodi(text)]
+    if different:
+        print('%d descriptions convert differently, e.g. %r' % (len(different), different[0]))
+
+    def uncached():
+        """ Convert the corpus without the memo cache """
+        kodiutils._html_to_kodi.cache_clear()  # pylint: disable=protected-access
+        for text in corpus:
+            kodiutils._html_to_kodi.__wrapped__(text)  # pylint: disable=protected-access
+
+    for name, func in (('legacy', lambda: [legacy_html_to_kodi(text) for text in corpus]),
+                       ('single pass', uncached),
+                       ('memoized', lambda: [kodiutils.html_to_kodi(text) for text in corpus])):
+        timing = min(timeit.repeat(func, number=3, repeat=3)) / 3
+        print('%-12s %8.2f ms per pass' % (name, timing * 1000))
+
+
+if __name__ == '__main__':
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+""" Memory benchmark of the data model on a synthetic large catalog """
+
+import json
+import random
+import tracemalloc
+
+from resources.lib import kodiutils
+from resources.lib.play.content import _CARD_PROGRAM_SCHEMA, _CARD_VIDEO_SCHEMA, ContentApi, Episode, Program  # pylint: disable=protected-access
+
+CHANNELS = ['Play4', 'Play5', 'Play6', 'Play7', 'PlayCrime']
+CATEGORIES = [(5285, 'Fictie'), (5286, 'Reality'), (5287, 'Humor'), (5288, 'Docu'), (5289, 'Sport')]
+
+
+class DictObject:
+    """ A plain __dict__ based object, like the data model was before. """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def generate_cards(count, seed=0):
+    """ Generate a JSON payload with `count` cards, like the swimlane API returns them. """
+    rnd = random.Random(seed)
+    cards = []
+    for idx in range(count):
+        category_id, category = rnd.choice(CATEGORIES)
+        card = {
+            'uuid': '%08x-0000-4000-8000-%012x' % (rnd.getrandbits(32), idx),
+            'title': 'Program %d' % (idx // 10),
+            'subtitle': 'Aflevering %d' % (idx % 10 + 1),
+            'brand': rnd.choice(CHANNELS),
+            'categoryId': category_id,
+            'category': category,
+            'description': '<p>Description of episode %d.</p>' % idx,
+            'duration': rnd.randint(600, 3600),
+            'images': [{'url': 'https://images.play.tv/%d.jpg' % idx}],
+            'dates': {'publishDate': 1700000000 + idx, 'unpublishDate': 1800000000 + idx},
+            'type': 'VIDEO' if idx % 4 else 'PROGRAM',
+        }
+        cards.append(card)
+    # Round-trip through JSON, so strings are not shared between the cards, like with a real API response
+    return json.loads(json.dumps(cards))
+
+
+def _fields(model):
+    """ Return the names of all the fields of a data model class. """
+    return [field for cls in reversed(model.__mro__) for field in cls.__dict__.get('__slots__', ()) if not field.startswith('_')]
+
+
+def build_dict_objects(cards):
+    """ Build the catalog with plain __dict__ objects and without interning. The fields are parsed with the same schemas as the data model,
+    so both builders do the same parsing work, including the html and date conversions. """
+    program_fields = dict.fromkeys(_fields(Program))
+    episode_fields = dict.fromkeys(_fields(Episode))
+    items = []
+    for card in cards:
+        if card.get('type') == 'PROGRAM':
+            items.append(DictObject(**dict(program_fields, **_CARD_PROGRAM_SCHEMA.extract(card))))
+        elif card.get('type') == 'VIDEO':
+            items.append(DictObject(**dict(episode_fields, content_type='long_form', **_CARD_VIDEO_SCHEMA.extract(card))))
+    return items
+
+
+def build_slotted_objects(cards):
+    """ Build the catalog with the data model. """
+    videos, programs = ContentApi._parse_cards_data(cards)  # pylint: disable=protected-access
+    return videos + programs
+
+
+def measure(builder, cards):
+    """ Return the memory that is kept alive by the objects that the builder returns. """
+    # Start both builders with an empty html memo cache
+    kodiutils._html_to_kodi.cache_clear()  # pylint: disable=protected-access
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    items = builder(cards)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(items), after - before, peak - before
+
+
+def run(count=50000):
+    """ Run the benchmark """
+    cards = generate_cards(count)
+    for name, builder in (('__dict__ objects', build_dict_objects), ('slotted objects', build_slotted_objects)):
+        items, retained, peak = measure(builder, cards)
+        print('%-18s %7d items: retained %8.1f KiB (%5.1f bytes/item), peak %8.1f KiB' % (name, items, retained / 1024, retained / items, peak / 1024))
+
+
+if __name__ == '__main__':
+    run()
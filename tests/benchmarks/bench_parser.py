@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+""" Benchmark of parsing program payloads
+
+Pass a directory with recorded `program.*.json` payloads (e.g. the cache folder of the add-on) as first argument, or a synthetic set of large
+program payloads is used.
+"""
+
+import glob
+import json
+import os
+import re
+import sys
+import timeit
+from datetime import datetime
+
+from resources.lib.kodiutils import html_to_kodi
+from resources.lib.play.content import ContentApi, Program, Season
+
+
+def legacy_parse_program_data(data):
+    """ The previous implementation of ContentApi._parse_program_data, as a reference. """
+    program = Program(
+        uuid=data.get('programUuid'),
+        path=data.get('programUuid'),
+        channel=data.get('brand'),
+        category_name=data.get('category') or 'No category',
+        title=data.get('title'),
+        description=html_to_kodi(data.get('description')),
+        aired=datetime.fromtimestamp(data.get('dates', {}).get('publishDate', 0.0) or 0.0),
+        expiry=datetime.fromtimestamp(data.get('dates', {}).get('unpublishDate', 0.0) or 0.0),
+        poster=data.get('images').get('portrait'),
+        thumb=data.get('images').get('portrait'),
+        fanart=data.get('images').get('background'),
+    )
+    program.seasons = {
+        key: Season(
+            uuid=playlist.get('playlistUuid'),
+            title=playlist.get('title'),
+            number=re.compile(r'\d+$').findall(playlist.get('title'))[-1] if re.compile(r'\d+$').findall(playlist.get('title')) else None,
+        )
+        for key, playlist in enumerate(data.get('playlists', [])) if playlist.get('title')
+    }
+    return program
+
+
+def generate_programs(count=200, playlists=40):
+    """ Generate large program payloads """
+    return [
+        {
+            'programUuid': '00000000-0000-4000-8000-%012x' % idx,
+            'brand': 'play4',
+            'category': 'Fictie',
+            'title': 'Program %d' % idx,
+            'description': '<p>Description of program %d</p>' % idx,
+            'dates': {'publishDate': 1700000000 + idx, 'unpublishDate': 1800000000 + idx},
+            'images': {'portrait': 'https://images.play.tv/p%d.jpg' % idx, 'background': 'https://images.play.tv/b%d.jpg' % idx},
+            'playlists': [
+                {'playlistUuid': '11111111-0000-4000-8000-%012x' % season, 'title': 'Seizoen %d' % (season + 1)}
+                for season in range(playlists)
+            ],
+        }
+        for idx in range(count)
+    ]
+
+
+def load_programs(path):
+    """ Load recorded program payloads """
+    programs = []
+    for filename in glob.glob(os.path.join(path, 'program.*.json')):
+        with open(filename, 'r', encoding='utf-8') as fdesc:
+            programs.append(json.load(fdesc))
+    return programs
+
+
+def run(path=None):
+    """ Run the benchmark """
+    programs = load_programs(path) if path else []
+    if programs:
+        print('Using %d recorded program payloads from %s' % (len(programs), path))
+    else:
+        programs = generate_programs()
+        print('Using %d synthetic program payloads' % len(programs))
+
+    # Make sure both implementations agree
+    for data in programs:
+        assert repr(legacy_parse_program_data(data)) == repr(ContentApi._parse_program_data(data))  # pylint: disable=protected-access
+
+    for name, parser in (('legacy', legacy_parse_program_data), ('schema', ContentApi._parse_program_data)):  # pylint: disable=protected-access
+        timing = min(timeit.repeat(lambda parser=parser: [parser(data) for data in programs], number=10, repeat=5)) / 10
+        print('%-8s %8.2f ms per pass' % (name, timing * 1000))
+
+
+if __name__ == '__main__':
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
 """ Tests for AUTH API """
 
+import base64
+import json
 import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 from resources.lib import kodiutils
+from resources.lib.play import registry, tokenserver
 from resources.lib.play.auth import AuthApi
+from resources.lib.play.aws import cognito_idp
+from resources.lib.play.aws.cognito_idp import AuthenticationException, SrpKeyPool
+from resources.lib.play.aws.cognito_sync import CognitoSync, get_signature_key
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -31,6 +42,182 @@ class TestAuth(unittest.TestCase):
         id_token = auth.get_token()
         self.assertTrue(id_token)
 
+    def test_token_expiry(self):
+        """ Test reading the expiry time from the id token """
+        payload = base64.urlsafe_b64encode(json.dumps({'sub': 'user', 'exp': 1700003600}).encode()).decode().rstrip('=')
+        self.assertEqual(AuthApi._get_expiry('header.%s.signature' % payload), 1700003600)  # pylint: disable=protected-access
+
+        # Fall back to an hour when the token can't be read
+        self.assertAlmostEqual(AuthApi._get_expiry('invalid'), time.time() + 3600, delta=5)  # pylint: disable=protected-access
+
+    def test_single_flight(self):
+        """ Test that only one of the instances logs in when they need a token at the same time """
+        token_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, token_path)
+        payload = base64.urlsafe_b64encode(json.dumps({'exp': int(time.time()) + 3600}).encode()).decode().rstrip('=')
+        logins = []
+
+        class SlowAuthApi(AuthApi):
+            """ AuthApi with a slow login that doesn't use the network """
+            @staticmethod
+            def _authenticate(username, password):
+                logins.append(username)
+                time.sleep(0.2)
+                return 'header.%s.signature' % payload, 'refresh-token'
+
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(SlowAuthApi('user', 'pass', token_path).get_token())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(logins), 1)
+        self.assertEqual(len(set(tokens)), 1)
+        self.assertEqual(sorted(os.listdir(token_path)), [AuthApi.TOKEN_FILE])
+
+    def test_token_lock(self):
+        """ Test that we wait for the lock of another process until it is stale, and that we only remove our own lock """
+        token_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, token_path)
+        lockpath = os.path.join(token_path, AuthApi.LOCK_FILE)
+        with open(lockpath, 'w', encoding='utf-8') as fdesc:
+            fdesc.write('other')
+
+        class ImpatientAuthApi(AuthApi):
+            """ AuthApi that doesn't wait long for the lock """
+            LOCK_WAIT = 0.3
+
+        auth = ImpatientAuthApi('user', 'pass', token_path)
+        with self.assertRaises(AuthenticationException):
+            with auth._lock_tokens():  # pylint: disable=protected-access
+                pass
+        self.assertEqual(AuthApi._read_lock(lockpath), 'other')  # pylint: disable=protected-access
+
+        # A stale lock is taken over, and the lock of who took over ours is left alone
+        os.utime(lockpath, (time.time() - 60, time.time() - 60))
+        with auth._lock_tokens():  # pylint: disable=protected-access
+            self.assertNotEqual(AuthApi._read_lock(lockpath), 'other')  # pylint: disable=protected-access
+            with open(lockpath, 'w', encoding='utf-8') as fdesc:
+                fdesc.write('other')
+        self.assertEqual(AuthApi._read_lock(lockpath), 'other')  # pylint: disable=protected-access
+
+    def test_identity_cache(self):
+        """ Test that the identity is used from the cache, and the credentials from memory until they expire """
+        token_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, token_path)
+        credentials = {'AccessKeyId': 'key', 'SecretKey': 'secret', 'SessionToken': 'session', 'Expiration': time.time() + 3600}
+        with open(os.path.join(token_path, AuthApi.IDENTITY_FILE), 'w', encoding='utf-8') as fdesc:
+            json.dump({'username': 'user', 'identity_id': 'eu-west-1:identity'}, fdesc)
+
+        auth = AuthApi('user', 'pass', token_path)
+        auth._credentials = credentials  # pylint: disable=protected-access
+        self.assertEqual(auth._get_identity(), ('eu-west-1:identity', credentials))  # pylint: disable=protected-access
+
+        # The identity id is kept in memory after the first read
+        os.unlink(os.path.join(token_path, AuthApi.IDENTITY_FILE))
+        self.assertEqual(auth._get_identity(), ('eu-west-1:identity', credentials))  # pylint: disable=protected-access
+
+        auth.clear_tokens()
+        self.assertIsNone(auth._credentials)  # pylint: disable=protected-access
+        self.assertIsNone(auth._identity_id)  # pylint: disable=protected-access
+
+    def test_srp_key_pool(self):
+        """ Test that the keys of the pool are valid, and are only handed out once """
+        pool = SrpKeyPool(2)
+        self.assertIsNone(pool.take())
+        pool.fill()
+        self.assertEqual(len(pool), 2)
+        small_a, big_a = pool.take()
+        self.assertEqual(pow(cognito_idp.G, small_a, cognito_idp.BIG_N), big_a)
+        self.assertNotEqual(pool.take(), (small_a, big_a))
+        self.assertIsNone(pool.take())
+
+    def test_signature_key(self):
+        """ Test the signing key against the AWS example, and that it is only derived once a day """
+        get_signature_key.cache_clear()
+        key = get_signature_key('wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY', '20120215', 'us-east-1', 'iam')
+        self.assertEqual(key.hex(), 'f4780e2d9f65fa895f9c67b32ce1baf0b0d8a43505a000a1a9e090d414db404d')
+        self.assertIs(get_signature_key('wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY', '20120215', 'us-east-1', 'iam'), key)
+
+    def test_patch_records(self):
+        """ Test that several records are updated in one signed request """
+        requests = []
+
+        class FakeSession:
+            """ A session that keeps the requests instead of sending them """
+
+            @staticmethod
+            def send(request):
+                """ Keep the request, and reply that it went fine """
+                requests.append(request)
+                return FakeSession
+
+            @staticmethod
+            def raise_for_status():
+                """ The request went fine """
+
+        credentials = {'AccessKeyId': 'key', 'SecretKey': 'secret', 'SessionToken': 'session'}
+        sync_client = CognitoSync(AuthApi.COGNITO_IDENTITY_POOL_ID, 'eu-west-1:identity', credentials)
+        sync_client._session = FakeSession  # pylint: disable=protected-access
+        sync_client.patch_records('dataset', [('resume', {'position': 12}, 3), ('watched', True, 5)], 'sync-session')
+
+        self.assertEqual(len(requests), 1)
+        self.assertTrue(requests[0].url.endswith('/identities/eu-west-1:identity/datasets/dataset'))
+        self.assertIn('Signature=', requests[0].headers['Authorization'])
+        self.assertEqual(json.loads(requests[0].body), {
+            'SyncSessionToken': 'sync-session',
+            'RecordPatches': [
+                {'Key': 'resume', 'Op': 'replace', 'SyncCount': 3, 'Value': '{"position": 12}'},
+                {'Key': 'watched', 'Op': 'replace', 'SyncCount': 5, 'Value': 'true'},
+            ],
+        })
+
+    def test_registry(self):
+        """ Test that the API instances are shared until they are invalidated """
+        auth = registry.get_auth_api()
+        self.assertIs(registry.get_auth_api(), auth)
+        self.assertIs(registry.get_content_api()._auth, auth)  # pylint: disable=protected-access
+
+        registry.invalidate()
+        self.assertIsNot(registry.get_auth_api(), auth)
+
+    def test_token_server(self):
+        """ Test that the token server only hands out tokens to requests signed with its secret """
+        token_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, token_path)
+
+        class FakeAuth:
+            """ An AuthApi that has a token in memory """
+            username = 'user'
+            expiry = int(time.time()) + 3600
+
+            @classmethod
+            def get_cached_token(cls, margin=0):
+                """ Return the token, when it remains valid long enough """
+                return 'header.payload.signature' if cls.expiry > time.time() + margin else None
+
+        server = tokenserver.TokenServer(FakeAuth)
+        server.start()
+        try:
+            self.assertEqual(tokenserver.request_token(server.port, server.secret, 'user', 600), ('header.payload.signature', FakeAuth.expiry))
+            self.assertIsNone(tokenserver.request_token(server.port, server.secret, 'other', 600))
+            # The server doesn't wait for a new token when it has no valid one in memory
+            self.assertIsNone(tokenserver.request_token(server.port, server.secret, 'user', 7200))
+            with self.assertRaises(ValueError):
+                tokenserver.request_token(server.port, b'\0' * 32, 'user', 600)
+
+            # The plugin finds the server through the address file, that only the user can read
+            server.publish(token_path)
+            path = os.path.join(token_path, tokenserver.ADDRESS_FILE)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+            with open(path, 'r', encoding='utf-8') as fdesc:
+                self.assertEqual(json.load(fdesc)['port'], server.port)
+        finally:
+            server.stop()
+            server.join()
+        self.assertFalse(os.path.exists(path))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+""" Tests for parsing the Content API data """
+
+import base64
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+
+from resources.lib.play import ResolvedStream
+from resources.lib.play.catalogstore import CatalogStore
+from resources.lib.play.content import CACHE_ONLY, ContentApi, Episode, LazyEpisode, Program, Swimlane
+from resources.lib.play.schema import Schema
+from resources.lib.play.streamstore import StreamStore, parse_time
+
+CARDS = [
+    {
+        'type': 'PROGRAM',
+        'uuid': '7f9c4278-8372-47ef-9cc8-cc10c7b7c9f5',
+        'title': 'De Mol',
+        'brand': 'play4',
+        'categoryId': 5285,
+        'category': 'Fictie',
+        'images': [{'url': 'https://images.play.tv/demol.jpg'}],
+    },
+    {
+        'type': 'VIDEO',
+        'uuid': 'a8b3c1de-0000-4000-8000-000000000001',
+        'title': 'De Mol',
+        'subtitle': 'Aflevering 1',
+        'brand': 'play4',
+        'description': '<p>De <b>eerste</b> aflevering.</p>',
+        'duration': 3000,
+        'images': [{'url': 'https://images.play.tv/demol-1.jpg'}],
+        'dates': {'publishDate': 1700000000, 'unpublishDate': 1800000000},
+    },
+]
+
+
+class TestContent(unittest.TestCase):
+    """ Tests for parsing the Content API data """
+
+    def test_parse_cards(self):
+        """ Test parsing cards """
+        videos, programs = ContentApi._parse_cards_data(CARDS)  # pylint: disable=protected-access
+        self.assertIsInstance(programs[0], Program)
+        self.assertEqual(programs[0].category_id, '5285')
+        self.assertIsInstance(videos[0], Episode)
+        self.assertEqual(videos[0].description, 'De [B]eerste[/B] aflevering.')
+        self.assertEqual(videos[0].aired, datetime.fromtimestamp(1700000000))
+
+    def test_parse_program(self):
+        """ Test parsing a program with its seasons """
+        program = ContentApi._parse_program_data({  # pylint: disable=protected-access
+            'programUuid': '7f9c4278-8372-47ef-9cc8-cc10c7b7c9f5',
+            'title': 'De Mol',
+            'images': {'portrait': 'https://images.play.tv/demol.jpg'},
+            'playlists': [
+                {'playlistUuid': 'eeb790c9-1264-4eee-9209-d98627626988', 'title': 'Seizoen 12'},
+                {'playlistUuid': 'eeb790c9-1264-4eee-9209-d98627626989', 'title': 'Extra'},
+                {'playlistUuid': 'eeb790c9-1264-4eee-9209-d98627626990'},
+            ],
+        })
+        self.assertEqual(program.category_name, 'No category')
+        self.assertEqual(program.poster, 'https://images.play.tv/demol.jpg')
+        self.assertEqual(program.aired, datetime.fromtimestamp(0))
+        self.assertEqual(list(program.seasons), [0, 1])
+        self.assertEqual(program.seasons[0].number, '12')
+        self.assertIsNone(program.seasons[1].number)
+
+    def test_parse_cards_lazy(self):
+        """ Test parsing cards lazily gives the same result """
+        eager, _ = ContentApi._parse_cards_data(CARDS)  # pylint: disable=protected-access
+        lazy, _ = ContentApi._parse_cards_data(CARDS, lazy=True)  # pylint: disable=protected-access
+        self.assertIsInstance(lazy[0], LazyEpisode)
+        self.assertEqual(repr(lazy[0]), repr(eager[0]))
+
+        # The fields are decoded only once
+        video = ContentApi._parse_cards_data(CARDS, lazy=True)[0][0]  # pylint: disable=protected-access
+        self.assertIs(video.description, video.description)
+        self.assertEqual(sorted(video._raw), ['aired', 'expiry'])  # pylint: disable=protected-access
+        with self.assertRaises(AttributeError):
+            video.unknown  # pylint: disable=pointless-statement
+
+    def test_catalog_store(self):
+        """ Test the date range queries of the catalog store """
+        episodes = [
+            Episode(uuid='old', aired=datetime.fromtimestamp(1000), expiry=datetime.fromtimestamp(9000)),
+            Episode(uuid='new', aired=datetime.fromtimestamp(3000), expiry=datetime.fromtimestamp(5000)),
+            Episode(uuid='newer', aired=datetime.fromtimestamp(4000), expiry=datetime.fromtimestamp(6000)),
+            Episode(uuid='unknown', aired=datetime.fromtimestamp(0)),
+        ]
+        store = CatalogStore(episodes)
+        self.assertEqual(len(store), 4)
+        self.assertEqual([item.uuid for item in store.aired_between(2000, 5000)], ['newer', 'new'])
+        self.assertEqual([item.uuid for item in store.expiring_between(0, 7000)], ['new', 'newer'])
+        self.assertEqual(store.aired_between(5000, 6000), [])
+
+        # A saved store gives the same results, until it expires
+        cache_path = tempfile.mkdtemp()
+        try:
+            path = os.path.join(cache_path, 'catalog.json')
+            schemas = (Schema(Episode, []), Schema(Program, []))
+            store.save(path, 60, schemas)
+            loaded = CatalogStore.load(path, schemas)
+            self.assertEqual([item.uuid for item in loaded.aired_between(2000, 5000)], ['newer', 'new'])
+            self.assertEqual(loaded.expiring_between(0, 7000)[0].expiry, datetime.fromtimestamp(5000))
+            self.assertIsInstance(loaded.expiring_between(0, 7000)[0], Episode)
+
+            store.save(path, -1, schemas)
+            self.assertIsNone(CatalogStore.load(path, schemas))
+        finally:
+            shutil.rmtree(cache_path)
+
+    def test_catalog_store_lazy(self):
+        """ Test that the catalog store of lazy cards is saved without decoding them, and can be loaded again """
+        class FakeContentApi(ContentApi):
+            """ A ContentApi with one page of cards """
+            def get_page(self, page, cache=None):
+                return [Swimlane(index=0)]
+
+            def iter_swimlane(self, page, index, limit=100, offset=0, cache=None, lazy=True):
+                return self._iter_cards_data(CARDS, lazy=lazy)
+
+        cache_path = tempfile.mkdtemp()
+        try:
+            api = FakeContentApi(cache_path=cache_path)
+            store = api.get_catalog_store(pages=('home',))
+            self.assertIsInstance(store.aired_between(0, 2000000000)[0], LazyEpisode)
+            self.assertIn('description', store.aired_between(0, 2000000000)[0]._raw)  # pylint: disable=protected-access
+
+            # The next call loads the saved store
+            loaded = api.get_catalog_store(pages=('home',), cache=CACHE_ONLY)
+            videos = loaded.aired_between(0, 2000000000)
+            self.assertEqual([video.uuid for video in videos], ['a8b3c1de-0000-4000-8000-000000000001'])
+            self.assertIsInstance(videos[0], LazyEpisode)
+            self.assertEqual(videos[0].description, 'De [B]eerste[/B] aflevering.')
+            self.assertEqual(videos[0].aired, datetime.fromtimestamp(1700000000))
+            self.assertEqual(videos[0].program_title, 'De Mol')
+        finally:
+            shutil.rmtree(cache_path)
+
+    def test_stream_cache(self):
+        """ Test that a resolved stream is kept until its manifest url expires, or until it is invalidated """
+        class FakeContentApi(ContentApi):
+            """ A ContentApi that resolves a stream without the API """
+            resolved = 0
+            url = 'https://example.com/manifest.mpd?exp=%d&sig=abc' % (time.time() + 3600)
+            license_headers = None
+            expiry = None
+
+            def _resolve_stream(self, uuid, content_type):
+                FakeContentApi.resolved += 1
+                return ResolvedStream(uuid=uuid, url=self.url, stream_type='mpd', license_headers=self.license_headers, license_keys={'kid': 'key'},
+                                      subtitles=[]), self.expiry
+
+        cache_path = tempfile.mkdtemp()
+        try:
+            api = FakeContentApi(cache_path=cache_path)
+            self.assertIsNone(api.get_stream('uuid', 'video', cache=CACHE_ONLY))
+            api.get_stream('uuid', 'video')
+            stream = api.get_stream('uuid', 'video')
+            self.assertEqual(FakeContentApi.resolved, 1)
+            self.assertEqual(stream.license_keys, {'kid': 'key'})
+
+            api.invalidate_stream('uuid', 'video')
+            api.get_stream('uuid', 'video')
+            self.assertEqual(FakeContentApi.resolved, 2)
+
+            # Don't keep a stream that is about to expire
+            FakeContentApi.url = 'https://example.com/manifest.mpd?hdnts=exp=%d~hmac=abc' % (time.time() + 60)
+            api.get_stream('uuid', 'live_channel')
+            self.assertIsNone(api.get_stream('uuid', 'live_channel', cache=CACHE_ONLY))
+
+            # Don't keep a stream when its DRM customdata or its ad session is about to expire
+            FakeContentApi.url = 'https://example.com/manifest.mpd'
+            soon = datetime.fromtimestamp(time.time() + 60, timezone.utc)
+            FakeContentApi.license_headers = {'customdata': base64.b64encode(
+                ('<KeyOSAuthenticationXML><Data><ExpirationTime>%s</ExpirationTime></Data></KeyOSAuthenticationXML>'
+                 % soon.strftime('%Y-%m-%d %H:%M:%S.000')).encode()).decode()}
+            api.get_stream('uuid', 'video-short_form')
+            self.assertIsNone(api.get_stream('uuid', 'video-short_form', cache=CACHE_ONLY))
+
+            FakeContentApi.license_headers = None
+            FakeContentApi.expiry = parse_time(soon.strftime('%Y-%m-%dT%H:%M:%S.123Z'))
+            api.get_stream('uuid', 'video-long_form')
+            self.assertIsNone(api.get_stream('uuid', 'video-long_form', cache=CACHE_ONLY))
+            self.assertFalse([name for name in os.listdir(cache_path) if name.endswith('.tmp')])
+
+            # An expired stream is removed when it is read, or when the store is purged, together with a temporary file that was left behind
+            FakeContentApi.expiry = None
+            api.get_stream('uuid', 'video')
+            api.get_stream('other', 'video')
+            for filename in os.listdir(cache_path):
+                os.utime(os.path.join(cache_path, filename), (time.time() - 1, time.time() - 1))
+            self.assertIsNone(api.get_stream('uuid', 'video', cache=CACHE_ONLY))
+            self.assertEqual(os.listdir(cache_path), ['stream.other.video.json'])
+            with open(os.path.join(cache_path, 'stream.left.video.json.1.tmp'), 'w', encoding='utf-8') as fdesc:
+                fdesc.write('{}')
+            StreamStore(cache_path).purge()
+            self.assertEqual(os.listdir(cache_path), ['stream.left.video.json.1.tmp'])
+            self.addCleanup(setattr, StreamStore, 'TMP_AGE', StreamStore.TMP_AGE)
+            StreamStore.TMP_AGE = -1
+            StreamStore(cache_path).purge()
+            self.assertEqual(os.listdir(cache_path), [])
+        finally:
+            shutil.rmtree(cache_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+""" Tests for parsing the EPG data """
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+import dateutil.tz
+
+from resources.lib.play.content import CACHE_ONLY
+from resources.lib.play.epg import EPG_WINDOW, EpgApi, EpgProgram
+from resources.lib.play.epgsnapshot import EpgSnapshot, write_snapshot
+from resources.lib.play.epgstore import EpgStore
+from resources.lib.play.exceptions import UnavailableException
+from resources.lib.play.flight import FlightParser, parse_flight
+from resources.lib.play.xmltv import XmltvWriter, render_programmes
+
+PROGRAM = {
+    'program': {
+        'programTitle': 'De Mol', 'episodeTitle': None, 'originalTitle': '$undefined', 'episodeNr': None, 'season': None, 'genre': None,
+        'timestamp': 1700000000, 'wonId': None, 'wonProgramId': None, 'programConcept': None, 'contentEpisode': None, 'duration': 3600,
+        'program': None, 'latestVideo': False, 'video': None,
+    },
+    'channel': 'play4',
+}
+
+
+def _page(flight, size):
+    """ Build a page that pushes the flight payload in parts of the specified size """
+    return ''.join('<script>self.__next_f.push(%s)</script>' % json.dumps([1, flight[pos:pos + size]]) for pos in range(0, len(flight), size))
+
+
+class TestEpg(unittest.TestCase):
+    """ Tests for parsing the EPG data """
+
+    def test_parse_flight(self):
+        """ Test extracting the programs from a page, also when they are split over multiple pushes """
+        flight = '0:["$","html",null,{}]\n1f:["$","$L31","",%s]\n20:["$","$L31","",{"program":{"broken"}]\n' % json.dumps(PROGRAM)
+        for size in (len(flight), 7):
+            programs = parse_flight(_page(flight, size))
+            self.assertEqual(len(programs), 1)
+            self.assertEqual(programs[0]['program']['programTitle'], 'De Mol')
+            self.assertIsNone(programs[0]['program']['originalTitle'])
+
+    def test_feed_chunks(self):
+        """ Test feeding the page in chunks, like it is downloaded """
+        page = _page('1f:["$","$L31","",%s]\n' % json.dumps(PROGRAM), 11)
+        parser = FlightParser()
+        programs = []
+        for pos in range(0, len(page), 5):
+            programs.extend(parser.feed(page[pos:pos + 5]))
+        self.assertEqual([program['channel'] for program in programs], ['play4'])
+
+    def test_store(self):
+        """ Test keeping the guide of a channel and day in the store """
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        store = EpgStore(cache_path)
+        today = datetime.today()
+        yesterday = (today - timedelta(days=1)).strftime('%Y-%m-%d')
+        tomorrow = (today + timedelta(days=1)).strftime('%Y-%m-%d')
+        today = today.strftime('%Y-%m-%d')
+
+        self.assertEqual(EpgStore.ttl(yesterday), EpgStore.PAST_TTL)
+        self.assertEqual(EpgStore.ttl(today), EpgStore.TODAY_TTL)
+        self.assertEqual(EpgStore.ttl(tomorrow), EpgStore.FUTURE_TTL)
+        self.assertIsNone(store.get('play4', today))
+
+        record = ['De Mol', 'Aflevering 1', None, 1, '12', 'Reality', 1700000000, 1001, 2001, 'Realityreeks', 'Een aflevering', 3600, None, None, None]
+        store.set('play4', today, [record])
+        self.assertEqual(list(store.get('play4', today)), [tuple(record)])
+
+        # An expired day is only used as a fallback
+        os.utime(os.path.join(cache_path, 'epg.play4.%s.bin' % today), (time.time() - 1, time.time() - 1))
+        self.assertIsNone(store.get('play4', today))
+        self.assertEqual(list(store.get('play4', today, allow_expired=True)), [tuple(record)])
+        self.assertEqual(EpgApi(cache_path=cache_path).get_epg('Play4', 'today', cache=CACHE_ONLY)[0].program_title, 'De Mol')
+        self.assertTrue(EpgApi(cache_path=cache_path).is_expired('Play4', today))
+
+        # The EPG API reads through the store
+        store.set('play4', today, [record])
+        programs = EpgApi(cache_path=cache_path).get_epg('Play4', 'today', cache=CACHE_ONLY)
+        self.assertIsInstance(programs[0], EpgProgram)
+        self.assertEqual(programs[0].program_title, 'De Mol')
+        self.assertEqual(programs[0].duration, 3600)
+        self.assertFalse(EpgApi(cache_path=cache_path).is_expired('Play4', today))
+        self.assertEqual(EpgApi(cache_path=cache_path).get_epg('Play4', 'tomorrow', cache=CACHE_ONLY), [])
+        self.assertTrue(EpgApi(cache_path=cache_path).is_expired('Play4', tomorrow))
+
+        # A day that could not be fetched is an error, not a guide
+        class OfflineEpgApi(EpgApi):
+            """ An EPG API that cannot reach the network """
+
+            def _get_programs(self, url):
+                raise ConnectionError('offline')
+
+        with self.assertRaises(UnavailableException):
+            OfflineEpgApi(cache_path=cache_path).get_epg('Play4', 'tomorrow')
+        self.assertIsNone(store.get('play4', tomorrow, allow_expired=True))
+        self.assertEqual(OfflineEpgApi(cache_path=cache_path).get_epg('Play4', 'today')[0].program_title, 'De Mol')
+
+        # Days that left the window are removed
+        store.set('play4', yesterday, [record])
+        store.purge([today, tomorrow])
+        self.assertIsNone(store.get('play4', yesterday, allow_expired=True))
+        self.assertEqual(list(store.get('play4', today)), [tuple(record)])
+
+    def test_refresh_window(self):
+        """ Test keeping the days of the window stored, without fetching the days that are still valid """
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        fetched = []
+
+        class EmptyEpgApi(EpgApi):
+            """ An EPG API that has no programs on any day """
+
+            def _get_programs(self, url):
+                fetched.append(url)
+                return []
+
+        epg = EmptyEpgApi(cache_path=cache_path)
+        self.assertEqual(epg.refresh_window(['Play4']), len(EPG_WINDOW))
+        self.assertEqual(epg.refresh_window(['Play4']), 0)
+        self.assertEqual(len(fetched), len(EPG_WINDOW))
+
+        # A past day that expired was stored before it ended, a day later in the week is only fetched when it is new
+        today = datetime.today()
+        for delta in (-1, 5):
+            date = (today + timedelta(days=delta)).strftime('%Y-%m-%d')
+            os.utime(os.path.join(cache_path, 'epg.play4.%s.bin' % date), (time.time() - 1, time.time() - 1))
+        self.assertEqual(epg.refresh_window(['Play4']), 1)
+        self.assertTrue(fetched[-1].endswith((today - timedelta(days=1)).strftime('%Y-%m-%d')))
+
+    def test_snapshot(self):
+        """ Test writing and reading the records of a day as a binary snapshot """
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        records = [
+            ('Thuis', 'Aflevering 5.123', None, 123, '29', 'Soap', 1700000000, 2 ** 40, None, 'Soapserie', 'Één café', 1800, 'uuid-program', None, None),
+            ('Thuis', None, None, None, None, None, 1700001800, None, 7, None, None, None, None, 'uuid-video', 'https://images.play.tv/thuis.jpg'),
+            ('Zonder start', '29', None, None, 29, None, None, None, None, None, None, 600, None, None, None),
+        ]
+        write_snapshot(os.path.join(cache_path, 'snapshot.bin'), records)
+        with EpgSnapshot(os.path.join(cache_path, 'snapshot.bin')) as snapshot:
+            self.assertEqual(len(snapshot), 3)
+            self.assertEqual([list(column) for column in snapshot.columns()], [[0, 1], [1700000000, 1700001800], [1800, 0]])
+            self.assertEqual(snapshot[-2], records[1])
+            self.assertEqual(list(snapshot), records)
+            with self.assertRaises(IndexError):
+                snapshot[3]  # pylint: disable=pointless-statement
+
+        # The values keep their type
+        self.assertIsInstance(records[2][4], int)
+        self.assertEqual([type(value) for value in list(EpgSnapshot(os.path.join(cache_path, 'snapshot.bin')))[2]], [type(value) for value in records[2]])
+
+    def test_index(self):
+        """ Test looking up the programs that air at a time, also around midnight """
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        store = EpgStore(cache_path)
+        midnight = datetime.combine(datetime.today(), datetime.min.time())
+
+        def record(title, start, duration):
+            return [title, None, None, None, None, None, int((midnight + start).timestamp()), None, None, None, None, duration, None, None, None]
+
+        for day, titles in ((-1, ('Journaal', 'Late night')), (0, ('Nacht', 'Film')), (1, ('Ochtend', 'Avond'))):
+            offset = timedelta(days=day)
+            store.set('play4', (midnight + offset).strftime('%Y-%m-%d'), [
+                record(titles[0], offset + timedelta(hours=0.5), 3600),
+                record(titles[1], offset + timedelta(hours=23.5), 3600),
+            ])
+
+        def at(delta):
+            return (midnight + delta).replace(tzinfo=dateutil.tz.gettz('CET'))
+
+        epg = EpgApi(cache_path=cache_path)
+        self.assertEqual([p.program_title for p in epg.get_now_next('Play4', at(timedelta(minutes=10)), CACHE_ONLY)], ['Late night', 'Nacht'])
+        self.assertEqual([p.program_title for p in epg.get_now_next('Play4', at(timedelta(hours=1)), CACHE_ONLY)], ['Nacht', 'Film'])
+        self.assertEqual([p and p.program_title for p in epg.get_now_next('Play4', at(timedelta(hours=12)), CACHE_ONLY)], [None, 'Film'])
+        self.assertEqual([p.program_title for p in epg.get_now_next('Play4', at(timedelta(hours=23.75)), CACHE_ONLY)], ['Film', 'Ochtend'])
+        self.assertEqual(epg.get_whats_on(['Play4', 'Play5'], at(timedelta(hours=1)), CACHE_ONLY)['Play4'].program_title, 'Nacht')
+        self.assertIsNone(epg.get_whats_on(['Play4', 'Play5'], at(timedelta(hours=1)), CACHE_ONLY)['Play5'])
+
+        # A day that is written again is indexed again
+        store.set('play4', midnight.strftime('%Y-%m-%d'), [record('Nieuws', timedelta(hours=0.5), 3600)])
+        self.assertEqual([p and p.program_title for p in epg.get_now_next('Play4', at(timedelta(hours=1)), CACHE_ONLY)], ['Nieuws', 'Ochtend'])
+
+    def test_xmltv(self):
+        """ Test writing the guide as XMLTV, and reusing the fragments of days that didn't change """
+        cache_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_path)
+        store = EpgStore(cache_path)
+        today = datetime.today().strftime('%Y-%m-%d')
+        store.set('play4', today, [
+            ['De Mol & co', 'Aflevering 1', None, 1, '12', 'Reality', 1700000000, None, None, None, 'Een <spannende> aflevering', 3600, None, None,
+             'https://images.play.tv/demol.jpg'],
+            ['Geen duur', None, None, None, None, None, 1700003600, None, None, None, None, None, None, None, None],
+        ])
+
+        renders = []
+
+        def render(programs):
+            renders.append(programs)
+            return render_programmes('channel-1', programs)
+
+        epg = EpgApi(cache_path=cache_path)
+        fragment = epg.get_fragment('Play4', today, 'xmltv', render)
+        self.assertEqual(epg.get_fragment('Play4', today, 'xmltv', render), fragment)
+        self.assertEqual(len(renders), 1)
+
+        output = io.StringIO()
+        with XmltvWriter(output) as writer:
+            writer.write_channel('channel-1', 'Play4', 'https://images.play.tv/play4.png')
+            writer.write(fragment)
+        root = ElementTree.fromstring(output.getvalue().encode('utf-8'))
+        self.assertEqual(root.find('channel').get('id'), 'channel-1')
+        self.assertEqual(len(root.findall('programme')), 1)
+        self.assertEqual(root.find('programme/title').text, 'De Mol & co')
+        self.assertEqual(root.find('programme/desc').text, 'Een <spannende> aflevering')
+        self.assertEqual(root.find('programme/episode-num').text, 'S12E1')
+
+        # A changed day is rendered again
+        store.set('play4', today, [])
+        os.utime(os.path.join(cache_path, 'epg.play4.%s.bin' % today), (time.time() + 60, time.time() + 60))
+        epg.get_fragment('Play4', today, 'xmltv', render)
+        self.assertEqual(len(renders), 2)
+
+        # A day that is written again while its fragment is rendered is rendered again as well
+        def render_while_written(programs):
+            store.set('play4', today, [])
+            return render(programs)
+
+        store.set('play4', today, [])
+        epg.get_fragment('Play4', today, 'xmltv', render_while_written)
+        epg.get_fragment('Play4', today, 'xmltv', render)
+        self.assertEqual(len(renders), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
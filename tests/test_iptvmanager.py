@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+""" Tests for the IPTV Manager integration """
+
+import json
+import unittest
+
+from resources.lib.modules.iptvmanager import iter_json
+
+
+class TestIptvManager(unittest.TestCase):
+    """ Tests for the IPTV Manager integration """
+
+    def test_iter_json(self):
+        """ Test encoding JSON in chunks, with generators as objects """
+        def channels():
+            yield 'channel-1', [{'title': 'De Mol', 'subtitle': None}]
+            yield 'channel-2', []
+
+        data = {'version': 1, 'epg': channels(), 'note': 'één "quote"'}
+        self.assertEqual(json.loads(''.join(iter_json(data))), {
+            'version': 1,
+            'epg': {'channel-1': [{'title': 'De Mol', 'subtitle': None}], 'channel-2': []},
+            'note': 'één "quote"',
+        })
+        self.assertEqual(''.join(iter_json({'epg': iter_json_empty()})), '{"epg":{}}')
+
+        # Keys that are not strings are encoded like json.dumps does
+        data = {1: 'one', 2.5: 'half', False: 'no', None: 'nothing'}
+        self.assertEqual(''.join(iter_json(data)), json.dumps(data, separators=(',', ':')))
+
+
+def iter_json_empty():
+    """ An object without pairs """
+    yield from ()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+""" Tests for kodiutils """
+
+import unittest
+
+from resources.lib import kodiutils
+
+
+class TestKodiUtils(unittest.TestCase):
+    """ Tests for kodiutils """
+
+    def test_html_to_kodi(self):
+        """ Test converting HTML into Kodi formatted text """
+        self.assertEqual(kodiutils.html_to_kodi(None), None)
+        self.assertEqual(kodiutils.html_to_kodi(''), '')
+        self.assertEqual(kodiutils.html_to_kodi('<p>Een <b>vette</b> en <i class="x">schuine</i> tekst</p>'), 'Een [B]vette[/B] en [I]schuine[/I] tekst')
+        self.assertEqual(kodiutils.html_to_kodi('<h2>Titel</h2><em>nadruk</em>'), '[B]Titel[/B][I]nadruk[/I]')
+        self.assertEqual(kodiutils.html_to_kodi('<ul><li>een</li><li>twee</li></ul>'), '- een\n- twee')
+        self.assertEqual(kodiutils.html_to_kodi('regel<br />regel'), 'regel\nregel')
+        self.assertEqual(kodiutils.html_to_kodi('a&nbsp;\n&nbsp;\nb    c &amp; d'), 'a\nb c & d')
+        self.assertEqual(kodiutils.html_to_kodi('<strong class="x">blijft</strong> <a href="#">link</a>'), '<strong class="x">blijft[/B] <a href="#">link</a>')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,7 +11,9 @@ import unittest
 import pytest
 
 from resources.lib import addon, kodiutils
-from resources.lib.service import BackgroundService
+from resources.lib.play import registry
+from resources.lib.play.content import Episode, Program, Season
+from resources.lib.service import BackgroundService, KodiPlayer
 
 routing = addon.routing
 
@@ -37,5 +39,65 @@ class TestService(unittest.TestCase):
         service.run()
 
 
+class TestKodiPlayer(unittest.TestCase):
+    """ Tests for the player of the background service """
+
+    def test_playing_video(self):
+        """ Test that we find the playing video, and the program or season it was started from """
+        player = KodiPlayer()
+        player.path = 'plugin://plugin.video.play/play/catalog/video-uuid/long_form'
+        self.assertEqual(player.get_playing_video(), ('video-uuid', 'long_form'))
+        player.path = 'plugin://plugin.video.play/play/catalog/video-uuid'
+        self.assertEqual(player.get_playing_video(), ('video-uuid', 'video'))
+        player.path = 'plugin://plugin.video.play/play/page/some-page'
+        self.assertEqual(player.get_playing_video(), (None, None))
+
+        player.listing = 'plugin://plugin.video.play/catalog/season/season-uuid'
+        self.assertEqual(player.get_playing_listing(), ('season', 'season-uuid'))
+        player.listing = 'plugin://plugin.video.play/catalog/program-uuid'
+        self.assertEqual(player.get_playing_listing(), ('program', 'program-uuid'))
+        for listing in ('plugin://plugin.video.play/catalog/new', 'plugin://plugin.video.play/channels/play4/catalog',
+                        'plugin://plugin.video.other/catalog/season/season-uuid', '', None):
+            player.listing = listing
+            self.assertEqual(player.get_playing_listing(), (None, None))
+
+    def test_prefetch_stream(self):
+        """ Test that we prepare the stream of the episode that follows the playing one """
+        class FakeContentApi:
+            """ A ContentApi with a program of two seasons """
+            streams = []
+
+            @staticmethod
+            def get_program(uuid):  # pylint: disable=unused-argument
+                """ Return the program """
+                return Program(uuid='program', seasons={0: Season(uuid='season1'), 1: Season(uuid='season2')})
+
+            @staticmethod
+            def get_episodes(playlist_uuid, lazy=False):  # pylint: disable=unused-argument
+                """ Return the episodes of a season """
+                return [Episode(uuid='%s-%d' % (playlist_uuid, number), content_type='long_form') for number in (1, 2)]
+
+            @classmethod
+            def get_stream(cls, uuid, content_type):
+                """ Remember the stream we resolve """
+                cls.streams.append((uuid, content_type))
+
+        get_content_api = registry.get_content_api
+        registry.get_content_api = FakeContentApi
+        self.addCleanup(setattr, registry, 'get_content_api', get_content_api)
+
+        KodiPlayer._prefetch_stream('season1-1', 'season', 'season1')  # pylint: disable=protected-access
+        self.assertEqual(FakeContentApi.streams, [('season1-2', 'long_form')])
+
+        # The next episode of a program can be in the next season
+        KodiPlayer._prefetch_stream('season1-2', 'program', 'program')  # pylint: disable=protected-access
+        self.assertEqual(FakeContentApi.streams[-1], ('season2-1', 'long_form'))
+
+        # There is nothing to prepare after the last episode, or for a video that isn't in the season
+        KodiPlayer._prefetch_stream('season2-2', 'program', 'program')  # pylint: disable=protected-access
+        KodiPlayer._prefetch_stream('season2-1', 'season', 'season1')  # pylint: disable=protected-access
+        self.assertEqual(len(FakeContentApi.streams), 2)
+
+
 if __name__ == '__main__':
     unittest.main()